@@ -0,0 +1,23 @@
+import click
+from flask.cli import with_appcontext
+
+import app.packages.eviction
+from app.config import Config
+
+
+@click.command("evict")
+@click.option("--dry-run", is_flag=True, help="Show what would be evicted, without deleting anything.")
+@with_appcontext
+def evict_command(dry_run: bool) -> None:
+    """
+    Delete rarely used files until storage is under the configured quota
+    """
+    config = Config.storage.eviction
+    if config.quota_megabytes is None:
+        raise click.ClickException("storage.eviction.quota_megabytes is not configured")
+
+    evicted = app.packages.eviction.enforce_quota(config.quota_megabytes, config.min_idle_hours, dry_run=dry_run)
+
+    freed = sum(stored_file.size for stored_file in evicted)
+    action = "Would evict" if dry_run else "Evicted"
+    click.echo(f"{action} {len(evicted)} files, freeing {freed} bytes")
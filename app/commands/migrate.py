@@ -0,0 +1,15 @@
+import click
+from flask.cli import with_appcontext
+
+import app.models.migrations
+from app.models.database import db
+
+
+@click.command("drop-hash-tables")
+@with_appcontext
+def drop_hash_tables_command() -> None:
+    """
+    Drop the tables hashes used to be kept in. Run this once every process has been upgraded.
+    """
+    dropped = app.models.migrations.drop_hash_tables(db.engine)
+    click.echo(f"Dropped {', '.join(dropped)}" if dropped else "Nothing to drop")
@@ -0,0 +1,22 @@
+import click
+from flask.cli import with_appcontext
+
+import app.data.sql
+
+
+@click.command("offline")
+@click.argument("repository_slug")
+@click.argument("state", type=click.Choice(["on", "off"]))
+@with_appcontext
+def offline_command(repository_slug: str, state: str) -> None:
+    """
+    Take a repository offline, so it is served only from the database and storage, or back online.
+    Applies to every running process, and survives restarts until the offline setting in the config changes.
+    """
+    repository = app.data.sql.get_repository(repository_slug)
+    if repository is None:
+        raise click.ClickException(f"Repository {repository_slug} not found")
+
+    repository.is_offline = state == "on"
+    app.data.sql.save()
+    click.echo(f"Repository {repository_slug} is {'offline' if repository.is_offline else 'online'}")
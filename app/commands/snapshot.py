@@ -0,0 +1,63 @@
+from typing import IO
+
+import click
+import flask
+from flask.cli import with_appcontext
+
+import app.packages.snapshot
+from app.constants import WARMUP_CONCURRENCY
+
+
+@click.group("snapshot")
+def snapshot_group() -> None:
+    """
+    Copy the mirror to another node
+    """
+
+
+@snapshot_group.command("export")
+@click.argument("output", type=click.File("wb"))
+@click.option("--with-files", is_flag=True, help="Include every stored file, not just the database.")
+@click.option(
+    "--concurrency", default=WARMUP_CONCURRENCY, show_default=True, help="Number of files to read from storage at once."
+)
+@with_appcontext
+def export_command(output: IO[bytes], with_files: bool, concurrency: int) -> None:
+    """
+    Write a snapshot to OUTPUT, or - for stdout
+    """
+    flask_app = flask.current_app._get_current_object()  # type: ignore[attr-defined]
+    report = app.packages.snapshot.export_snapshot(flask_app, output, with_files, concurrency)
+
+    click.echo(
+        f"Exported {report.rows} rows and {report.files} files ({report.file_bytes} bytes) "
+        f"in {report.elapsed_seconds:.1f} seconds",
+        err=True,
+    )
+    if report.failed_files:
+        raise click.ClickException(f"{len(report.failed_files)} files could not be read from storage")
+
+
+@snapshot_group.command("import")
+@click.argument("source", type=click.File("rb"))
+@click.option(
+    "--shared-storage",
+    is_flag=True,
+    help="Storage is shared with the exporting node, so files the snapshot marks as cached are already there.",
+)
+@click.option("--concurrency", default=WARMUP_CONCURRENCY, show_default=True, help="Number of files to store at once.")
+@with_appcontext
+def import_command(source: IO[bytes], shared_storage: bool, concurrency: int) -> None:
+    """
+    Load a snapshot from SOURCE, or - for stdin
+    """
+    flask_app = flask.current_app._get_current_object()  # type: ignore[attr-defined]
+    report = app.packages.snapshot.import_snapshot(flask_app, source, shared_storage, concurrency)
+
+    click.echo(
+        f"Imported {report.rows} rows ({report.skipped_rows} already here or not configured) "
+        f"and {report.files} files ({report.file_bytes} bytes, {report.skipped_files} already here) "
+        f"in {report.elapsed_seconds:.1f} seconds"
+    )
+    if report.failed_files:
+        raise click.ClickException(f"{len(report.failed_files)} files could not be stored")
@@ -0,0 +1,66 @@
+import click
+import flask
+from flask.cli import with_appcontext
+
+import app.packages.sync
+from app.config import Config
+from app.constants import WARMUP_CONCURRENCY
+
+
+@click.command("sync")
+@click.option(
+    "--repository",
+    "repository_slugs",
+    multiple=True,
+    help="Repository to sync. Can be given multiple times. Defaults to every repository with sync configured.",
+)
+@click.option(
+    "--checkpoint",
+    "checkpoint_path",
+    default="mypypi2-sync.checkpoint",
+    show_default=True,
+    type=click.Path(dir_okay=False),
+    help="File to record progress in, so an interrupted sync can resume.",
+)
+@click.option("--restart", is_flag=True, help="Ignore any progress from an interrupted sync.")
+@click.option(
+    "--concurrency",
+    default=WARMUP_CONCURRENCY,
+    show_default=True,
+    help="Number of packages and files to fetch at once.",
+)
+@with_appcontext
+def sync_command(repository_slugs: tuple[str, ...], checkpoint_path: str, restart: bool, concurrency: int) -> None:
+    """
+    Mirror every file of the packages configured with sync_packages or sync_pattern
+    """
+    repository_configs = [
+        repository_config
+        for repository_config in Config.repositories
+        if repository_config.is_synced and (not repository_slugs or repository_config.slug in repository_slugs)
+    ]
+    if not repository_configs:
+        raise click.ClickException("No repositories have sync_packages or sync_pattern configured")
+
+    checkpoint = app.packages.sync.Checkpoint(checkpoint_path)
+    if restart:
+        checkpoint.clear()
+        checkpoint = app.packages.sync.Checkpoint(checkpoint_path)
+    elif checkpoint.done:
+        click.echo(f"Resuming, {len(checkpoint.done)} packages already synced")
+
+    def progress(key: str) -> None:
+        click.echo(f"Synced {key}")
+
+    flask_app = flask.current_app._get_current_object()  # type: ignore[attr-defined]
+    report = app.packages.sync.sync(flask_app, repository_configs, checkpoint, concurrency, progress=progress)
+
+    click.echo(
+        f"Synced {report.packages} packages ({report.unchanged} unchanged, {report.resumed} resumed), "
+        f"downloaded {report.downloaded} files ({report.downloaded_bytes} bytes), {report.queued} queued "
+        f"in {report.elapsed_seconds:.1f} seconds"
+    )
+    if report.failed:
+        raise click.ClickException(f"{len(report.failed)} packages failed to sync: {', '.join(report.failed)}")
+
+    checkpoint.clear()
@@ -0,0 +1,47 @@
+import click
+import flask
+from flask.cli import with_appcontext
+
+import app.packages.warmup
+from app.config import Config
+from app.constants import WARMUP_CONCURRENCY
+
+
+@click.command("warmup")
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--repository",
+    "repository_slugs",
+    multiple=True,
+    help="Repository to warm. Can be given multiple times. Defaults to every repository.",
+)
+@click.option(
+    "--concurrency", default=WARMUP_CONCURRENCY, show_default=True, help="Number of files to download at once."
+)
+@click.option("--rate", default=0.0, show_default=True, help="Most downloads to start per second, 0 for no limit.")
+@with_appcontext
+def warmup_command(paths: tuple[str, ...], repository_slugs: tuple[str, ...], concurrency: int, rate: float) -> None:
+    """
+    Download every file in uv.lock, pylock.toml, or requirements files to storage
+    """
+    pins = [pin for path in paths for pin in app.packages.warmup.parse_file(path)]
+    slugs = list(repository_slugs) or [repository.slug for repository in Config.repositories]
+    click.echo(f"Warming {len(pins)} packages in {', '.join(slugs)}")
+
+    def progress(done: int, total: int, filename: str) -> None:
+        click.echo(f"[{done}/{total}] {filename}")
+
+    flask_app = flask.current_app._get_current_object()  # type: ignore[attr-defined]
+    report = app.packages.warmup.warm(flask_app, slugs, pins, concurrency, rate, progress=progress)
+
+    click.echo(
+        f"Downloaded {report.downloaded} files ({report.downloaded_bytes} bytes), "
+        f"{report.already_cached} already cached, {report.queued} queued, "
+        f"{len(report.failed)} failed in {report.elapsed_seconds:.1f} seconds"
+    )
+    for name in report.not_found:
+        click.echo(f"Nothing to download for {name}")
+    for failure in report.failed:
+        click.echo(f"Failed to download {failure}")
+    if report.failed:
+        raise click.ClickException(f"{len(report.failed)} files failed to download")
@@ -0,0 +1,31 @@
+import multiprocessing
+
+import click
+import flask
+from flask.cli import with_appcontext
+
+import app.packages.jobs
+from app.models.database import db
+
+
+@click.command("download-worker")
+@click.option("--processes", default=1, show_default=True, help="Number of worker processes to run.")
+@with_appcontext
+def download_worker_command(processes: int) -> None:
+    """
+    Download queued files to storage, until stopped
+    """
+    flask_app = flask.current_app._get_current_object()  # type: ignore[attr-defined]
+    if processes == 1:
+        app.packages.jobs.work(flask_app)
+        return
+
+    # forked processes can't share pooled connections
+    for engine in db.engines.values():
+        engine.dispose()
+    context = multiprocessing.get_context("fork")
+    children = [context.Process(target=app.packages.jobs.work, args=(flask_app,)) for _ in range(processes)]
+    for child in children:
+        child.start()
+    for child in children:
+        child.join()
@@ -1,4 +1,5 @@
 import os
+import re
 from enum import Enum
 from http import HTTPStatus
 from typing import Literal, Self, Type
@@ -20,6 +21,13 @@ import app.constants
 class StorageDrivers(Enum):
     FILESYSTEM = "filesystem"
     S3 = "s3"
+    TIERED = "tiered"
+
+
+class StorageFilesystemOffload(Enum):
+    NONE = "none"
+    X_ACCEL_REDIRECT = "x-accel-redirect"
+    X_SENDFILE = "x-sendfile"
 
 
 class CacheDrivers(Enum):
@@ -32,9 +40,16 @@ class CacheDrivers(Enum):
 
 class RepositoryConfig(BaseModel):
     slug: str
-    simple_url: HttpUrl
+    simple_url: HttpUrl | None = None
+    mirror_urls: list[HttpUrl] = []
+    members: list[str] = []
     cache_minutes: int = 10
     timeout_seconds: int = 10
+    synthesize_metadata: bool = False
+    prefetch_metadata_versions: int = 0
+    offline: bool = False
+    sync_packages: list[str] = []
+    sync_pattern: str | None = None
 
     @field_validator("slug")
     def slug_must_be_alphanumeric_lowercase(cls, v: str) -> str:
@@ -42,9 +57,54 @@ class RepositoryConfig(BaseModel):
             raise ValueError("slug must be alphanumeric")
         return v.lower()
 
+    @field_validator("sync_pattern")
+    def sync_pattern_must_compile(cls, v: str | None) -> str | None:
+        if v is not None:
+            try:
+                re.compile(v)
+            except re.error as e:
+                raise ValueError(f"sync_pattern is not a valid regular expression: {e}")
+        return v
+
+    @field_validator("members")
+    def members_lowercase(cls, v: list[str]) -> list[str]:
+        return [member.lower() for member in v]
+
+    @model_validator(mode="after")
+    def must_be_upstream_or_virtual(self) -> Self:
+        """
+        A repository either has an upstream URL, or is a virtual repository of members
+        """
+        if self.simple_url is None and not self.members:
+            raise ValueError("simple_url or members must be provided")
+        if self.simple_url is not None and self.members:
+            raise ValueError("simple_url and members cannot both be provided")
+        if self.mirror_urls and self.members:
+            raise ValueError("mirror_urls cannot be provided for a virtual repository")
+        if (self.sync_packages or self.sync_pattern) and self.members:
+            raise ValueError("a virtual repository cannot be synced, sync its members instead")
+        return self
+
+    @property
+    def is_synced(self) -> bool:
+        return bool(self.sync_packages or self.sync_pattern)
+
+    @property
+    def is_virtual(self) -> bool:
+        return bool(self.members)
+
 
 class DatabaseConfig(BaseModel):
     url: str
+    replica_urls: list[str] = []
+    replica_max_lag_seconds: float = 5
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout_seconds: int = 30
+    pool_recycle_seconds: int = 1800
+    pool_pre_ping: bool = True
+    statement_timeout_seconds: float | None = None
+    pgbouncer: bool = False
 
     @field_validator("url")
     def url_prefix(cls, v: str) -> str:
@@ -58,9 +118,43 @@ class DatabaseConfig(BaseModel):
 
         return v
 
+    @field_validator("replica_urls")
+    def replica_url_prefix(cls, v: list[str]) -> list[str]:
+        """
+        Replicas must be sqlite or postgres, like the primary
+        """
+        for url in v:
+            if not url.startswith(("postgresql://", "sqlite://")):
+                raise ValueError("Database replicas must be PostgreSQL or SQLite")
+        return v
+
 
 class StorageFilesystemConfig(BaseModel):
     directory: str
+    offload: StorageFilesystemOffload = StorageFilesystemOffload.NONE
+    offload_prefix: str = "/protected/"
+
+    @field_validator("offload_prefix")
+    def offload_prefix_trailing_slash(cls, v: str) -> str:
+        """
+        Make sure the prefix can have a path appended to it
+        """
+        return f"{v.rstrip('/')}/"
+
+
+class StorageS3MultipartConfig(BaseModel):
+    part_size_megabytes: int = 16
+    concurrency: int = 4
+    checksums: bool = True
+
+    @field_validator("part_size_megabytes")
+    def part_size_minimum(cls, v: int) -> int:
+        """
+        S3 multipart uploads require parts of at least 5MB, other than the last
+        """
+        if v < 5:
+            raise ValueError("part_size_megabytes must be at least 5")
+        return v
 
 
 class StorageS3Config(BaseModel):
@@ -77,6 +171,7 @@ class StorageS3Config(BaseModel):
         HTTPStatus.TEMPORARY_REDIRECT,
         HTTPStatus.PERMANENT_REDIRECT,
     ] = HTTPStatus.PERMANENT_REDIRECT
+    multipart: StorageS3MultipartConfig = StorageS3MultipartConfig()
 
     @field_validator("redirect_code", mode="before")
     @classmethod
@@ -88,10 +183,50 @@ class StorageS3Config(BaseModel):
         return HTTPStatus(int(v))
 
 
+class StorageTieredConfig(BaseModel):
+    directory: str
+    max_megabytes: int = 10240
+
+
+class StorageSegmentedDownloadConfig(BaseModel):
+    enabled: bool = False
+    threshold_megabytes: int = 100
+    part_size_megabytes: int = 16
+    concurrency: int = 8
+    retries: int = 3
+
+    @field_validator("part_size_megabytes")
+    def part_size_minimum(cls, v: int) -> int:
+        """
+        S3 multipart uploads require parts of at least 5MB, other than the last
+        """
+        if v < 5:
+            raise ValueError("part_size_megabytes must be at least 5")
+        return v
+
+
+class StorageEvictionConfig(BaseModel):
+    quota_megabytes: int | None = None
+    min_idle_hours: int = 24
+
+
+class StorageDownloadQueueConfig(BaseModel):
+    enabled: bool = False
+    wait_seconds: int = 30
+    max_attempts: int = 5
+    backoff_seconds: int = 10
+    stale_seconds: int = 60
+
+
 class StorageConfig(BaseModel):
     driver: StorageDrivers
     s3: StorageS3Config | None = None
     filesystem: StorageFilesystemConfig | None = None
+    tiered: StorageTieredConfig | None = None
+    segmented_download: StorageSegmentedDownloadConfig = StorageSegmentedDownloadConfig()
+    eviction: StorageEvictionConfig = StorageEvictionConfig()
+    download_queue: StorageDownloadQueueConfig = StorageDownloadQueueConfig()
+    existence_index: bool = True
 
     @model_validator(mode="after")
     def must_contain_driver_config(self) -> Self:
@@ -99,6 +234,8 @@ class StorageConfig(BaseModel):
             raise ValueError("S3 config must be provided when using S3 driver")
         if self.driver == StorageDrivers.FILESYSTEM and self.filesystem is None:
             raise ValueError("filesystem config must be provided when using filesystem driver")
+        if self.driver == StorageDrivers.TIERED and (self.s3 is None or self.tiered is None):
+            raise ValueError("S3 and tiered config must be provided when using tiered driver")
         return self
 
 
@@ -119,6 +256,7 @@ class CacheMemcachedConfig(BaseModel):
 
 class CacheConfig(BaseModel):
     driver: CacheDrivers = CacheDrivers.MEMORY
+    inline_metadata_kilobytes: int = 64
     filesystem: CacheFilesystemConfig | None = None
     redis: CacheRedisConfig | None = None
     memcached: CacheMemcachedConfig | None = None
@@ -149,6 +287,18 @@ class _Config(BaseSettings):
     storage: StorageConfig
     cache: CacheConfig
 
+    @model_validator(mode="after")
+    def members_must_be_upstream_repositories(self) -> Self:
+        """
+        Virtual repositories can only contain repositories with an upstream URL
+        """
+        upstream_slugs = {repository.slug for repository in self.repositories if not repository.is_virtual}
+        for repository in self.repositories:
+            for member in repository.members:
+                if member not in upstream_slugs:
+                    raise ValueError(f"member {member} of {repository.slug} must be a non-virtual repository")
+        return self
+
     @classmethod
     def settings_customise_sources(
         cls,
@@ -5,6 +5,13 @@ METADATA_EXTENSION = ".metadata"
 
 # 1MB chunks
 DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# suffixes for in-progress downloads, and the record of how much has been written
+PARTIAL_EXTENSION = ".partial"
+PROGRESS_EXTENSION = ".progress"
+# held while downloading a file, so workers downloading the same file take turns
+LOCK_EXTENSION = ".lock"
+# hash used to build content-addressed storage paths
+CONTENT_ADDRESS_HASH = "sha256"
 
 # keys
 DATA_PREFIX = "data-"
@@ -17,14 +24,93 @@ METADATA_KEY = "core-metadata"
 # HTTP headers
 ACCEPT_HEADER = "Accept"
 CONTENT_TYPE_HEADER = "Content-Type"
+ETAG_HEADER = "ETag"
+IF_NONE_MATCH_HEADER = "If-None-Match"
+# PyPI's change serial for a project, sent with each project page
+LAST_SERIAL_HEADER = "X-PyPI-Last-Serial"
 CONTENT_TYPE_HEADER_HTML = "text/html"
 CONTENT_TYPE_HEADER_JSON = "application/json"
 
 # number constants
 MINUTES_TO_SECONDS = 60
+KILOBYTES_TO_BYTES = 1024
+MEGABYTES_TO_BYTES = 1024 * 1024
 
 # filesystem
 ASSETS_DIRECTORY = os.path.join(os.path.dirname(__file__), "assets")
 
+# background metadata prefetching
+# how many metadata files are fetched at once, across all packages
+METADATA_PREFETCH_WORKERS = 4
+
+# access tracking
+# how often each process writes recorded downloads to the database
+ACCESS_FLUSH_SECONDS = 30
+
+# download queue
+# how often a waiting request checks on its download job
+DOWNLOAD_JOB_POLL_SECONDS = 0.5
+# how often an idle download worker looks for new jobs
+DOWNLOAD_WORKER_IDLE_SECONDS = 1
+# how often a download worker reports progress on its job
+DOWNLOAD_JOB_HEARTBEAT_SECONDS = 5
+# what clients are told when a download is still pending
+DOWNLOAD_RETRY_AFTER_SECONDS = 5
+# how long a download that was given up on keeps failing, before a request for it queues it again
+DOWNLOAD_FAILED_COOLDOWN_SECONDS = 5 * 60
+
+# cache warmup
+# how many packages are resolved and files downloaded at once, by default
+WARMUP_CONCURRENCY = 8
+
+# snapshots
+# rows per batch, when writing tables to a snapshot and loading them back
+SNAPSHOT_BATCH_ROWS = 1000
+
+# database replicas
+# how often each process checks how far behind its replicas are
+REPLICA_LAG_CHECK_SECONDS = 5
+
+# page cache
+# how long a package's generation token is kept. Must outlast the pages cached under it
+PAGE_GENERATION_TTL_SECONDS = 24 * 60 * 60
+
+# tiered storage
+# how often each process walks the local directory to check its size, as other processes write to it too
+TIERED_USAGE_SCAN_SECONDS = 5 * 60
+
+# cache drivers
+# how many keys the memory driver keeps before dropping the least recently used.
+# Values without a TTL count, as do the expirations kept alongside values
+MEMORY_CACHE_MAX_KEYS = 10_000
+# how many bytes of string and bytes values the memory driver keeps, such as pages and inline files,
+# before dropping the least recently used
+MEMORY_CACHE_MAX_BYTES = 64 * MEGABYTES_TO_BYTES
+# how long small files are kept inline. Content addressed, so this only bounds memory
+INLINE_CONTENT_TTL_SECONDS = 24 * 60 * 60
+
 # patched by pytest
 IS_TESTING: bool = False
+
+# hedged requests to upstream mirrors
+# how many recent response times to remember per upstream host
+HEDGE_LATENCY_SAMPLES = 100
+# don't trust a percentile until we have this many samples
+HEDGE_MIN_SAMPLES = 10
+# how long to wait before hedging when we don't have enough samples
+HEDGE_DEFAULT_DELAY_SECONDS = 1.0
+# hedge once an upstream is slower than this percentage of its recent responses
+HEDGE_LATENCY_PERCENTILE = 95
+# how long a failed upstream is sorted last for
+HEDGE_FAILURE_COOLDOWN_SECONDS = 60
+
+# file downloads from upstream
+# how long to wait to connect, and then for each chunk of data.
+# There is no limit on the whole download, as large files take a while
+DOWNLOAD_CONNECT_TIMEOUT_SECONDS = 10
+DOWNLOAD_READ_TIMEOUT_SECONDS = 60
+
+# segmented downloads
+# how many parts past the earliest unfinished one may be downloaded, per connection.
+# Finished parts are held in memory until every earlier part is done
+SEGMENTED_DOWNLOAD_WINDOW_FACTOR = 2
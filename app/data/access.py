@@ -0,0 +1,124 @@
+"""
+Record file downloads in memory and write them to the database in batches,
+rather than committing once per download
+"""
+
+from __future__ import annotations
+
+import atexit
+import datetime
+import os
+import threading
+import time
+from typing import TYPE_CHECKING
+
+import flask
+from loguru import logger
+from sqlalchemy import bindparam, select, update
+
+from app.constants import ACCESS_FLUSH_SECONDS, METADATA_EXTENSION
+from app.models.code_file import CodeFile
+from app.models.database import db
+from app.models.metadata_file import MetadataFile
+from app.models.package import Package
+from app.models.repository import Repository
+
+if TYPE_CHECKING:
+    from sqlalchemy import Update  # pragma: no cover
+
+    from app.models.package_file import PackageFile  # pragma: no cover
+
+# (repository slug, package name, filename) to (download count, last download)
+_pending: dict[tuple[str, str, str], tuple[int, datetime.datetime]] = {}
+_pending_lock = threading.Lock()
+# the process the flush thread was started in, as threads don't survive a fork
+_flusher_pid: int | None = None
+
+
+def record(repository_slug: str, package_name: str, filename: str) -> None:
+    """
+    Record a download of a file. Must be called within a request.
+    """
+    global _flusher_pid
+
+    key = (repository_slug, package_name, filename)
+    with _pending_lock:
+        count, _ = _pending.get(key, (0, None))
+        _pending[key] = (count + 1, datetime.datetime.now())
+
+        if _flusher_pid != os.getpid():
+            _flusher_pid = os.getpid()
+            flask_app = flask.current_app._get_current_object()  # type: ignore[attr-defined]
+            threading.Thread(target=_flush_forever, args=(flask_app,), name="access-flush", daemon=True).start()
+            # don't lose the last few downloads on a clean shutdown
+            atexit.register(_flush_in_context, flask_app)
+
+
+def _update_statement(model: type[PackageFile]) -> Update:
+    """
+    Build a statement that adds to the access count of a file, looked up by repository, package, and filename
+    """
+    table = model.__table__
+    package_id = (
+        select(Package.id)
+        .join(Package.repository)
+        .where(Repository.slug == bindparam("b_repository_slug"), Package.name == bindparam("b_package_name"))
+        .scalar_subquery()
+    )
+    return (
+        update(table)
+        .where(table.c.filename == bindparam("b_filename"), table.c.package_id == package_id)
+        .values(access_count=table.c.access_count + bindparam("b_count"), last_accessed=bindparam("b_last_accessed"))
+    )
+
+
+def flush() -> None:
+    """
+    Write every recorded download to the database in a single transaction
+    """
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+
+    if not pending:
+        return
+
+    rows: dict[type[PackageFile], list[dict]] = {CodeFile: [], MetadataFile: []}
+    for (repository_slug, package_name, filename), (count, last_accessed) in pending.items():
+        model = MetadataFile if filename.endswith(METADATA_EXTENSION) else CodeFile
+        rows[model].append(
+            {
+                "b_repository_slug": repository_slug,
+                "b_package_name": package_name,
+                "b_filename": filename,
+                "b_count": count,
+                "b_last_accessed": last_accessed,
+            }
+        )
+
+    for model, model_rows in rows.items():
+        if model_rows:
+            db.session.execute(_update_statement(model), model_rows)
+
+    db.session.commit()
+    logger.debug(f"Recorded downloads of {len(pending)} files")
+
+
+def _flush_in_context(flask_app: flask.Flask) -> None:
+    """
+    Flush outside of a request. Failures are logged, as the counts are only a hint for eviction.
+    """
+    try:
+        with flask_app.app_context():
+            flush()
+    except Exception as e:
+        logger.warning(f"Unable to record file downloads: {e}")
+
+
+def _flush_forever(flask_app: flask.Flask) -> None:
+    """
+    Periodically flush recorded downloads, for the life of the process
+    """
+    while True:
+        time.sleep(ACCESS_FLUSH_SECONDS)
+        _flush_in_context(flask_app)
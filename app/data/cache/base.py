@@ -40,39 +40,116 @@ class BaseCache(abc.ABC):
         """
         ...
 
+    def _get_many(self, keys: list[str]) -> dict[str, Any]:
+        """
+        Get many cache values. Keys that do not exist are left out.
+        Implementations that can should override this to make a single round trip.
+        """
+        values = {}
+        for key in keys:
+            value = self._get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def _set_many(self, values: dict[str, Any], ttl: int | None = None) -> None:
+        """
+        Set many cache values.
+        Implementations that can should override this to make a single round trip.
+        """
+        for key, value in values.items():
+            self._set(key, value, ttl=ttl)
+
+    def _delete_many(self, keys: list[str]) -> None:
+        """
+        Delete many cache keys.
+        Implementations that can should override this to make a single round trip.
+        """
+        for key in keys:
+            self._delete(key)
+
+    def _expiration_key(self, key: str) -> str:
+        return f"{key}{self.EXPIRATION_SUFFIX}"
+
     def set(self, key: str, value: Any, ttl: int | None) -> None:
         """
         Set a cache value, with a TTL in seconds
         """
-        self._set(key, value, ttl=ttl)
+        self.set_many({key: value}, ttl=ttl)
 
-        if not self._supports_ttl:
-            if ttl is not None:
-                expiration = datetime.datetime.now() + datetime.timedelta(seconds=ttl)
-                expiration_value = expiration.isoformat()
-            else:
-                expiration_value = NEVER
+    def set_many(self, values: dict[str, Any], ttl: int | None) -> None:
+        """
+        Set many cache values, with the same TTL in seconds
+        """
+        if not values:
+            return
 
-            self._set(f"{key}{self.EXPIRATION_SUFFIX}", expiration_value)
+        if self._supports_ttl:
+            self._set_many(values, ttl=ttl)
+            return
+
+        if ttl is not None:
+            expiration = datetime.datetime.now() + datetime.timedelta(seconds=ttl)
+            expiration_value = expiration.isoformat()
+        else:
+            expiration_value = NEVER
+
+        # values and their expirations are set together
+        self._set_many({**values, **{self._expiration_key(key): expiration_value for key in values}})
 
     def get(self, key: str) -> Any | None:
         """
         Get a cache value, or None if it does not exist or is expired
         """
-        if not self._supports_ttl:
-            expiration = self._get(f"{key}{self.EXPIRATION_SUFFIX}")
+        return self.get_many([key]).get(key)
 
-            if expiration == NEVER:
-                # skip to end
-                pass
+    def get_many(self, keys: list[str]) -> dict[str, Any]:
+        """
+        Get many cache values. Keys that do not exist or are expired are left out.
+        """
+        if not keys:
+            return {}
+
+        if self._supports_ttl:
+            return self._get_many(keys)
+
+        # values and their expirations are fetched together
+        found = self._get_many([*keys, *(self._expiration_key(key) for key in keys)])
 
-            elif expiration is None:
+        values = {}
+        expired = []
+        now = datetime.datetime.now()
+        for key in keys:
+            expiration = found.get(self._expiration_key(key))
+
+            if expiration is None:
                 # somehow expiration key is lost
-                return None
+                continue
+
+            if expiration != NEVER and datetime.datetime.fromisoformat(expiration) < now:
+                expired.append(key)
+                continue
 
-            elif datetime.datetime.fromisoformat(expiration) < datetime.datetime.now():
-                self._delete(key)
-                self._delete(f"{key}{self.EXPIRATION_SUFFIX}")
-                return None
+            if key in found:
+                values[key] = found[key]
 
-        return self._get(key)
+        if expired:
+            self.delete_many(expired)
+        return values
+
+    def delete(self, key: str) -> None:
+        """
+        Delete a cache key
+        """
+        self.delete_many([key])
+
+    def delete_many(self, keys: list[str]) -> None:
+        """
+        Delete many cache keys
+        """
+        if not keys:
+            return
+
+        if not self._supports_ttl:
+            keys = [*keys, *(self._expiration_key(key) for key in keys)]
+        self._delete_many(keys)
@@ -4,7 +4,6 @@ from typing import Any
 
 import app.data.sql
 from app.data.cache.base import BaseCache
-from app.models.cache import Cache
 
 
 class DatabaseCache(BaseCache):
@@ -12,35 +11,53 @@ class DatabaseCache(BaseCache):
     def _supports_ttl(self) -> bool:
         return True
 
-    def _set(self, key: str, value: Any, ttl: int) -> None:
+    def _set(self, key: str, value: Any, ttl: int | None) -> None:
         """
-        Set a cache value
+        Set a cache value, replacing any existing value
         """
-        cache = Cache(
-            key=key, value=pickle.dumps(value), expiration=datetime.datetime.now() + datetime.timedelta(seconds=ttl)
-        )
-        app.data.sql.session_save(cache)
+        self._set_many({key: value}, ttl=ttl)
 
     def _get(self, key: str) -> Any | None:
         """
         Get a cache value. Returnm None if the key does not exist
         """
-        cache = app.data.sql.get_cache(key)
-        if cache is None:
-            return None
-
-        if cache.is_expired:
-            self._delete(key)
-            return None
-
-        return pickle.loads(cache.value)
+        return self._get_many([key]).get(key)
 
     def _delete(self, key: str) -> None:
         """
         Delete a cache key
         """
-        cache = app.data.sql.get_cache(key)
-        if cache is None:
-            return
+        self._delete_many([key])
+
+    def _get_many(self, keys: list[str]) -> dict[str, Any]:
+        """
+        Get many cache values with a single query
+        """
+        values = {}
+        expired = []
+        for cache in app.data.sql.get_caches(keys):
+            if cache.is_expired:
+                expired.append(cache.key)
+            else:
+                values[cache.key] = pickle.loads(cache.value)
+
+        if expired:
+            self._delete_many(expired)
+        return values
+
+    def _set_many(self, values: dict[str, Any], ttl: int | None = None) -> None:
+        """
+        Set many cache values, replacing any existing values, with a single statement and commit
+        """
+        if ttl is None:
+            expiration = datetime.datetime.max
+        else:
+            expiration = datetime.datetime.now() + datetime.timedelta(seconds=ttl)
+
+        app.data.sql.set_caches({key: pickle.dumps(value) for key, value in values.items()}, expiration)
 
-        app.data.sql.session_delete(cache)
+    def _delete_many(self, keys: list[str]) -> None:
+        """
+        Delete many cache keys with a single statement
+        """
+        app.data.sql.delete_caches(keys)
@@ -0,0 +1,42 @@
+"""
+Keep a generation token per package, which is part of the cache key of each of its pages.
+Changing the token orphans every cached page of the package with a single write,
+and the orphaned pages expire on their own.
+The token is only shared between processes through a shared cache driver. With the memory driver,
+a bump only reaches the process that made it, and other processes serve their cached pages until they expire.
+"""
+
+from __future__ import annotations
+
+import uuid
+
+from app.constants import PAGE_GENERATION_TTL_SECONDS
+from app.data.cache.active import CacheDriver
+
+GENERATION_PREFIX = "generation-"
+
+
+def _key(repository_slug: str, package_name: str) -> str:
+    return f"{GENERATION_PREFIX}{repository_slug}-{package_name}"
+
+
+def bump(repository_slug: str, package_name: str) -> str:
+    """
+    Give a package a new generation token, invalidating its cached pages.
+    Must be called after the change is committed, or a page could be cached from the old data
+    under the new token.
+    """
+    generation = uuid.uuid4().hex
+    CacheDriver.set(_key(repository_slug, package_name), generation, ttl=PAGE_GENERATION_TTL_SECONDS)
+    return generation
+
+
+def get(repository_slug: str, package_name: str) -> str:
+    """
+    Get the generation token of a package
+    """
+    generation = CacheDriver.get(_key(repository_slug, package_name))
+    if generation is None:
+        # never set, or lost, so pages cached under an earlier token can't be trusted
+        generation = bump(repository_slug, package_name)
+    return generation
@@ -0,0 +1,84 @@
+"""
+Keep small files compressed in the cache, so they can be served without a round trip to storage.
+Values are keyed by sha256, so a file shared between repositories is only kept once.
+"""
+
+from __future__ import annotations
+
+import zlib
+from typing import TYPE_CHECKING
+
+from loguru import logger
+
+import app.data.storage.active
+from app.config import Config
+from app.constants import INLINE_CONTENT_TTL_SECONDS, KILOBYTES_TO_BYTES
+from app.data.cache.active import CacheDriver
+
+if TYPE_CHECKING:
+    from app.models.package_file import PackageFile  # pragma: no cover
+
+INLINE_PREFIX = "inline-"
+
+
+def _key(sha256: str) -> str:
+    return f"{INLINE_PREFIX}{sha256}"
+
+
+def is_enabled() -> bool:
+    """
+    Is serving files inline enabled?
+    """
+    return Config.cache.inline_metadata_kilobytes > 0
+
+
+def is_eligible(package_file: PackageFile) -> bool:
+    """
+    Is this file small enough to be kept inline?
+    Only cached files with a verified digest can be, so the ETag is always correct.
+    """
+    return (
+        package_file.sha256 is not None
+        and package_file.size is not None
+        and package_file.size <= Config.cache.inline_metadata_kilobytes * KILOBYTES_TO_BYTES
+    )
+
+
+def get_content(sha256: str) -> bytes | None:
+    """
+    Get the content of a file kept inline, or None if it isn't
+    """
+    value = CacheDriver.get(_key(sha256))
+    if value is None:
+        return None
+    return zlib.decompress(value)
+
+
+def set_content(package_file: PackageFile, content: bytes) -> None:
+    """
+    Keep the content of a file inline, if it is small enough
+    """
+    if not is_enabled() or not is_eligible(package_file):
+        return
+
+    assert package_file.sha256 is not None
+    # content addressed, so it never goes stale, but it shouldn't be kept forever
+    CacheDriver.set(_key(package_file.sha256), zlib.compress(content), ttl=INLINE_CONTENT_TTL_SECONDS)
+
+
+def load(package_file: PackageFile) -> bool:
+    """
+    Make sure a cached file is kept inline, reading it from storage if needed.
+    Returns False if the file isn't eligible.
+    """
+    if not is_enabled() or not package_file.is_cached or not is_eligible(package_file):
+        return False
+
+    assert package_file.sha256 is not None
+    if CacheDriver.get(_key(package_file.sha256)) is not None:
+        return True
+
+    logger.debug(f"Loading {package_file.filename} from storage to keep inline")
+    with app.data.storage.active.StorageDriver.open_file(package_file) as fp:
+        set_content(package_file, fp.read())
+    return True
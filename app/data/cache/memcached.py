@@ -34,3 +34,24 @@ class MemcachedCache(BaseCache):
         Delete a cache key
         """
         self._connection.delete(key)
+
+    def _get_many(self, keys: list[str]) -> dict[str, Any]:
+        """
+        Get many cache values with a single request
+        """
+        return self._connection.get_many(keys)
+
+    def _set_many(self, values: dict[str, Any], ttl: int | None = None) -> None:
+        """
+        Set many cache values, sending every request before reading any response
+        """
+        if ttl is None:
+            ttl = 0
+
+        self._connection.set_many(values, expire=ttl)
+
+    def _delete_many(self, keys: list[str]) -> None:
+        """
+        Delete many cache keys, sending every request before reading any response
+        """
+        self._connection.delete_many(keys)
@@ -1,29 +1,59 @@
+import collections
+import threading
+from typing import Any
+
+from app.constants import MEMORY_CACHE_MAX_BYTES, MEMORY_CACHE_MAX_KEYS
 from app.data.cache.base import BaseCache
 
 
+def _size(value: Any) -> int:
+    """
+    Roughly how much memory a value holds. Only strings and bytes are large enough to count.
+    """
+    return len(value) if isinstance(value, (str, bytes)) else 0
+
+
 class MemoryCache(BaseCache):
-    def __init__(self):
-        self._cache = {}
+    def __init__(self, max_keys: int = MEMORY_CACHE_MAX_KEYS, max_bytes: int = MEMORY_CACHE_MAX_BYTES):
+        # least recently used keys are dropped once there are too many, or they hold too much,
+        # as expired keys are only removed when they are read
+        self._cache: collections.OrderedDict[str, Any] = collections.OrderedDict()
+        self._max_keys = max_keys
+        self._max_bytes = max_bytes
+        self._bytes = 0
+        self._lock = threading.Lock()
 
     @property
     def _supports_ttl(self) -> bool:
         return False
 
-    def _set(self, key: str, value: str, ttl: None = None) -> None:
+    def _set(self, key: str, value: Any, ttl: None = None) -> None:
         """
         Set a cache value
         """
-        self._cache[key] = value
+        with self._lock:
+            if key in self._cache:
+                self._bytes -= _size(self._cache[key])
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            self._bytes += _size(value)
+            while len(self._cache) > self._max_keys or (self._bytes > self._max_bytes and len(self._cache) > 1):
+                _, dropped = self._cache.popitem(last=False)
+                self._bytes -= _size(dropped)
 
-    def _get(self, key: str) -> str | None:
+    def _get(self, key: str) -> Any | None:
         """
         Get a cache value. Returnm None if the key does not exist
         """
-        return self._cache.get(key, None)
+        with self._lock:
+            if key not in self._cache:
+                return None
+            self._cache.move_to_end(key)
+            return self._cache[key]
 
     def _delete(self, key: str) -> None:
         """
         Delete a cache key
         """
-        if key in self._cache:
-            del self._cache[key]
+        with self._lock:
+            self._bytes -= _size(self._cache.pop(key, None))
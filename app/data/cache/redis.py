@@ -35,3 +35,26 @@ class RedisCache(BaseCache):
         Delete a cache key
         """
         self._connection.delete(key)
+
+    def _get_many(self, keys: list[str]) -> dict[str, Any]:
+        """
+        Get many cache values with a single MGET
+        """
+        values: list[Any] = self._connection.mget(keys)  # type: ignore[assignment]
+        return {key: pickle.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    def _set_many(self, values: dict[str, Any], ttl: int | None = None) -> None:
+        """
+        Set many cache values in a single pipeline.
+        MSET can't set an expiry, so each value is its own SET.
+        """
+        pipeline = self._connection.pipeline(transaction=False)
+        for key, value in values.items():
+            pipeline.set(key, pickle.dumps(value), ex=ttl)
+        pipeline.execute()
+
+    def _delete_many(self, keys: list[str]) -> None:
+        """
+        Delete many cache keys with a single DEL
+        """
+        self._connection.delete(*keys)
@@ -3,6 +3,7 @@ from typing import Any, Callable, TypeVar
 
 from loguru import logger
 
+import app.data.cache.generation
 import app.data.sql
 from app.data.cache.active import CacheDriver
 
@@ -16,6 +17,17 @@ def _key_generator(func: Callable, **kwargs: Any) -> str:
     return "-".join((func.__qualname__, *(str(i) for (k, v) in kwargs.items() for i in (k, v))))  # ty:ignore[unresolved-attribute]
 
 
+def _package_key(func: Callable, repository_slug: str, kwargs: dict[str, Any]) -> str:
+    """
+    Generate a cache key, including the generation of the package if there is one,
+    so every cached page of a package is invalidated as soon as it changes.
+    """
+    key = _key_generator(func, **kwargs)
+    if "package_name" in kwargs:
+        key = f"{key}-{app.data.cache.generation.get(repository_slug, kwargs['package_name'])}"
+    return key
+
+
 def get_or_set(key: str, func: Callable[..., _R], ttl: int | None) -> _R:
     """
     Get a key from the cache, or set it if it does not exist.
@@ -55,7 +67,7 @@ def cache_repository_timeout_function(func: Callable[..., _R], repository_slug:
     """
 
     repository_timeout = app.data.sql.get_repository_timeout(repository_slug)
-    key = _key_generator(func, **kwargs)
+    key = _package_key(func, repository_slug, kwargs)
     return get_or_set(key, lambda: func(**kwargs), repository_timeout)
 
 
@@ -71,7 +83,7 @@ def cache_repository_timeout_decorator(func: Callable) -> Callable:
 
         # flask always passes the view function's arguments as kwargs
         # the second part of this line flattens the kwargs into a list
-        key = _key_generator(func, **kwargs)
+        key = _package_key(func, kwargs["repository_slug"], kwargs)
         return get_or_set(key, lambda: func(**kwargs), repository_timeout)
 
     return wrapper
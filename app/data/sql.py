@@ -1,6 +1,8 @@
+import datetime
 import functools
 
-from sqlalchemy import select
+from sqlalchemy import delete, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
 
 from app.constants import METADATA_EXTENSION, MINUTES_TO_SECONDS
 from app.models.cache import Cache
@@ -15,6 +17,13 @@ from app.models.metadata_file import MetadataFile
 from app.models.package import Package
 from app.models.package_file import PackageFile
 from app.models.repository import Repository
+from app.models.routing import retry_on_primary, use_primary
+
+# inserts that can replace an existing row in the same statement, by dialect
+UPSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
 
 
 def save() -> None:
@@ -24,6 +33,17 @@ def save() -> None:
     db.session.commit()
 
 
+def read_from_primary(*objs: Base) -> None:
+    """
+    Send the rest of the session to the primary, before reading something in order to change it.
+    Objects already read from a replica are reloaded from the primary when next used, as the replica may be behind.
+    """
+    if use_primary(db.session):
+        for obj in objs:
+            db.session.expire(obj)
+
+
+@retry_on_primary
 def get_repository(repository_slug: str) -> Repository | None:
     """
     Lookup a Repository object given the slug.
@@ -56,6 +76,7 @@ def get_repository_timeout(repository_slug: str) -> int:
     return repository.cache_minutes * MINUTES_TO_SECONDS
 
 
+@retry_on_primary
 def get_package(repository: Repository, package_name: str) -> Package | None:
     """
     Lookup a Package object given the Repository and package name.
@@ -77,6 +98,7 @@ def get_package_with_exception(repository: Repository, package_name: str) -> Pac
     return package
 
 
+@retry_on_primary
 def get_metadata_file(repository: Repository, package: Package, filename: str) -> MetadataFile | None:
     """
     Lookup a MetadataFile object given the Repository, Package, and filename.
@@ -97,6 +119,7 @@ def get_metadata_file(repository: Repository, package: Package, filename: str) -
     )
 
 
+@retry_on_primary
 def get_code_file(repository: Repository, package: Package, filename: str) -> CodeFile | None:
     """
     Lookup a MetadataFile object given the Repository, Package, and filename.
@@ -133,11 +156,66 @@ def get_package_file_with_exception(repository: Repository, package: Package, fi
     return package_file
 
 
-def get_cache(key: str) -> Cache | None:
+def get_storage_path_cached(storage_path: str) -> list[bool]:
+    """
+    Lookup whether each package file stored at a path is cached.
+    Returns an empty list if no package file references the path.
+    """
+    return list(
+        db.session.execute(
+            union_all(
+                select(CodeFile.is_cached).where(CodeFile.storage_path == storage_path),
+                select(MetadataFile.is_cached).where(MetadataFile.storage_path == storage_path),
+            )
+        ).scalars()
+    )
+
+
+def get_caches(keys: list[str]) -> list[Cache]:
+    """
+    Get many cache values. Keys that do not exist are left out
+    """
+    return list(db.session.execute(select(Cache).where(Cache.key.in_(keys))).scalars())
+
+
+def set_caches(values: dict[str, bytes], expiration: datetime.datetime) -> None:
+    """
+    Set many cache values, replacing existing ones.
+    A single upsert, so concurrent sets of the same key can't fail on its unique constraint.
+    """
+    statement = UPSERTS[db.engine.dialect.name](Cache)
+    statement = statement.on_conflict_do_update(
+        index_elements=[Cache.key],
+        set_={"value": statement.excluded.value, "expiration": statement.excluded.expiration},
+    )
+    db.session.execute(
+        statement, [{"key": key, "value": value, "expiration": expiration} for key, value in values.items()]
+    )
+    save()
+
+
+def delete_caches(keys: list[str]) -> None:
     """
-    Get a cache value. Return None if the key does not exist
+    Delete many cache values
     """
-    return db.session.execute(select(Cache).where(Cache.key == key)).scalar_one_or_none()
+    db.session.execute(delete(Cache).where(Cache.key.in_(keys)))
+    save()
+
+
+def has_changes(*models: type[Base]) -> bool:
+    """
+    Are there new or changed objects of the given models in the current session, yet to be saved?
+    """
+    return any(isinstance(obj, models) for obj in db.session.new) or any(
+        isinstance(obj, models) and db.session.is_modified(obj) for obj in db.session.dirty
+    )
+
+
+def session_add(obj: Base) -> None:
+    """
+    Add an object to the current session, without saving
+    """
+    db.session.add(obj)
 
 
 def session_save(obj: Base) -> None:
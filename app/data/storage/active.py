@@ -2,12 +2,13 @@ from __future__ import annotations
 
 from app.config import Config, StorageDrivers
 
-if Config.storage.driver == StorageDrivers.S3:
+
+def _s3_storage() -> app.data.storage.s3.S3Storage:
     import app.data.storage.s3
 
     assert Config.storage.s3 is not None
 
-    StorageDriver = app.data.storage.s3.S3Storage(
+    return app.data.storage.s3.S3Storage(
         endpoint_url=str(Config.storage.s3.endpoint_url),
         bucket_name=Config.storage.s3.bucket_name,
         access_key_id=Config.storage.s3.access_key_id,
@@ -16,8 +17,15 @@ if Config.storage.driver == StorageDrivers.S3:
         public_url_prefix=Config.storage.s3.public_url_prefix,
         bucket_prefix=Config.storage.s3.bucket_prefix,
         redirect_code=Config.storage.s3.redirect_code,
+        part_size_megabytes=Config.storage.s3.multipart.part_size_megabytes,
+        upload_concurrency=Config.storage.s3.multipart.concurrency,
+        upload_checksums=Config.storage.s3.multipart.checksums,
     )
 
+
+if Config.storage.driver == StorageDrivers.S3:
+    StorageDriver = _s3_storage()
+
 elif Config.storage.driver == StorageDrivers.FILESYSTEM:
     import app.data.storage.filesystem
 
@@ -25,4 +33,18 @@ elif Config.storage.driver == StorageDrivers.FILESYSTEM:
 
     StorageDriver = app.data.storage.filesystem.FilesystemStorage(
         directory=Config.storage.filesystem.directory,
+        offload=Config.storage.filesystem.offload,
+        offload_prefix=Config.storage.filesystem.offload_prefix,
+    )
+
+elif Config.storage.driver == StorageDrivers.TIERED:
+    import app.data.storage.filesystem
+    import app.data.storage.tiered
+
+    assert Config.storage.tiered is not None
+
+    StorageDriver = app.data.storage.tiered.TieredStorage(
+        local=app.data.storage.filesystem.FilesystemStorage(directory=Config.storage.tiered.directory),
+        remote=_s3_storage(),
+        max_megabytes=Config.storage.tiered.max_megabytes,
     )
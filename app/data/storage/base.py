@@ -1,47 +1,254 @@
 from __future__ import annotations
 
 import abc
-from typing import TYPE_CHECKING
+import threading
+from http import HTTPStatus
+from typing import IO, TYPE_CHECKING, Iterator
 
 import flask
+import requests
 from loguru import logger
 
+import app.data.sql
+import app.http
+import app.utils
+from app.config import Config
+from app.constants import CONTENT_ADDRESS_HASH, DOWNLOAD_CHUNK_SIZE
+from app.data.storage.index import ExistenceIndex
+
 if TYPE_CHECKING:
+    import pathlib
+
+    from app.data.storage.integrity import StreamVerifier
     from app.models.package_file import PackageFile
 
 
 class BaseStorage(abc.ABC):
+    redirects = False
+    """
+    Whether send_file redirects elsewhere, in which case the response can be reused
+    """
+
+    def __init__(self) -> None:
+        self._index = ExistenceIndex()
+        self._index_started = False
+        self._index_lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _list_paths(self) -> Iterator[str]:
+        """
+        List the path of every file in storage, as built by _get_path
+        """
+        ...
+
+    def build_index(self) -> None:
+        """
+        Build the index of files in storage from a listing.
+        Until it is built, existence checks go to storage.
+        """
+        logger.info(f"Indexing {type(self).__name__} files")
+        try:
+            self._index.build(self._list_paths())
+        except Exception as e:
+            # not fatal, storage is just asked instead
+            logger.warning(f"Unable to index {type(self).__name__} files: {e}")
+            return
+        logger.info(f"Indexed {type(self).__name__} files")
+
+    def _start_index(self) -> None:
+        """
+        Start building the index in the background, the first time a request checks for a file.
+        Listing a large bucket takes a while, so only processes serving requests build it.
+        CLI commands and download workers just ask storage.
+        """
+        if self._index_started or not Config.storage.existence_index or not flask.has_request_context():
+            return
+
+        with self._index_lock:
+            if self._index_started:
+                return
+            self._index_started = True
+
+        threading.Thread(target=self.build_index, name="storage-index", daemon=True).start()
+
     def _get_path(self, package_file: PackageFile) -> str:
         """
-        Build the path to the file in storage
+        Build the path to the file in storage.
+        Files with a known sha256 are stored by content, so the same file reachable
+        through several repositories is only stored once.
         """
         # use forward slashes so it works with URLs
         # pathlib should handle this for us when working with the local filesystem
-        return f"{package_file.package.repository.slug}/{package_file.package.name}/{package_file.version_text}/{package_file.filename}"
+        if package_file.storage_path is not None:
+            return package_file.storage_path
+
+        # files cached before content addressing stay where they are
+        upstream_sha256 = package_file.hashes_dict.get(CONTENT_ADDRESS_HASH)
+        if package_file.is_cached or upstream_sha256 is None:
+            return self._get_repository_path(package_file)
+
+        # keep the filename last, so redirected clients still see it
+        digest = upstream_sha256.lower()
+        return f"{CONTENT_ADDRESS_HASH}/{digest[:2]}/{digest}/{package_file.filename}"
+
+    def _get_repository_path(self, package_file: PackageFile) -> str:
+        """
+        Build the path to the file in storage, keyed by repository
+        """
+        package = package_file.package
+        return f"{package.repository.slug}/{package.name}/{package_file.version_text}/{package_file.filename}"
 
     @abc.abstractmethod
-    def save_file(self, package_file: PackageFile) -> None:
+    def save_file(self, package_file: PackageFile) -> StreamVerifier:
         """
-        Save a file
+        Save a file, verifying it as it is written.
+        Returns the verifier, which holds the size and sha256 of what was stored.
         """
         ...
 
     @abc.abstractmethod
+    def save_content(self, package_file: PackageFile, content: bytes) -> StreamVerifier:
+        """
+        Save a file we already have the content of, verifying it before it is written.
+        Returns the verifier, which holds the size and sha256 of what was stored.
+        """
+        ...
+
+    @abc.abstractmethod
+    def save_local_file(self, package_file: PackageFile, local_path: pathlib.Path) -> None:
+        """
+        Save a file that has already been verified on the local filesystem, such as from a snapshot
+        """
+        ...
+
+    @abc.abstractmethod
+    def open_file(self, package_file: PackageFile) -> IO[bytes]:
+        """
+        Open a stored file for reading. The file is seekable.
+        """
+        ...
+
+    @abc.abstractmethod
+    def _check_file(self, package_file: PackageFile) -> bool:
+        """
+        Check if a file already exists, by asking storage
+        """
+        ...
+
     def check_file(self, package_file: PackageFile) -> bool:
         """
-        Check if a file already exists
+        Check if a file already exists.
+        The database is asked first, as other workers may have stored or evicted the file
+        since the index was built. The index covers files the database doesn't know about,
+        such as after a restore, and storage is only asked if the index isn't ready.
+        """
+        self._start_index()
+
+        path = self._get_path(package_file)
+        cached = app.data.sql.get_storage_path_cached(path)
+        if cached:
+            # files that were evicted keep their path, but are no longer cached
+            return any(cached)
+
+        exists = self._index.contains(path)
+        if exists is None:
+            exists = self._check_file(package_file)
+        return exists
+
+    @abc.abstractmethod
+    def _delete_file(self, package_file: PackageFile) -> None:
+        """
+        Delete a stored file
         """
         ...
 
-    def cache_file(self, package_file: PackageFile) -> None:
+    def delete_file(self, package_file: PackageFile) -> None:
         """
-        Cache a file. Basically, just save it if it doesn't already exist
+        Delete a stored file. Files with the same content share a path,
+        so the caller must make sure no other package file still references it.
+        """
+        self._delete_file(package_file)
+        self._index.remove(self._get_path(package_file))
+
+    def cache_file(self, package_file: PackageFile, content: bytes | None = None) -> None:
+        """
+        Cache a file. Basically, just save it if it doesn't already exist.
+        If the content is given, it is saved instead of downloading the file from upstream.
         """
         if not self.check_file(package_file):
-            self.save_file(package_file)
+            if content is None:
+                verifier = self.save_file(package_file)
+            else:
+                verifier = self.save_content(package_file, content)
+            # record what was actually stored
+            package_file.size = verifier.size
+            package_file.sha256 = verifier.sha256
+            self._index.add(self._get_path(package_file))
         else:
             logger.debug(f"File {package_file.filename} already exists")
 
+        # this repository's reference to the stored file
+        package_file.storage_path = self._get_path(package_file)
+
+    def head_file(self, package_file: PackageFile) -> flask.Response:
+        """
+        Describe a file without touching storage.
+        The size comes from the database for cached files, or from upstream otherwise.
+        """
+        response = flask.Response(mimetype="application/octet-stream")
+        response.headers.set("Content-Disposition", "attachment", filename=package_file.filename)
+        response.headers["Accept-Ranges"] = "bytes"
+
+        size = package_file.size
+        if size is None and package_file.has_upstream and not package_file.is_offline:
+            try:
+                upstream_response = app.http.hedged_head(package_file.upstream_urls)
+                size = int(upstream_response.headers["Content-Length"])
+            except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+                logger.debug(f"Unable to get the size of {package_file.filename} from upstream: {e}")
+
+        if size is not None:
+            response.content_length = size
+        else:
+            # an empty body doesn't mean an empty file
+            response.automatically_set_content_length = False
+        if package_file.digest is not None:
+            response.set_etag(package_file.digest)
+
+        return self._add_digest_headers(response, package_file)
+
+    def send_upstream_range(self, package_file: PackageFile, range_header: str) -> flask.Response:
+        """
+        Proxy a range request for a file that isn't cached yet straight to upstream,
+        so clients that only need part of a file don't wait for the whole thing to be cached.
+        """
+        try:
+            upstream_response = app.http.hedged_stream(package_file.upstream_urls, headers={"Range": range_header})
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE:
+                return flask.Response(status=HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            raise
+
+        logger.debug(f"Proxying range {range_header} of {package_file.filename} from {upstream_response.url}")
+
+        def generate() -> Iterator[bytes]:
+            with upstream_response:
+                yield from upstream_response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE)
+
+        # upstream may ignore the range and send the whole file, so pass its status through
+        response = flask.Response(generate(), status=upstream_response.status_code, mimetype="application/octet-stream")
+        for header in ("Content-Length", "Content-Range", "Accept-Ranges"):
+            if header in upstream_response.headers:
+                response.headers[header] = upstream_response.headers[header]
+        response.headers.set("Content-Disposition", "attachment", filename=package_file.filename)
+        return response
+
+    def _add_digest_headers(self, response: flask.Response, package_file: PackageFile) -> flask.Response:
+        """
+        Add the sha256 of a file as Digest and Repr-Digest headers, so clients can verify downloads
+        """
+        return app.utils.add_digest_headers(response, package_file.digest)
+
     @abc.abstractmethod
     def send_file(self, package_file: PackageFile) -> flask.Response:
         """
@@ -1,36 +1,125 @@
 from __future__ import annotations
 
+import contextlib
+import dataclasses
+import fcntl
+import json
+import os
 import pathlib
-from typing import TYPE_CHECKING
+import shutil
+import threading
+import urllib.parse
+from typing import TYPE_CHECKING, BinaryIO, Iterator
 
 import flask
+import requests
+import werkzeug.utils
 from loguru import logger
 
+import app.data.storage.segmented
 import app.http
-from app.constants import DOWNLOAD_CHUNK_SIZE
+from app.config import StorageFilesystemOffload
+from app.constants import DOWNLOAD_CHUNK_SIZE, LOCK_EXTENSION, PARTIAL_EXTENSION, PROGRESS_EXTENSION
 from app.data.storage.base import BaseStorage
+from app.data.storage.integrity import StreamVerifier
+from app.models.exceptions import FileIntegrityError
 from app.models.package_file import PackageFile
 
 if TYPE_CHECKING:
     from app.models.package_file import PackageFile
 
 
+# files that are still being written, or bookkeeping for them
+IN_PROGRESS_SUFFIXES = (PARTIAL_EXTENSION, PROGRESS_EXTENSION, LOCK_EXTENSION, ".tmp")
+
+
+def list_files(directory: pathlib.Path) -> list[os.DirEntry]:
+    """
+    Find every complete file in a directory tree
+    """
+    files = []
+    stack = [directory]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(pathlib.Path(entry.path))
+                elif entry.is_file(follow_symlinks=False) and not entry.name.endswith(IN_PROGRESS_SUFFIXES):
+                    files.append(entry)
+    return files
+
+
+@dataclasses.dataclass
+class DownloadProgress:
+    """
+    Dataclass to hold how much of a partial download is known to be written.
+    Streamed downloads record an offset, segmented downloads record completed parts.
+    """
+
+    offset: int = 0
+    size: int | None = None
+    parts: list[int] | None = None
+
+    @classmethod
+    def load(cls, path: pathlib.Path) -> DownloadProgress:
+        """
+        Load a progress record, or start fresh if there isn't a usable one
+        """
+        try:
+            return cls(**json.loads(path.read_text()))
+        except (FileNotFoundError, ValueError, TypeError):
+            return cls()
+
+    def save(self, path: pathlib.Path) -> None:
+        """
+        Save a progress record. Written to a temporary file first so a crash never leaves half a record.
+        """
+        temp_path = path.with_name(f"{path.name}.tmp")
+        temp_path.write_text(json.dumps(dataclasses.asdict(self)))
+        temp_path.replace(path)
+
+
 class FilesystemStorage(BaseStorage):
-    def __init__(self, directory: str) -> None:
+    def __init__(
+        self,
+        directory: str,
+        offload: StorageFilesystemOffload = StorageFilesystemOffload.NONE,
+        offload_prefix: str = "/protected/",
+    ) -> None:
+        super().__init__()
         self._local_dir = pathlib.Path(directory)
         self._local_dir.mkdir(parents=True, exist_ok=True)
+        self._resolved_dir = self._local_dir.resolve()
+        self._offload = offload
+        self._offload_prefix = offload_prefix
+
+    @property
+    def directory(self) -> pathlib.Path:
+        """
+        The directory files are stored in
+        """
+        return self._local_dir
 
-    def _path(self, package_file: PackageFile) -> pathlib.Path:
+    def local_path(self, package_file: PackageFile) -> pathlib.Path:
         """
-        Build the path to the file in local storage
+        Build the path to the file in local storage.
+        Raises a ValueError if the path would be outside it, such as a storage path from a crafted snapshot.
         """
-        return self._local_dir.joinpath(self._get_path(package_file))
+        local_path = self._local_dir.joinpath(self._get_path(package_file))
+        if not local_path.resolve().is_relative_to(self._resolved_dir):
+            raise ValueError(f"{local_path} is outside of {self._local_dir}")
+        return local_path
 
-    def save_file(self, package_file: PackageFile) -> None:
+    def save_file(self, package_file: PackageFile) -> StreamVerifier:
         """
-        Take a file from an upstream URL and save it
+        Take a file from an upstream URL and save it.
+        The file is downloaded next to its final path with a progress record, so an interrupted
+        download can be resumed, and is only moved into place once it has been verified.
         """
-        local_path = self._path(package_file)
+        local_path = self.local_path(package_file)
+        partial_path = local_path.with_name(f"{local_path.name}{PARTIAL_EXTENSION}")
+        progress_path = local_path.with_name(f"{local_path.name}{PROGRESS_EXTENSION}")
+        lock_path = local_path.with_name(f"{local_path.name}{LOCK_EXTENSION}")
         upstream_url = package_file.upstream_url
 
         logger.debug(f"Downloading {upstream_url} to {local_path.absolute()}")
@@ -38,21 +127,228 @@ class FilesystemStorage(BaseStorage):
         # need to make sure the parent directory exists
         local_path.parent.mkdir(parents=True, exist_ok=True)
 
-        with open(local_path, "wb") as fp:
-            with app.http.stream(upstream_url) as response:
-                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
-                    fp.write(chunk)
+        # locked separately from the partial file, which is moved into place while still open
+        with open(lock_path, "ab") as lock_fp:
+            # another worker may be downloading the same file, wait for it
+            fcntl.flock(lock_fp, fcntl.LOCK_EX)
+            if local_path.exists():
+                logger.debug(f"File {package_file.filename} was saved while waiting")
+                # anyone else waiting on it will find the file too
+                lock_path.unlink(missing_ok=True)
+                # the other worker has verified it, but we still need the digest
+                with open(local_path, "rb") as saved_fp:
+                    verifier = StreamVerifier(package_file)
+                    verifier.update_from_file(saved_fp, local_path.stat().st_size)
+                    return verifier
+
+            # open without truncating, as we may be resuming
+            partial_path.touch(exist_ok=True)
+            with open(partial_path, "r+b") as fp:
+                progress = DownloadProgress.load(progress_path)
+                try:
+                    # large files are downloaded as concurrent ranges into a preallocated file
+                    source = app.data.storage.segmented.probe(package_file)
+                    if source is not None:
+                        verifier = self._download_segmented(fp, source, progress, progress_path, package_file)
+                    else:
+                        verifier = self._download_stream(fp, progress, progress_path, package_file)
+
+                    verifier.verify()
+                except FileIntegrityError:
+                    # there's no resuming a corrupt file
+                    partial_path.unlink(missing_ok=True)
+                    progress_path.unlink(missing_ok=True)
+                    raise
+
+            partial_path.replace(local_path)
+            progress_path.unlink(missing_ok=True)
+            # only once the file is in place, so whoever locks it next finds the file rather than downloading again
+            lock_path.unlink(missing_ok=True)
+            return verifier
+
+    def _download_stream(
+        self, fp: BinaryIO, progress: DownloadProgress, progress_path: pathlib.Path, package_file: PackageFile
+    ) -> StreamVerifier:
+        """
+        Download a file as a single stream, resuming from the last recorded offset if possible
+        """
+        # anything past the recorded offset may not have been fully written
+        offset = progress.offset if progress.parts is None else 0
+        fp.truncate(offset)
+
+        verifier = StreamVerifier(package_file)
+        verifier.update_from_file(fp, offset)
+
+        # the last attempt stopped after the final chunk, but before the file was moved into place
+        if offset and offset == package_file.size:
+            logger.debug(f"{package_file.filename} was already fully downloaded")
+            return verifier
+
+        headers = {"Range": f"bytes={offset}-"} if offset else None
+        try:
+            response = app.http.hedged_stream(package_file.upstream_urls, headers=headers)
+        except requests.exceptions.HTTPError as e:
+            if not offset or e.response is None or e.response.status_code != requests.codes.range_not_satisfiable:
+                raise
+
+            # the range starts at or past the end of the file
+            if e.response.headers.get("Content-Range") == f"bytes */{offset}":
+                logger.debug(f"{package_file.filename} was already fully downloaded")
+                return verifier
+
+            logger.debug(f"Upstream can't resume {package_file.filename} from byte {offset}, starting over")
+            return self._download_stream(fp, DownloadProgress(), progress_path, package_file)
+
+        with response:
+            if offset and response.status_code != requests.codes.partial_content:
+                logger.debug(f"Upstream ignored range request for {package_file.filename}, starting over")
+                offset = 0
+                fp.truncate(0)
+                verifier = StreamVerifier(package_file)
+            elif offset:
+                logger.debug(f"Resuming {package_file.filename} from byte {offset}")
+
+            fp.seek(offset)
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                fp.write(chunk)
+                verifier.update(chunk)
+                offset += len(chunk)
+
+                # only record data that has actually been written
+                fp.flush()
+                DownloadProgress(offset=offset).save(progress_path)
+
+        return verifier
+
+    def _download_segmented(
+        self,
+        fp: BinaryIO,
+        source: app.data.storage.segmented.RangedSource,
+        progress: DownloadProgress,
+        progress_path: pathlib.Path,
+        package_file: PackageFile,
+    ) -> StreamVerifier:
+        """
+        Download a file as concurrent ranges, skipping ranges a previous attempt completed
+        """
+        done = set(progress.parts or []) if progress.size == source.size else set()
+        if done:
+            logger.debug(f"Resuming {package_file.filename} with {len(done)} parts already downloaded")
+        fp.truncate(source.size)
+
+        lock = threading.Lock()
+
+        def on_part_done(part_number: int) -> None:
+            with lock:
+                done.add(part_number)
+                DownloadProgress(size=source.size, parts=sorted(done)).save(progress_path)
+
+        app.data.storage.segmented.download_to_file(source, fp.fileno(), skip=done, on_part_done=on_part_done)
+
+        # ranges arrive out of order, so the file has to be read back to hash it
+        verifier = StreamVerifier(package_file)
+        verifier.update_from_file(fp, source.size)
+        return verifier
+
+    def save_content(self, package_file: PackageFile, content: bytes) -> StreamVerifier:
+        """
+        Save a file we already have the content of.
+        Written next to its final path and moved into place, so it is never seen half written.
+        """
+        local_path = self.local_path(package_file)
+        partial_path = local_path.with_name(f"{local_path.name}{PARTIAL_EXTENSION}")
+        logger.debug(f"Saving {package_file.filename} to {local_path.absolute()}")
+
+        verifier = StreamVerifier(package_file)
+        verifier.update(content)
+        verifier.verify()
+
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+        partial_path.write_bytes(content)
+        partial_path.replace(local_path)
+        return verifier
+
+    def save_local_file(self, package_file: PackageFile, local_path: pathlib.Path) -> None:
+        """
+        Copy a file from elsewhere on the local filesystem.
+        Copied next to its final path and moved into place, so it is never seen half written.
+        """
+        stored_path = self.local_path(package_file)
+        partial_path = stored_path.with_name(f"{stored_path.name}{PARTIAL_EXTENSION}")
+        logger.debug(f"Copying {local_path} to {stored_path.absolute()}")
+
+        stored_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(local_path, partial_path)
+        partial_path.replace(stored_path)
 
-    def check_file(self, package_file: PackageFile) -> bool:
+    def open_file(self, package_file: PackageFile) -> BinaryIO:
+        """
+        Open a stored file for reading
+        """
+        return open(self.local_path(package_file), "rb")
+
+    def _check_file(self, package_file: PackageFile) -> bool:
         """
         Check if a file already exists
         """
-        return self._path(package_file).exists()
+        return self.local_path(package_file).exists()
+
+    def _list_paths(self) -> Iterator[str]:
+        """
+        List the path of every complete file in storage
+        """
+        for entry in list_files(self._local_dir):
+            yield pathlib.Path(entry.path).relative_to(self._local_dir).as_posix()
+
+    def _delete_file(self, package_file: PackageFile) -> None:
+        """
+        Delete a stored file
+        """
+        local_path = self.local_path(package_file)
+        logger.debug(f"Deleting {local_path}")
+        local_path.unlink(missing_ok=True)
+
+        # don't leave empty content address directories behind
+        with contextlib.suppress(OSError):
+            local_path.parent.rmdir()
 
     def send_file(self, package_file: PackageFile) -> flask.Response:
         """
         Download a file
         """
-        local_path = self._path(package_file)
+        if self._offload != StorageFilesystemOffload.NONE:
+            return self._offload_file(package_file)
+
+        local_path = self.local_path(package_file)
         logger.debug(f"Sending {local_path}")
-        return flask.send_file(local_path, as_attachment=True)
+        # the digest makes a stronger ETag than the default of modification time and size
+        response = flask.send_file(local_path, as_attachment=True, etag=package_file.digest or True)
+        return self._add_digest_headers(response, package_file)
+
+    def _offload_file(self, package_file: PackageFile) -> flask.Response:
+        """
+        Hand the transfer off to the front proxy, so a slow client doesn't tie up a worker.
+        The response has no body, only a header telling the proxy which file to send.
+        """
+        local_path = self.local_path(package_file)
+        # the proxy handles conditional and range requests against the real file
+        response = werkzeug.utils.send_file(
+            local_path.absolute(),
+            flask.request.environ,
+            as_attachment=True,
+            etag=package_file.digest or True,
+            conditional=False,
+            use_x_sendfile=True,
+            response_class=flask.current_app.response_class,
+        )
+
+        if self._offload == StorageFilesystemOffload.X_ACCEL_REDIRECT:
+            # nginx wants a URI for an internal location, rather than a filesystem path
+            del response.headers["X-Sendfile"]
+            uri = f"{self._offload_prefix}{urllib.parse.quote(self._get_path(package_file))}"
+            response.headers["X-Accel-Redirect"] = uri
+            logger.debug(f"Offloading {local_path} to {uri}")
+        else:
+            logger.debug(f"Offloading {local_path}")
+
+        return self._add_digest_headers(response, package_file)
@@ -0,0 +1,77 @@
+"""
+Remember which paths exist in storage, so checking for a file doesn't need a round trip to storage
+"""
+
+from __future__ import annotations
+
+import array
+import bisect
+import hashlib
+import threading
+from typing import Iterable
+
+
+def fingerprint(path: str) -> int:
+    """
+    Reduce a path to 64 bits. Collisions are vanishingly unlikely at any realistic number of files.
+    """
+    return int.from_bytes(hashlib.blake2b(path.encode(), digest_size=8).digest())
+
+
+class ExistenceIndex:
+    """
+    Index of the paths in storage, built from a listing of storage,
+    then kept up to date as this process writes and deletes files.
+    Listed paths are kept as fingerprints in a sorted array, so millions of files only take megabytes.
+    """
+
+    def __init__(self) -> None:
+        self._listed = array.array("Q")
+        # changes since startup, which take priority over the listing
+        self._added: set[int] = set()
+        self._removed: set[int] = set()
+        self._lock = threading.Lock()
+        self.is_ready = False
+
+    def build(self, paths: Iterable[str]) -> None:
+        """
+        Replace the listing. Changes made while listing are kept.
+        """
+        listed = array.array("Q", sorted({fingerprint(path) for path in paths}))
+        with self._lock:
+            self._listed = listed
+            self.is_ready = True
+
+    def add(self, path: str) -> None:
+        """
+        Record that a path was written
+        """
+        value = fingerprint(path)
+        with self._lock:
+            self._added.add(value)
+            self._removed.discard(value)
+
+    def remove(self, path: str) -> None:
+        """
+        Record that a path was deleted
+        """
+        value = fingerprint(path)
+        with self._lock:
+            self._removed.add(value)
+            self._added.discard(value)
+
+    def contains(self, path: str) -> bool | None:
+        """
+        Does a path exist in storage? Returns None if the index hasn't been built yet.
+        """
+        value = fingerprint(path)
+        with self._lock:
+            if value in self._removed:
+                return False
+            if value in self._added:
+                return True
+            if not self.is_ready:
+                return None
+
+            i = bisect.bisect_left(self._listed, value)
+            return i < len(self._listed) and self._listed[i] == value
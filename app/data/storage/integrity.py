@@ -0,0 +1,119 @@
+"""
+Verify downloaded files against the sizes and hashes reported by the upstream index
+"""
+
+from __future__ import annotations
+
+import contextvars
+import hashlib
+import threading
+from typing import IO, TYPE_CHECKING, Callable
+
+from loguru import logger
+
+from app.constants import DOWNLOAD_CHUNK_SIZE
+from app.models.exceptions import FileIntegrityError
+
+if TYPE_CHECKING:
+    from app.models.package_file import PackageFile  # pragma: no cover
+
+# always computed, even if upstream doesn't provide it
+PREFERRED_HASH = "sha256"
+
+# set by download workers, to be told how many bytes of a file have been verified so far
+progress_callback: contextvars.ContextVar[Callable[[int], None] | None] = contextvars.ContextVar(
+    "progress_callback", default=None
+)
+
+
+class StreamVerifier:
+    """
+    Incrementally hash and count the bytes of a file as it is written,
+    then compare against the expected values for the package file.
+    """
+
+    def __init__(self, package_file: PackageFile) -> None:
+        self._filename = package_file.filename
+        self._expected_size = package_file.size
+
+        # prefer sha256, but fall back to whatever upstream gave us that we can compute
+        hashes = package_file.hashes_dict
+        self._hashes = {PREFERRED_HASH: hashlib.new(PREFERRED_HASH)}
+        self._expected_hashes = {}
+        fallback = next((kind for kind in hashes if kind in hashlib.algorithms_available), None)
+        if PREFERRED_HASH in hashes:
+            self._expected_hashes[PREFERRED_HASH] = hashes[PREFERRED_HASH].lower()
+        elif fallback is not None:
+            self._hashes[fallback] = hashlib.new(fallback)
+            self._expected_hashes[fallback] = hashes[fallback].lower()
+        elif package_file.sha256:
+            # re-downloading a file we've stored before
+            self._expected_hashes[PREFERRED_HASH] = package_file.sha256
+        elif hashes:
+            logger.debug(f"Unable to verify {self._filename}, no supported hash in {', '.join(hashes)}")
+
+        self.size = 0
+        # captured here, as parts may be added from other threads
+        self._on_progress = progress_callback.get()
+
+        # parts that arrived ahead of an earlier one
+        self._pending_parts: dict[int, bytes] = {}
+        self._next_part = 1
+        self._lock = threading.Lock()
+
+    def update(self, chunk: bytes) -> None:
+        """
+        Add a chunk of the file
+        """
+        for hash_ in self._hashes.values():
+            hash_.update(chunk)
+        self.size += len(chunk)
+        if self._on_progress is not None:
+            self._on_progress(self.size)
+
+    def update_part(self, part_number: int, data: bytes) -> None:
+        """
+        Add a 1-based numbered part of the file, which may arrive out of order.
+        Parts are held in memory until every earlier part has been added,
+        so callers should limit how far ahead of the earliest missing part they get.
+        """
+        with self._lock:
+            self._pending_parts[part_number] = data
+            while self._next_part in self._pending_parts:
+                self.update(self._pending_parts.pop(self._next_part))
+                self._next_part += 1
+
+    def update_from_file(self, fp: IO[bytes], length: int) -> None:
+        """
+        Add the first length bytes of an open file, such as a partial download being resumed
+        """
+        fp.seek(0)
+        remaining = length
+        while remaining > 0:
+            chunk = fp.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            self.update(chunk)
+            remaining -= len(chunk)
+
+    @property
+    def sha256(self) -> str:
+        """
+        The sha256 hex digest of everything added so far
+        """
+        return self._hashes[PREFERRED_HASH].hexdigest()
+
+    def verify(self) -> None:
+        """
+        Raise a FileIntegrityError if the size or hash does not match what upstream reported
+        """
+        if self._pending_parts:
+            raise FileIntegrityError(f"{self._filename} is missing part {self._next_part}")
+
+        if self._expected_size is not None and self.size != self._expected_size:
+            raise FileIntegrityError(f"{self._filename} is {self.size} bytes, expected {self._expected_size}")
+
+        for kind, expected in self._expected_hashes.items():
+            actual = self._hashes[kind].hexdigest()
+            if actual != expected:
+                raise FileIntegrityError(f"{self._filename} has {kind} {actual}, expected {expected}")
@@ -0,0 +1,161 @@
+"""
+Manage S3 multipart uploads ourselves, so parts are uploaded concurrently
+while the download carries on, rather than one after another
+"""
+
+from __future__ import annotations
+
+import base64
+import concurrent.futures
+import hashlib
+import threading
+from typing import TYPE_CHECKING
+
+from loguru import logger
+
+from app.constants import MEGABYTES_TO_BYTES
+
+if TYPE_CHECKING:
+    import s3fs  # pragma: no cover
+
+
+def _checksum(data: bytes) -> str:
+    """
+    Base64 sha256 of a part, as S3 wants it
+    """
+    return base64.b64encode(hashlib.sha256(data).digest()).decode()
+
+
+class MultipartUpload:
+    """
+    Upload an object in parts. Data written is buffered into parts of the configured size,
+    and each full part is uploaded in the background while the next one fills.
+    At most the configured number of parts are in flight, and writing blocks until one finishes,
+    so memory use is bounded even if the upload can't keep up with the download.
+    Objects smaller than a single part are uploaded with a single request.
+    """
+
+    def __init__(
+        self, interface: s3fs.S3FileSystem, s3_url: str, part_size_megabytes: int, concurrency: int, checksums: bool
+    ) -> None:
+        self._interface = interface
+        self._bucket, self._key, _ = interface.split_path(s3_url)
+        self._part_size = part_size_megabytes * MEGABYTES_TO_BYTES
+        self._checksums = checksums
+
+        self._upload_id: str | None = None
+        self._upload_id_lock = threading.Lock()
+        self._buffer = bytearray()
+        self._next_part = 1
+        self._parts: list[dict] = []
+        self._parts_lock = threading.Lock()
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="s3-upload")
+        self._in_flight = threading.Semaphore(concurrency)
+        self._futures: list[concurrent.futures.Future] = []
+
+    def _ensure_upload(self) -> str:
+        """
+        Start the multipart upload, the first time a part needs it
+        """
+        with self._upload_id_lock:
+            if self._upload_id is None:
+                kwargs = {"ChecksumAlgorithm": "SHA256"} if self._checksums else {}
+                response = self._interface.call_s3(
+                    "create_multipart_upload", Bucket=self._bucket, Key=self._key, **kwargs
+                )
+                self._upload_id = response["UploadId"]
+            return self._upload_id
+
+    def upload_part(self, part_number: int, data: bytes) -> None:
+        """
+        Upload a 1-based numbered part. Parts may be uploaded in any order, from any thread.
+        """
+        upload_id = self._ensure_upload()
+        kwargs = {"ChecksumSHA256": _checksum(data)} if self._checksums else {}
+        response = self._interface.call_s3(
+            "upload_part",
+            Bucket=self._bucket,
+            Key=self._key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=data,
+            **kwargs,
+        )
+
+        part = {"PartNumber": part_number, "ETag": response["ETag"], **kwargs}
+        with self._parts_lock:
+            self._parts.append(part)
+
+    def _upload_part_in_flight(self, part_number: int, data: bytes) -> None:
+        try:
+            self.upload_part(part_number, data)
+        finally:
+            self._in_flight.release()
+
+    def _raise_failed(self) -> None:
+        """
+        Surface the error from any part that has already failed, rather than waiting for the end
+        """
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()  # type: ignore[misc]
+
+    def _submit(self, data: bytes) -> None:
+        self._in_flight.acquire()
+        self._futures.append(self._executor.submit(self._upload_part_in_flight, self._next_part, data))
+        self._next_part += 1
+
+    def write(self, data: bytes) -> None:
+        """
+        Add data to the end of the object
+        """
+        self._raise_failed()
+        self._buffer.extend(data)
+        while len(self._buffer) >= self._part_size:
+            self._submit(bytes(self._buffer[: self._part_size]))
+            del self._buffer[: self._part_size]
+
+    def complete(self) -> None:
+        """
+        Upload whatever is left, wait for every part, then make the object visible
+        """
+        if not self._futures and self._upload_id is None:
+            # small enough for a single request
+            kwargs = {"ChecksumSHA256": _checksum(self._buffer)} if self._checksums else {}
+            self._interface.call_s3(
+                "put_object", Bucket=self._bucket, Key=self._key, Body=bytes(self._buffer), **kwargs
+            )
+            self._executor.shutdown()
+            return
+
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+
+        for future in concurrent.futures.as_completed(self._futures):
+            future.result()
+        self._executor.shutdown()
+
+        parts = sorted(self._parts, key=lambda part: part["PartNumber"])
+        logger.debug(f"Completing upload of {self._key} in {len(parts)} parts")
+        self._interface.call_s3(
+            "complete_multipart_upload",
+            Bucket=self._bucket,
+            Key=self._key,
+            UploadId=self._ensure_upload(),
+            MultipartUpload={"Parts": parts},
+        )
+
+    def abort(self) -> None:
+        """
+        Stop the upload and discard any uploaded parts, so nothing is left behind
+        """
+        for future in self._futures:
+            future.cancel()
+        self._executor.shutdown(wait=True)
+
+        if self._upload_id is not None:
+            self._interface.call_s3(
+                "abort_multipart_upload", Bucket=self._bucket, Key=self._key, UploadId=self._upload_id
+            )
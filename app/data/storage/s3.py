@@ -1,15 +1,19 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+import pathlib
+from typing import IO, TYPE_CHECKING, Iterator
 
 import flask
 import s3fs
 import werkzeug.wrappers.response
 from loguru import logger
 
+import app.data.storage.segmented
 import app.http
 from app.constants import DOWNLOAD_CHUNK_SIZE
 from app.data.storage.base import BaseStorage
+from app.data.storage.integrity import StreamVerifier
+from app.data.storage.multipart import MultipartUpload
 from app.models.package_file import PackageFile
 
 if TYPE_CHECKING:
@@ -17,6 +21,8 @@ if TYPE_CHECKING:
 
 
 class S3Storage(BaseStorage):
+    redirects = True
+
     def __init__(
         self,
         endpoint_url: str,
@@ -27,11 +33,18 @@ class S3Storage(BaseStorage):
         region_name: str | None,
         bucket_prefix: str,
         redirect_code: int,
+        part_size_megabytes: int = 16,
+        upload_concurrency: int = 4,
+        upload_checksums: bool = True,
     ) -> None:
+        super().__init__()
         self._bucket_name = bucket_name
         self._bucket_prefix = bucket_prefix.removesuffix("/")
         self._public_url_prefix = public_url_prefix.removesuffix("/")
         self._redirect_code = redirect_code
+        self._part_size_megabytes = part_size_megabytes
+        self._upload_concurrency = upload_concurrency
+        self._upload_checksums = upload_checksums
 
         self._interface = s3fs.S3FileSystem(
             endpoint_url=endpoint_url,
@@ -52,25 +65,154 @@ class S3Storage(BaseStorage):
         """
         return f"{self._public_url_prefix}/{self._get_path(package_file)}"
 
-    def check_file(self, package_file: PackageFile) -> bool:
+    def _multipart_upload(self, s3_url: str) -> MultipartUpload:
+        """
+        Start uploading an object, with the configured part size and concurrency
+        """
+        return MultipartUpload(
+            self._interface,
+            s3_url,
+            part_size_megabytes=self._part_size_megabytes,
+            concurrency=self._upload_concurrency,
+            checksums=self._upload_checksums,
+        )
+
+    def _check_file(self, package_file: PackageFile) -> bool:
         """
         Check if the file already exists in S3
         """
         s3_url = self._cache_path(package_file)
         return self._interface.exists(s3_url)
 
-    def save_file(self, package_file: PackageFile) -> None:
+    def save_file(self, package_file: PackageFile) -> StreamVerifier:
         """
-        Take a file from an upstream URL and save it
+        Take a file from an upstream URL and save it.
+        The file is verified before the upload is completed,
+        so a corrupt file is never visible in the bucket.
         """
         s3_url = self._cache_path(package_file)
         upstream_url = package_file.upstream_url
 
         logger.debug(f"Uploading {upstream_url} to {s3_url}")
-        with self._interface.open(s3_url, "wb") as fp:
-            with app.http.stream(upstream_url) as response:
+
+        # large files are downloaded as concurrent ranges straight into multipart upload parts
+        source = app.data.storage.segmented.probe(package_file)
+        if source is not None:
+            return self._save_file_segmented(s3_url, source, package_file)
+
+        verifier = StreamVerifier(package_file)
+        # parts upload in the background while the download continues,
+        # and the object isn't visible until the upload is completed
+        upload = self._multipart_upload(s3_url)
+        try:
+            with app.http.hedged_stream(package_file.upstream_urls) as response:
                 for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
-                    fp.write(chunk)  # pyright: ignore
+                    upload.write(chunk)
+                    verifier.update(chunk)
+
+            verifier.verify()
+            upload.complete()
+        except Exception:
+            upload.abort()
+            raise
+
+        # s3fs caches listings, make sure it sees the new object
+        self._interface.invalidate_cache(s3_url)
+        return verifier
+
+    def save_content(self, package_file: PackageFile, content: bytes) -> StreamVerifier:
+        """
+        Save a file we already have the content of
+        """
+        s3_url = self._cache_path(package_file)
+        logger.debug(f"Uploading {package_file.filename} to {s3_url}")
+
+        verifier = StreamVerifier(package_file)
+        verifier.update(content)
+        verifier.verify()
+
+        self._interface.pipe_file(s3_url, content)
+        return verifier
+
+    def open_file(self, package_file: PackageFile) -> IO[bytes]:
+        """
+        Open a stored file for reading. Reads are made as range requests.
+        """
+        return self._interface.open(self._cache_path(package_file), "rb")  # pyright: ignore
+
+    def _list_paths(self) -> Iterator[str]:
+        """
+        List the path of every file in the bucket under the prefix
+        """
+        for key in self._interface.find(f"{self._bucket_name}/{self._bucket_prefix}"):
+            # keys are built the same way as _cache_path, which has an empty segment without a prefix
+            yield key.removeprefix(f"{self._bucket_name}/").removeprefix(f"{self._bucket_prefix}/")
+
+    def _delete_file(self, package_file: PackageFile) -> None:
+        """
+        Delete a stored file
+        """
+        s3_url = self._cache_path(package_file)
+        logger.debug(f"Deleting {s3_url}")
+        try:
+            self._interface.rm_file(s3_url)
+        except FileNotFoundError:
+            pass
+        self._interface.invalidate_cache(s3_url)
+
+    def _save_file_segmented(
+        self, s3_url: str, source: app.data.storage.segmented.RangedSource, package_file: PackageFile
+    ) -> StreamVerifier:
+        """
+        Save a file from a ranged source as a multipart upload.
+        The upload is aborted if any part fails or the file does not verify,
+        so no partial object is left behind.
+        """
+        upload = self._multipart_upload(s3_url)
+        verifier = StreamVerifier(package_file)
+
+        def upload_part(part_number: int, data: bytes) -> None:
+            verifier.update_part(part_number, data)
+            upload.upload_part(part_number, data)
+
+        try:
+            app.data.storage.segmented.download_to_parts(source, upload_part)
+            verifier.verify()
+            upload.complete()
+        except Exception:
+            upload.abort()
+            raise
+
+        # s3fs caches listings, make sure it sees the new object
+        self._interface.invalidate_cache(s3_url)
+        return verifier
+
+    def save_local_file(self, package_file: PackageFile, local_path: pathlib.Path) -> None:
+        """
+        Upload a file that has already been saved and verified locally
+        """
+        s3_url = self._cache_path(package_file)
+        logger.debug(f"Uploading {local_path} to {s3_url}")
+
+        upload = self._multipart_upload(s3_url)
+        try:
+            with open(local_path, "rb") as fp:
+                while chunk := fp.read(DOWNLOAD_CHUNK_SIZE):
+                    upload.write(chunk)
+            upload.complete()
+        except Exception:
+            upload.abort()
+            raise
+
+        self._interface.invalidate_cache(s3_url)
+
+    def download_file(self, package_file: PackageFile, local_path: pathlib.Path) -> None:
+        """
+        Download a stored file to the local filesystem
+        """
+        s3_url = self._cache_path(package_file)
+        logger.debug(f"Downloading {s3_url} to {local_path}")
+        self._interface.get_file(s3_url, str(local_path))
 
     def send_file(self, package_file: PackageFile) -> werkzeug.wrappers.response.Response:
         """
@@ -0,0 +1,197 @@
+"""
+Download large upstream files as concurrent byte ranges, rather than a single stream
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import dataclasses
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Callable
+
+import requests
+from loguru import logger
+
+import app.http
+from app.config import Config
+from app.constants import DOWNLOAD_CHUNK_SIZE, MEGABYTES_TO_BYTES, SEGMENTED_DOWNLOAD_WINDOW_FACTOR
+from app.models.exceptions import IncompleteDownloadError
+
+if TYPE_CHECKING:
+    from app.models.package_file import PackageFile  # pragma: no cover
+
+
+@dataclasses.dataclass
+class RangedSource:
+    """
+    Dataclass to hold an upstream URL that supports range requests, and the file size
+    """
+
+    url: str
+    size: int
+
+
+def plan_ranges(size: int, part_size: int) -> list[tuple[int, int]]:
+    """
+    Split a file size into inclusive byte ranges of at most part_size bytes
+    """
+    return [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+
+def probe(package_file: PackageFile) -> RangedSource | None:
+    """
+    Determine if a file should be downloaded in segments.
+    Returns None if segmented downloads are disabled, the file is too small,
+    or the upstream does not support range requests.
+    """
+    config = Config.storage.segmented_download
+    if not config.enabled:
+        return None
+
+    threshold = config.threshold_megabytes * MEGABYTES_TO_BYTES
+    # skip the extra request for files we already know are small
+    if package_file.size is not None and package_file.size < threshold:
+        return None
+
+    try:
+        response = app.http.hedged_head(package_file.upstream_urls)
+    except requests.exceptions.RequestException as e:
+        logger.debug(f"Unable to probe {package_file.upstream_url} for range support: {e}")
+        return None
+
+    if response.headers.get("Accept-Ranges") != "bytes" or "Content-Encoding" in response.headers:
+        return None
+
+    size = int(response.headers.get("Content-Length", 0))
+    if size < threshold:
+        return None
+
+    # use the final URL, so each range doesn't have to follow redirects again
+    return RangedSource(url=response.url, size=size)
+
+
+def _fetch_range(
+    session: requests.Session, url: str, start: int, end: int, on_chunk: Callable[[int, bytes], None]
+) -> None:
+    """
+    Fetch an inclusive byte range, passing each chunk and its offset to on_chunk.
+    If the connection drops, the range is resumed from the last byte received.
+    """
+    retries = Config.storage.segmented_download.retries
+    offset = start
+
+    for attempt in range(retries + 1):
+        try:
+            with app.http.stream_range(url, offset, end, session=session) as response:
+                # a 200 would be the whole file
+                if response.status_code != requests.codes.partial_content:
+                    raise IncompleteDownloadError(f"{url} returned {response.status_code} for a range request")
+
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    on_chunk(offset, chunk)
+                    offset += len(chunk)
+
+            if offset != end + 1:
+                raise IncompleteDownloadError(f"Range {start}-{end} of {url} ended at {offset}")
+            return
+
+        except (requests.exceptions.RequestException, IncompleteDownloadError) as e:
+            if attempt == retries:
+                raise
+            logger.warning(f"Retrying range {offset}-{end} of {url}: {e}")
+            time.sleep(2**attempt)
+
+
+def _map_ranges(
+    source: RangedSource,
+    func: Callable[[requests.Session, int, int, int], None],
+    skip: set[int] | None = None,
+    window: int | None = None,
+) -> None:
+    """
+    Run a function over every planned range of a source concurrently.
+    The function receives a per-thread session, the 1-based part number, and the range.
+    Part numbers in skip are not run.
+    If window is given, a part is only started once it is within that many parts
+    of the earliest unfinished one, so a slow part can't let the rest run far ahead.
+    """
+    config = Config.storage.segmented_download
+    ranges = plan_ranges(source.size, config.part_size_megabytes * MEGABYTES_TO_BYTES)
+    skip = skip or set()
+    logger.debug(f"Downloading {source.url} in {len(ranges) - len(skip)} parts with {config.concurrency} connections")
+
+    # reuse a connection per thread
+    local = threading.local()
+
+    def run(part_number: int, start: int, end: int) -> None:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        func(local.session, part_number, start, end)
+
+    parts = [(i + 1, start, end) for i, (start, end) in enumerate(ranges) if i + 1 not in skip]
+    window = window or len(parts)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=config.concurrency) as executor:
+        running: dict[concurrent.futures.Future[None], int] = {}
+        next_index = 0
+        try:
+            while next_index < len(parts) or running:
+                # start every part within the window of the earliest unfinished one
+                earliest = min(running.values()) if running else parts[next_index][0]
+                while next_index < len(parts) and parts[next_index][0] < earliest + window:
+                    part_number, start, end = parts[next_index]
+                    running[executor.submit(run, part_number, start, end)] = part_number
+                    next_index += 1
+
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    future.result()
+        except Exception:
+            # stop queued parts, the caller will clean up
+            for future in running:
+                future.cancel()
+            raise
+
+
+def download_to_file(
+    source: RangedSource,
+    fd: int,
+    skip: set[int] | None = None,
+    on_part_done: Callable[[int], None] | None = None,
+) -> None:
+    """
+    Download a source into a preallocated file descriptor, writing each range in place.
+    Part numbers in skip are assumed to already be written, and on_part_done is called
+    with each part number once it has been fully written, so a download can be resumed.
+    """
+
+    def write(offset: int, chunk: bytes) -> None:
+        os.pwrite(fd, chunk, offset)
+
+    def fetch(session: requests.Session, part_number: int, start: int, end: int) -> None:
+        _fetch_range(session, source.url, start, end, write)
+        if on_part_done is not None:
+            on_part_done(part_number)
+
+    _map_ranges(source, fetch, skip=skip)
+
+
+def download_to_parts(source: RangedSource, upload_part: Callable[[int, bytes], None]) -> None:
+    """
+    Download a source as multipart upload parts.
+    Each range is buffered in memory, then passed to upload_part with its part number.
+    Parts finish out of order, so only a window of parts past the earliest unfinished
+    one are downloaded at once, to bound how many are held waiting for it.
+    """
+
+    def fetch_and_upload(session: requests.Session, part_number: int, start: int, end: int) -> None:
+        buffer = bytearray()
+        # resumes append to the buffer, so the offset can be ignored
+        _fetch_range(session, source.url, start, end, lambda _, chunk: buffer.extend(chunk))
+        upload_part(part_number, bytes(buffer))
+
+    window = Config.storage.segmented_download.concurrency * SEGMENTED_DOWNLOAD_WINDOW_FACTOR
+    _map_ranges(source, fetch_and_upload, window=window)
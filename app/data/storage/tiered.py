@@ -0,0 +1,192 @@
+"""
+Keep a size-bounded local copy of recently used files in front of S3.
+S3 remains the source of truth, the local directory is only ever a cache of it.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import os
+import pathlib
+import threading
+import time
+import uuid
+from typing import IO, TYPE_CHECKING, Iterator
+
+import flask
+from loguru import logger
+
+from app.constants import MEGABYTES_TO_BYTES, PARTIAL_EXTENSION, TIERED_USAGE_SCAN_SECONDS
+from app.data.storage.base import BaseStorage
+from app.data.storage.filesystem import list_files
+
+if TYPE_CHECKING:
+    from app.data.storage.filesystem import FilesystemStorage  # pragma: no cover
+    from app.data.storage.integrity import StreamVerifier  # pragma: no cover
+    from app.data.storage.s3 import S3Storage  # pragma: no cover
+    from app.models.package_file import PackageFile  # pragma: no cover
+
+
+def evict(directory: pathlib.Path, max_bytes: int, keep: pathlib.Path | None = None) -> tuple[int, int]:
+    """
+    Delete the least recently used files in a directory tree until it is under max_bytes.
+    Recency is the modification time, which is bumped whenever a file is served.
+    The keep path is never deleted. Returns the number of bytes freed, and the number left.
+    """
+    files = []
+    total = 0
+    for entry in list_files(directory):
+        try:
+            stat = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            # removed by another worker
+            continue
+        files.append((stat.st_mtime, stat.st_size, pathlib.Path(entry.path)))
+        total += stat.st_size
+
+    freed = 0
+    for _, size, path in sorted(files):
+        if total - freed <= max_bytes:
+            break
+        if keep is not None and path == keep:
+            continue
+
+        logger.debug(f"Evicting {path} from local storage")
+        path.unlink(missing_ok=True)
+        freed += size
+
+        # don't leave empty content address directories behind
+        with contextlib.suppress(OSError):
+            path.parent.rmdir()
+
+    return freed, total - freed
+
+
+class TieredStorage(BaseStorage):
+    def __init__(self, local: FilesystemStorage, remote: S3Storage, max_megabytes: int) -> None:
+        super().__init__()
+        self._local = local
+        self._remote = remote
+        self._max_bytes = max_megabytes * MEGABYTES_TO_BYTES
+        # only one thread per process needs to walk the directory at a time
+        self._evict_lock = threading.Lock()
+        # size of the local directory as of the last walk, plus what this process has added since.
+        # The first file added triggers a walk
+        self._usage_bytes = 0
+        self._next_scan = 0.0
+        self._usage_lock = threading.Lock()
+
+    def _enforce_limit(self, keep: pathlib.Path) -> None:
+        """
+        Count a file added to the local directory, then evict local files if the directory is
+        over its limit, or hasn't been walked in a while. Skipped if another thread is already evicting.
+        """
+        try:
+            size = keep.stat().st_size
+        except FileNotFoundError:
+            return
+
+        with self._usage_lock:
+            self._usage_bytes += size
+            if self._usage_bytes <= self._max_bytes and time.monotonic() < self._next_scan:
+                return
+
+        if not self._evict_lock.acquire(blocking=False):
+            return
+
+        try:
+            _, remaining = evict(self._local.directory, self._max_bytes, keep=keep)
+            with self._usage_lock:
+                self._usage_bytes = remaining
+                self._next_scan = time.monotonic() + TIERED_USAGE_SCAN_SECONDS
+        finally:
+            self._evict_lock.release()
+
+    def _pull(self, package_file: PackageFile) -> pathlib.Path:
+        """
+        Copy a file from S3 to local storage.
+        Each download gets its own partial file, so concurrent misses don't collide.
+        """
+        local_path = self._local.local_path(package_file)
+        partial_path = local_path.with_name(f"{local_path.name}.{uuid.uuid4().hex}{PARTIAL_EXTENSION}")
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+
+        try:
+            self._remote.download_file(package_file, partial_path)
+            partial_path.replace(local_path)
+        finally:
+            partial_path.unlink(missing_ok=True)
+
+        self._enforce_limit(keep=local_path)
+        return local_path
+
+    def save_file(self, package_file: PackageFile) -> StreamVerifier:
+        """
+        Take a file from an upstream URL and save it locally, then upload the verified file to S3
+        """
+        verifier = self._local.save_file(package_file)
+        local_path = self._local.local_path(package_file)
+        self._remote.save_local_file(package_file, local_path)
+        self._enforce_limit(keep=local_path)
+        return verifier
+
+    def save_content(self, package_file: PackageFile, content: bytes) -> StreamVerifier:
+        """
+        Save a file we already have the content of, to both S3 and local storage
+        """
+        verifier = self._remote.save_content(package_file, content)
+        self._local.save_content(package_file, content)
+        self._enforce_limit(keep=self._local.local_path(package_file))
+        return verifier
+
+    def save_local_file(self, package_file: PackageFile, local_path: pathlib.Path) -> None:
+        """
+        Save a file from elsewhere on the local filesystem, to both S3 and local storage
+        """
+        self._remote.save_local_file(package_file, local_path)
+        self._local.save_local_file(package_file, local_path)
+        self._enforce_limit(keep=self._local.local_path(package_file))
+
+    def open_file(self, package_file: PackageFile) -> IO[bytes]:
+        """
+        Open a stored file for reading, from local storage if it is there
+        """
+        try:
+            return self._local.open_file(package_file)
+        except FileNotFoundError:
+            return self._remote.open_file(package_file)
+
+    def _check_file(self, package_file: PackageFile) -> bool:
+        """
+        Check if a file already exists, only asking S3 if it isn't stored locally
+        """
+        return self._local._check_file(package_file) or self._remote._check_file(package_file)
+
+    def _list_paths(self) -> Iterator[str]:
+        """
+        List the path of every file in S3, which has everything stored locally too
+        """
+        return self._remote._list_paths()
+
+    def _delete_file(self, package_file: PackageFile) -> None:
+        """
+        Delete a stored file from S3, and from local storage if it is there
+        """
+        self._remote._delete_file(package_file)
+        self._local._delete_file(package_file)
+
+    def send_file(self, package_file: PackageFile) -> flask.Response:
+        """
+        Download a file from local storage, copying it from S3 first if needed
+        """
+        local_path = self._local.local_path(package_file)
+        try:
+            # mark it as recently used
+            os.utime(local_path)
+            return self._local.send_file(package_file)
+        except FileNotFoundError:
+            # either never copied locally, or evicted since
+            logger.debug(f"{package_file.filename} is not stored locally, copying from S3")
+
+        self._pull(package_file)
+        return self._local.send_file(package_file)
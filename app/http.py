@@ -2,17 +2,38 @@
 Standardize HTTP requests so we can include our user agent
 """
 
+import collections
+import concurrent.futures
+import dataclasses
+import statistics
+import threading
+import time
+from typing import Callable
+from urllib.parse import urlsplit
+
 import requests
+from loguru import logger
+
+from app.constants import (
+    DOWNLOAD_CONNECT_TIMEOUT_SECONDS,
+    DOWNLOAD_READ_TIMEOUT_SECONDS,
+    HEDGE_DEFAULT_DELAY_SECONDS,
+    HEDGE_FAILURE_COOLDOWN_SECONDS,
+    HEDGE_LATENCY_PERCENTILE,
+    HEDGE_LATENCY_SAMPLES,
+    HEDGE_MIN_SAMPLES,
+)
 
 USER_AGENT = "MyPyPI2 (https://github.com/NathanVaughn/mypypi2)"
+DOWNLOAD_TIMEOUT = (DOWNLOAD_CONNECT_TIMEOUT_SECONDS, DOWNLOAD_READ_TIMEOUT_SECONDS)
 
 
-def stream(url: str) -> requests.Response:
+def stream(url: str, headers: dict[str, str] | None = None) -> requests.Response:
     """
     Stream a URL
     """
-    headers = {"User-Agent": USER_AGENT}
-    return requests.get(url, stream=True, headers=headers)
+    headers = {**(headers or {}), "User-Agent": USER_AGENT}
+    return requests.get(url, stream=True, headers=headers, timeout=DOWNLOAD_TIMEOUT)
 
 
 def get(url: str, headers: dict[str, str], timeout: int) -> requests.Response:
@@ -21,3 +42,236 @@ def get(url: str, headers: dict[str, str], timeout: int) -> requests.Response:
     """
     headers["User-Agent"] = USER_AGENT
     return requests.get(url, headers=headers, timeout=timeout)
+
+
+def head(url: str) -> requests.Response:
+    """
+    Get the headers for a URL, following redirects
+    """
+    headers = {"User-Agent": USER_AGENT}
+    return requests.head(url, headers=headers, allow_redirects=True, timeout=DOWNLOAD_TIMEOUT)
+
+
+def stream_range(url: str, start: int, end: int, session: requests.Session | None = None) -> requests.Response:
+    """
+    Stream an inclusive byte range of a URL
+    """
+    headers = {"User-Agent": USER_AGENT, "Range": f"bytes={start}-{end}"}
+    return (session or requests).get(url, stream=True, headers=headers, timeout=DOWNLOAD_TIMEOUT)
+
+
+@dataclasses.dataclass
+class UpstreamHealth:
+    """
+    Dataclass to hold recent response times and failures for an upstream host
+    """
+
+    latencies: collections.deque[float] = dataclasses.field(
+        default_factory=lambda: collections.deque(maxlen=HEDGE_LATENCY_SAMPLES)
+    )
+    failures: int = 0
+    last_failure: float = 0
+
+    @property
+    def is_failing(self) -> bool:
+        """
+        Has this upstream failed recently?
+        """
+        return self.failures > 0 and time.monotonic() - self.last_failure < HEDGE_FAILURE_COOLDOWN_SECONDS
+
+    @property
+    def typical_latency(self) -> float | None:
+        """
+        Median latency, or None for upstreams we know nothing about yet
+        """
+        if not self.latencies:
+            return None
+        return statistics.median(self.latencies)
+
+    @property
+    def hedge_delay(self) -> float:
+        """
+        How long to wait for this upstream before also asking the next one
+        """
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY_SECONDS
+        return statistics.quantiles(self.latencies, n=100)[HEDGE_LATENCY_PERCENTILE - 1]
+
+
+# health is tracked per host, per process
+_health: dict[str, UpstreamHealth] = collections.defaultdict(UpstreamHealth)
+_health_lock = threading.Lock()
+
+
+def _host(url: str) -> str:
+    """
+    Key upstream health by scheme and host
+    """
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _record_success(url: str, latency: float) -> None:
+    with _health_lock:
+        health = _health[_host(url)]
+        health.latencies.append(latency)
+        health.failures = 0
+
+
+def _record_failure(url: str) -> None:
+    with _health_lock:
+        health = _health[_host(url)]
+        health.failures += 1
+        health.last_failure = time.monotonic()
+
+
+def _is_upstream_fault(e: Exception) -> bool:
+    """
+    Client errors like a 404 are an answer, not a sign the upstream is unhealthy
+    """
+    if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+        return e.response.status_code >= 500
+    return True
+
+
+def order_by_health(urls: list[str]) -> list[str]:
+    """
+    Order equivalent URLs so that recently failing upstreams go last,
+    and the rest are ordered by typical latency.
+    Upstreams we know nothing about yet are assumed to be typical of the others,
+    so they get tried without jumping ahead of a healthy upstream.
+    Ties keep the configured order.
+    """
+    with _health_lock:
+        latencies = {url: _health[_host(url)].typical_latency for url in urls}
+        failing = {url: _health[_host(url)].is_failing for url in urls}
+
+    known = [latency for latency in latencies.values() if latency is not None]
+    prior = statistics.median(known) if known else HEDGE_DEFAULT_DELAY_SECONDS
+
+    def key(url: str) -> tuple[bool, float]:
+        latency = latencies[url]
+        return failing[url], prior if latency is None else latency
+
+    return sorted(urls, key=key)
+
+
+def hedged(urls: list[str], request: Callable[[str], requests.Response]) -> requests.Response:
+    """
+    Make a request against a list of equivalent URLs and return the first successful response.
+    If an upstream hasn't answered within its usual latency percentile,
+    the next upstream is asked as well. An error moves on to the next upstream immediately.
+    The request function should raise for unsuccessful responses.
+    If every upstream fails, a timeout is raised in preference to any other error,
+    as that does not prove the resource is missing.
+    """
+    if len(urls) == 1:
+        # nothing to race against
+        return request(urls[0])
+
+    ordered = order_by_health(urls)
+    remaining = collections.deque(ordered)
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(ordered))
+    pending: dict[concurrent.futures.Future, str] = {}
+    errors: list[Exception] = []
+
+    def timed(url: str) -> requests.Response:
+        start = time.monotonic()
+        response = request(url)
+        _record_success(url, time.monotonic() - start)
+        return response
+
+    def launch() -> str:
+        url = remaining.popleft()
+        pending[executor.submit(timed, url)] = url
+        return url
+
+    last_launched = launch()
+
+    try:
+        while pending:
+            timeout = None
+            if remaining:
+                with _health_lock:
+                    timeout = _health[_host(last_launched)].hedge_delay
+
+            done, _ = concurrent.futures.wait(pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            if not done:
+                logger.debug(f"No response from {last_launched} after {timeout:.2f} seconds, hedging")
+                last_launched = launch()
+                continue
+
+            for future in done:
+                url = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    if _is_upstream_fault(e):
+                        _record_failure(url)
+                    errors.append(e)
+                    if remaining:
+                        last_launched = launch()
+                    continue
+
+                # close any responses that arrive from requests we no longer need
+                for loser in pending:
+                    loser.add_done_callback(_close_response)
+                return response
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    for e in errors:
+        if isinstance(e, requests.exceptions.Timeout):
+            raise e
+    raise errors[0]
+
+
+def _close_response(future: concurrent.futures.Future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def hedged_get(urls: list[str], headers: dict[str, str], timeout: int) -> requests.Response:
+    """
+    Get the first successful response from a list of equivalent URLs
+    """
+
+    def request(url: str) -> requests.Response:
+        response = get(url, headers=dict(headers), timeout=timeout)
+        response.raise_for_status()
+        return response
+
+    return hedged(urls, request)
+
+
+def hedged_head(urls: list[str]) -> requests.Response:
+    """
+    Get the headers from the first successful response from a list of equivalent URLs
+    """
+
+    def request(url: str) -> requests.Response:
+        response = head(url)
+        response.raise_for_status()
+        return response
+
+    return hedged(urls, request)
+
+
+def hedged_stream(urls: list[str], headers: dict[str, str] | None = None) -> requests.Response:
+    """
+    Stream the first successful response from a list of equivalent URLs.
+    Only the time to receive headers is raced, the body comes from a single upstream.
+    """
+
+    def request(url: str) -> requests.Response:
+        response = stream(url, headers=headers)
+        try:
+            response.raise_for_status()
+        except requests.exceptions.HTTPError:
+            response.close()
+            raise
+        return response
+
+    return hedged(urls, request)
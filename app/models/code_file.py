@@ -4,14 +4,12 @@ import datetime
 from typing import TYPE_CHECKING
 
 from sqlalchemy import Boolean, DateTime, Integer, Text
-from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.models.package_file import PackageFile
 from app.utils import url_for_scheme
 
 if TYPE_CHECKING:
-    from app.models.code_file_hash import CodeFileHash  # pragma: no cover
     from app.models.metadata_file import MetadataFile  # pragma: no cover
 
 
@@ -32,10 +30,6 @@ class CodeFile(PackageFile):
     """
     Yanked string. We always show yanked files, but we keep the value here.
     """
-    size: Mapped[int | None] = mapped_column(Integer, nullable=True, default=None)
-    """
-    File size in bytes
-    """
     upload_time: Mapped[datetime.datetime | None] = mapped_column(DateTime, nullable=True, default=None)
     """
     Upload time of the file
@@ -50,16 +44,9 @@ class CodeFile(PackageFile):
     # with lots of files. Without this, every single record
     # with a metadata file would result in a seperate query.
     metadata_file: Mapped[MetadataFile | None] = relationship(
-        "MetadataFile", back_populates="code_file", lazy="joined", cascade="delete"
+        "MetadataFile", back_populates="code_file", lazy="joined", cascade="save-update, merge, delete"
     )
 
-    @declared_attr
-    def hashes(cls) -> Mapped[list[CodeFileHash]]:
-        """
-        A list of hashes for this file
-        """
-        return relationship("CodeFileHash", back_populates="code_file", lazy="joined", cascade="delete")
-
     # utility properties
     @property
     def yanked(self) -> bool | str:
@@ -109,19 +96,15 @@ class CodeFile(PackageFile):
         self.requires_python = new.requires_python
         self.is_yanked = new.is_yanked
         self.yanked_reason = new.yanked_reason
-        self.size = new.size
+        # the size upstream reports is only a hint once we've verified the file ourselves
+        if self.sha256 is None:
+            self.size = new.size
         self.upload_time = new.upload_time
         self.sort_order = new.sort_order
 
-        # hashes
-        if self.hashes_dict != new.hashes_dict:
-            # taking incoming hashes and add new ones
-            for h in new.hashes:
-                # if we don't have this hash, add it
-                if h.kind not in self.hashes:
-                    h.code_file = self
-
-                # don't update existing hashes
+        # add new hashes, but don't update existing ones
+        for kind, value in new.hashes_dict.items():
+            self.add_hash(kind, value)
 
         # metadata file
         if self.metadata_file:
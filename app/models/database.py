@@ -12,6 +12,7 @@ from sqlalchemy import Uuid, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 from app.config import Config
+from app.models.routing import RoutingSession
 
 if TYPE_CHECKING:
     from flask import Flask
@@ -29,7 +30,8 @@ class Base(DeclarativeBase):
     # have to wait for the parents to be inserted first.
 
 
-db = SQLAlchemy(model_class=Base)
+# reads go to replicas when they are configured
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
 
 
 def init_db(flask_app: Flask, create: bool = False) -> None:
@@ -44,11 +46,12 @@ def init_db(flask_app: Flask, create: bool = False) -> None:
 
     # import models so sqlalchemy knows about them
     from app.models.code_file import CodeFile  # noqa
-    from app.models.code_file_hash import CodeFileHash  # noqa
+    from app.models.download_job import DownloadJob  # noqa
     from app.models.metadata_file import MetadataFile  # noqa
-    from app.models.metadata_file_hash import MetadataFileHash  # noqa
     from app.models.package import Package  # noqa
     from app.models.repository import Repository  # noqa
+    from app.models.repository_member import RepositoryMember  # noqa
+    from app.models.repository_mirror import RepositoryMirror  # noqa
     from app.models.cache import Cache  # noqa
 
     with flask_app.app_context():
@@ -65,28 +68,82 @@ def init_db(flask_app: Flask, create: bool = False) -> None:
         # this will not create tables if they already exist
         db.create_all()
 
-        import app.data.sql
-
-        # load configured repositories
-        for repository_config in Config.repositories:
-            repository = app.data.sql.get_repository(repository_config.slug)
-
-            if repository is None:
-                # create new repository if it doesn't exist
-                logger.debug(f"Adding repository {repository_config.slug}")
-                db.session.add(
-                    Repository(
-                        slug=repository_config.slug,
-                        simple_url=str(repository_config.simple_url),
-                        cache_minutes=repository_config.cache_minutes,
-                        timeout_seconds=repository_config.timeout_seconds,
-                    )
-                )
-            else:
-                # update existing repository
-                repository.simple_url = str(repository_config.simple_url)
-                repository.cache_minutes = repository_config.cache_minutes
-                repository.timeout_seconds = repository_config.timeout_seconds
+        import app.models.migrations
+
+        # create_all won't add new columns to existing tables
+        app.models.migrations.add_missing_columns(db.engine)
+        app.models.migrations.widen_integer_columns(db.engine)
+        app.models.migrations.fold_hash_tables(db.engine)
 
+        load_repositories()
         db.session.commit()
         logger.success("Database ready")
+
+
+def load_repositories() -> None:
+    """
+    Create or update repositories, with their mirrors and members, from the config.
+    Changes are left for the caller to commit.
+    """
+    import app.data.sql
+    from app.models.repository import Repository
+    from app.models.repository_member import RepositoryMember
+    from app.models.repository_mirror import RepositoryMirror
+
+    # load configured repositories
+    for repository_config in Config.repositories:
+        repository = app.data.sql.get_repository(repository_config.slug)
+        # virtual repositories have no upstream of their own
+        simple_url = str(repository_config.simple_url or "")
+
+        if repository is None:
+            # create new repository if it doesn't exist
+            logger.debug(f"Adding repository {repository_config.slug}")
+            db.session.add(
+                Repository(
+                    slug=repository_config.slug,
+                    simple_url=simple_url,
+                    cache_minutes=repository_config.cache_minutes,
+                    timeout_seconds=repository_config.timeout_seconds,
+                    synthesize_metadata=repository_config.synthesize_metadata,
+                    prefetch_metadata_versions=repository_config.prefetch_metadata_versions,
+                    is_offline=repository_config.offline,
+                    configured_offline=repository_config.offline,
+                )
+            )
+        else:
+            # update existing repository
+            repository.simple_url = simple_url
+            repository.cache_minutes = repository_config.cache_minutes
+            repository.timeout_seconds = repository_config.timeout_seconds
+            repository.synthesize_metadata = repository_config.synthesize_metadata
+            repository.prefetch_metadata_versions = repository_config.prefetch_metadata_versions
+            # anything set at runtime with `flask offline` is kept, unless the config has changed since
+            if repository.configured_offline != repository_config.offline:
+                repository.is_offline = repository_config.offline
+                repository.configured_offline = repository_config.offline
+
+    # link repositories to their mirrors and members, now that all repositories exist
+    db.session.flush()
+    for repository_config in Config.repositories:
+        repository = app.data.sql.get_repository_with_exception(repository_config.slug)
+
+        mirror_urls = [str(mirror_url).rstrip("/") for mirror_url in repository_config.mirror_urls]
+        if [mirror.simple_url for mirror in repository.mirrors] != mirror_urls:
+            logger.debug(f"Setting mirrors of repository {repository_config.slug}")
+            repository.mirrors.clear()
+            db.session.flush()
+            for priority, mirror_url in enumerate(mirror_urls):
+                repository.mirrors.append(RepositoryMirror(simple_url=mirror_url, priority=priority))
+
+        if [member.member.slug for member in repository.members] == repository_config.members:
+            continue
+
+        logger.debug(f"Setting members of repository {repository_config.slug}")
+        # remove old members first to not trip the unique constraint
+        repository.members.clear()
+        db.session.flush()
+        for priority, member_slug in enumerate(repository_config.members):
+            repository.members.append(
+                RepositoryMember(member=app.data.sql.get_repository_with_exception(member_slug), priority=priority)
+            )
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import datetime
+import uuid
+
+from sqlalchemy import BigInteger, DateTime, Enum, Integer, Text, UniqueConstraint, Uuid
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.database import Base
+from app.models.enums import DownloadJobStatus
+
+
+class DownloadJob(Base):
+    """
+    This model represents a package file waiting to be downloaded to storage, or being downloaded.
+    Jobs are claimed by download workers, so downloads happen outside of web requests.
+    """
+
+    __tablename__ = "download_job"
+    __table_args__ = (UniqueConstraint("file_table", "package_file_id"),)
+
+    file_table: Mapped[str] = mapped_column(Text)
+    """
+    Table of the package file to download
+    """
+    package_file_id: Mapped[uuid.UUID] = mapped_column(Uuid)
+    """
+    ID of the package file to download
+    """
+    status: Mapped[DownloadJobStatus] = mapped_column(
+        Enum(DownloadJobStatus, native_enum=False), default=DownloadJobStatus.queued, index=True
+    )
+    """
+    Where the job is up to
+    """
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    """
+    Number of failed attempts so far
+    """
+    next_attempt_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.now)
+    """
+    When the job can next be claimed. Pushed back after each failure.
+    """
+    worker: Mapped[str | None] = mapped_column(Text, nullable=True, default=None)
+    """
+    Worker that claimed the job
+    """
+    heartbeat_at: Mapped[datetime.datetime | None] = mapped_column(DateTime, nullable=True, default=None)
+    """
+    Last time the worker reported progress. Jobs that stop reporting are claimed again.
+    """
+    bytes_done: Mapped[int] = mapped_column(BigInteger, default=0)
+    """
+    Bytes downloaded so far
+    """
+    bytes_total: Mapped[int | None] = mapped_column(BigInteger, nullable=True, default=None)
+    """
+    Expected size of the file, if known
+    """
+    error: Mapped[str | None] = mapped_column(Text, nullable=True, default=None)
+    """
+    Error from the last failed attempt
+    """
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.now)
+    """
+    When the job was first queued
+    """
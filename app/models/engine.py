@@ -0,0 +1,62 @@
+"""
+Build the options each database engine is created with
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+import sqlalchemy
+import sqlalchemy.pool
+from sqlalchemy.orm import SessionTransaction
+
+from app.config import Config
+from app.models.routing import RoutingSession
+
+
+def _statement_timeout_milliseconds() -> int | None:
+    if Config.database.statement_timeout_seconds is None:
+        return None
+    return int(Config.database.statement_timeout_seconds * 1000)
+
+
+def engine_options(url: str) -> dict[str, Any]:
+    """
+    Pool and connection options for an engine. Every worker process has its own pool,
+    so the most connections to a database is the number of workers times pool_size plus max_overflow.
+    SQLite is left to Flask-SQLAlchemy, which picks a pool that suits the file or memory database.
+    """
+    if not url.startswith("postgresql://"):
+        return {}
+
+    config = Config.database
+    if config.pgbouncer:
+        # PgBouncer pools connections itself, so holding them here would only tie them up.
+        # It also rejects startup options, so the statement timeout is set per transaction instead
+        return {"poolclass": sqlalchemy.pool.NullPool}
+
+    options: dict[str, Any] = {
+        "pool_size": config.pool_size,
+        "max_overflow": config.max_overflow,
+        "pool_timeout": config.pool_timeout_seconds,
+        "pool_recycle": config.pool_recycle_seconds,
+        "pool_pre_ping": config.pool_pre_ping,
+    }
+
+    timeout = _statement_timeout_milliseconds()
+    if timeout is not None:
+        options["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+    return options
+
+
+@sqlalchemy.event.listens_for(RoutingSession, "after_begin")
+def set_local_statement_timeout(
+    session: RoutingSession, transaction: SessionTransaction, connection: sqlalchemy.Connection
+) -> None:
+    """
+    Behind PgBouncer, a server connection only belongs to us for the length of a transaction,
+    so the statement timeout is set for each transaction
+    """
+    timeout = _statement_timeout_milliseconds()
+    if Config.database.pgbouncer and timeout is not None and connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout}")
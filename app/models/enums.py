@@ -4,3 +4,10 @@ import enum
 class IndexFormat(enum.Enum):
     html = "html"
     json = "json"
+
+
+class DownloadJobStatus(enum.Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
@@ -34,6 +34,30 @@ class IndexTimeoutError(Exception):
     """
 
 
+class IndexNotModified(Exception):
+    """
+    Exception raised when an index hasn't changed since it was last fetched
+    """
+
+
+class IncompleteDownloadError(Exception):
+    """
+    Exception raised when an upstream file download ends early or is unusable
+    """
+
+
+class FileIntegrityError(Exception):
+    """
+    Exception raised when a downloaded file does not match the size or hash reported by upstream
+    """
+
+
+class MigrationError(Exception):
+    """
+    Exception raised when an existing database cannot be brought up to date automatically
+    """
+
+
 class PackageNotFound(HTTPException):
     """
     Exception raised when a repository is not found
@@ -71,6 +95,54 @@ class PackageFileNotFound(HTTPException):
         super().__init__(description=f"Package file {filename} not found in {package.log_name}")
 
 
+class MetadataUnavailable(HTTPException):
+    """
+    Exception raised when metadata cannot be extracted from a code file
+    """
+
+    code = HTTPStatus.NOT_FOUND
+
+    def __init__(self, filename: str, reason: str):
+        super().__init__(description=f"Metadata for {filename} is not available: {reason}")
+
+
+class FileNotAvailableOffline(HTTPException):
+    """
+    Exception raised when a file isn't in storage and its repository is offline
+    """
+
+    code = HTTPStatus.NOT_FOUND
+
+    def __init__(self, filename: str):
+        super().__init__(description=f"{filename} is not available while its repository is offline")
+
+
+class DownloadPending(HTTPException):
+    """
+    Exception raised when a file is still being downloaded by a download worker
+    """
+
+    code = HTTPStatus.SERVICE_UNAVAILABLE
+
+    def __init__(self, filename: str, retry_after: int):
+        super().__init__(description=f"{filename} is still being downloaded, try again shortly")
+        self.retry_after = retry_after
+
+    def get_headers(self, *args, **kwargs) -> list[tuple[str, str]]:
+        return [*super().get_headers(*args, **kwargs), ("Retry-After", str(self.retry_after))]
+
+
+class DownloadFailed(HTTPException):
+    """
+    Exception raised when a download worker gave up on a file
+    """
+
+    code = HTTPStatus.BAD_GATEWAY
+
+    def __init__(self, filename: str, error: str | None):
+        super().__init__(description=f"Unable to download {filename}: {error}")
+
+
 class IndexParsingError(HTTPException):
     """
     Exception raised when upstream index data cannot be parsed
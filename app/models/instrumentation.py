@@ -0,0 +1,101 @@
+"""
+Count the SQL statements, rows, database time, and connections used by each request,
+so the routes putting load on the database can be found
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import time
+from typing import Any
+
+import flask
+import sqlalchemy
+import sqlalchemy.pool
+
+
+@dataclasses.dataclass
+class QueryStats:
+    """
+    Dataclass to hold the database use of a single request
+    """
+
+    statements: int = 0
+    rows: int = 0
+    seconds: float = 0
+    connections: int = 0
+
+    @property
+    def server_timing(self) -> str:
+        """
+        Server-Timing header value, which shows up in browser developer tools
+        """
+        return f'db;dur={self.seconds * 1000:.1f};desc="{self.statements} statements, {self.rows} rows"'
+
+    def __str__(self) -> str:
+        return (
+            f"{self.statements} statements, {self.rows} rows, {self.connections} connections "
+            f"in {self.seconds * 1000:.1f}ms"
+        )
+
+
+def start() -> None:
+    """
+    Start counting for the current request
+    """
+    flask.g.query_stats = QueryStats()
+
+
+def get_stats() -> QueryStats | None:
+    """
+    Database use of the current request so far, if it is being counted
+    """
+    if not flask.has_request_context():
+        return None
+    return flask.g.get("query_stats")
+
+
+def _before_cursor_execute(
+    connection: sqlalchemy.Connection,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: sqlalchemy.engine.ExecutionContext | None,
+    executemany: bool,
+) -> None:
+    # kept on the statement's own context, so nothing is left behind if it raises
+    if context is not None:
+        context.query_start = time.perf_counter()  # type: ignore[attr-defined]
+
+
+def _after_cursor_execute(
+    connection: sqlalchemy.Connection,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: sqlalchemy.engine.ExecutionContext | None,
+    executemany: bool,
+) -> None:
+    started = getattr(context, "query_start", None)
+    stats = get_stats()
+    if stats is not None and started is not None:
+        stats.statements += 1
+        # not every driver knows how many rows a select returned
+        stats.rows += max(cursor.rowcount, 0)
+        stats.seconds += time.perf_counter() - started
+
+
+def _checkout(*args: Any) -> None:
+    stats = get_stats()
+    if stats is not None:
+        stats.connections += 1
+
+
+def install() -> None:
+    """
+    Listen to every engine and pool
+    """
+    if not sqlalchemy.event.contains(sqlalchemy.Engine, "before_cursor_execute", _before_cursor_execute):
+        sqlalchemy.event.listen(sqlalchemy.Engine, "before_cursor_execute", _before_cursor_execute)
+        sqlalchemy.event.listen(sqlalchemy.Engine, "after_cursor_execute", _after_cursor_execute)
+        sqlalchemy.event.listen(sqlalchemy.pool.Pool, "checkout", _checkout)
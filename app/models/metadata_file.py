@@ -3,15 +3,13 @@ from __future__ import annotations
 import uuid
 from typing import TYPE_CHECKING
 
-from sqlalchemy import ForeignKey
-from sqlalchemy.ext.declarative import declared_attr
+from sqlalchemy import Boolean, ForeignKey, false
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.models.package_file import PackageFile
 
 if TYPE_CHECKING:
     from app.models.code_file import CodeFile  # pragma: no cover
-    from app.models.metadata_file_hash import MetadataFileHash  # pragma: no cover
 
 
 class MetadataFile(PackageFile):
@@ -25,13 +23,18 @@ class MetadataFile(PackageFile):
 
     code_file_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("code_file.id"))
     code_file: Mapped[CodeFile] = relationship("CodeFile", back_populates="metadata_file", lazy="joined")
+    is_synthesized: Mapped[bool] = mapped_column(Boolean, default=False, server_default=false())
+    """
+    Upstream doesn't provide this file, so it is extracted from the code file.
+    The upstream URL is that of the code file.
+    """
 
-    @declared_attr
-    def hashes(cls) -> Mapped[list[MetadataFileHash]]:
+    @property
+    def has_upstream(self) -> bool:
         """
-        A list of hashes for this file
+        Synthesized metadata files only exist inside the upstream code file
         """
-        return relationship("MetadataFileHash", back_populates="metadata_file", lazy="joined", cascade="delete")
+        return not self.is_synthesized
 
     def update(self, new: MetadataFile) -> None:
         """
@@ -43,13 +46,16 @@ class MetadataFile(PackageFile):
         # self.filename = new.filename
         self.upstream_url = new.upstream_url
         self.version = new.version
-
-        # hashes
-        if self.hashes_dict != new.hashes_dict:
-            # taking incoming hashes and add new ones
-            for h in new.hashes:
-                # if we don't have this hash, add it
-                if h.kind not in self.hashes:
-                    h.metadata_file = self
-
-                # don't update existing hashes
+        if self.is_synthesized and not new.is_synthesized:
+            # upstream publishes this file now, so ours and the hashes we recorded for it are replaced,
+            # and theirs is fetched and verified when next requested
+            self.is_cached = False
+            self.storage_path = None
+            self.size = new.size
+            self.sha256 = None
+            self._hashes = {}
+        self.is_synthesized = new.is_synthesized
+
+        # add new hashes, but don't update existing ones
+        for kind, value in new.hashes_dict.items():
+            self.add_hash(kind, value)
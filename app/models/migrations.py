@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import sqlalchemy
+from loguru import logger
+from sqlalchemy.schema import CreateColumn
+
+from app.models.database import Base
+from app.models.exceptions import MigrationError
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine import Connection, Engine
+
+
+def add_missing_columns(engine: Engine) -> None:
+    """
+    Add columns to existing tables that were introduced after the tables were created.
+    create_all only creates missing tables, so this covers new columns on old databases.
+    Only columns that are nullable or have a server default can be added this way.
+    Missing indexes are created as well.
+    """
+    inspector = sqlalchemy.inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+
+                if not column.nullable and column.server_default is None:
+                    raise MigrationError(f"Cannot add required column {table.name}.{column.name} to an existing table")
+
+                logger.info(f"Adding column {table.name}.{column.name}")
+                column_definition = CreateColumn(column).compile(dialect=engine.dialect)
+                connection.execute(sqlalchemy.text(f"ALTER TABLE {table.name} ADD COLUMN {column_definition}"))
+
+            # indexes on new columns, or new indexes on old columns
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+
+                logger.info(f"Adding index {index.name}")
+                index.create(connection)
+
+
+def widen_integer_columns(engine: Engine) -> None:
+    """
+    Change columns that were created as INTEGER, but are now BIGINT, such as file sizes over 2 GiB.
+    SQLite integers are always 64 bit, so this only applies to PostgreSQL.
+    """
+    if engine.dialect.name != "postgresql":
+        return
+
+    inspector = sqlalchemy.inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_types = {column["name"]: column["type"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                existing_type = existing_types.get(column.name)
+                if (
+                    isinstance(column.type, sqlalchemy.BigInteger)
+                    and isinstance(existing_type, sqlalchemy.Integer)
+                    and not isinstance(existing_type, sqlalchemy.BigInteger)
+                ):
+                    logger.info(f"Changing column {table.name}.{column.name} to BIGINT")
+                    connection.execute(
+                        sqlalchemy.text(f"ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE BIGINT")
+                    )
+
+
+# held while changing data on PostgreSQL, so workers starting together take turns
+MIGRATION_LOCK_KEY = 0x6D797079
+
+# hash tables folded into the hashes column of the file table they belonged to
+HASH_TABLES = {
+    "code_file_hash": ("code_file", "code_file_id"),
+    "metadata_file_hash": ("metadata_file", "metadata_file_id"),
+}
+JSON_OBJECT_AGGREGATES = {
+    "postgresql": "jsonb_object_agg",
+    "sqlite": "json_group_object",
+}
+
+
+def _lock(connection: Connection) -> None:
+    """
+    Wait for any other process migrating the database, then keep it waiting until this transaction ends
+    """
+    if connection.dialect.name == "postgresql":
+        connection.execute(sqlalchemy.text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+
+def _fold_hash_tables(connection: Connection) -> list[str]:
+    """
+    Copy hashes into the hashes column of files that don't have any yet. Returns the hash tables that exist.
+    """
+    aggregate = JSON_OBJECT_AGGREGATES[connection.dialect.name]
+    inspector = sqlalchemy.inspect(connection)
+
+    existing = []
+    for hash_table, (file_table, foreign_key) in HASH_TABLES.items():
+        # checked inside the lock, as another process may have dropped it
+        if not inspector.has_table(hash_table):
+            continue
+
+        existing.append(hash_table)
+        result = connection.execute(
+            sqlalchemy.text(
+                f"UPDATE {file_table} SET hashes = "
+                f"(SELECT {aggregate}(kind, value) FROM {hash_table} "
+                f"WHERE {hash_table}.{foreign_key} = {file_table}.id) "
+                f"WHERE hashes IS NULL AND id IN (SELECT {foreign_key} FROM {hash_table})"
+            )
+        )
+        if result.rowcount:
+            logger.info(f"Moved hashes of {result.rowcount} rows from {hash_table} into {file_table}.hashes")
+    return existing
+
+
+def fold_hash_tables(engine: Engine) -> None:
+    """
+    Move hashes from the tables they used to be kept in to the hashes column of each file.
+    Must run after add_missing_columns, so the column exists.
+    Hashes are gathered by the database itself, so this doesn't read every hash into memory.
+    Files that already have hashes are skipped, so this is safe to run on every start, and the old tables
+    are kept until drop_hash_tables is run, so processes still running the old code keep working.
+    """
+    with engine.begin() as connection:
+        _lock(connection)
+        _fold_hash_tables(connection)
+
+
+def drop_hash_tables(engine: Engine) -> list[str]:
+    """
+    Drop the tables hashes used to be kept in, once nothing reads them anymore.
+    Anything written to them since they were last folded is moved first. Returns the dropped tables.
+    """
+    with engine.begin() as connection:
+        _lock(connection)
+        dropped = _fold_hash_tables(connection)
+        for hash_table in dropped:
+            logger.info(f"Dropping {hash_table}")
+            connection.execute(sqlalchemy.text(f"DROP TABLE IF EXISTS {hash_table}"))
+    return dropped
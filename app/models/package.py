@@ -4,7 +4,7 @@ import datetime
 import uuid
 from typing import TYPE_CHECKING
 
-from sqlalchemy import DateTime, ForeignKey, Text, UniqueConstraint
+from sqlalchemy import DateTime, ForeignKey, Integer, Text, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.models.database import Base
@@ -37,9 +37,17 @@ class Package(Base):
     """
     Last time this package's data was updated
     """
+    etag: Mapped[str | None] = mapped_column(Text, nullable=True, default=None)
+    """
+    ETag of the upstream package page, so unchanged pages aren't downloaded and parsed again
+    """
+    serial: Mapped[int | None] = mapped_column(Integer, nullable=True, default=None)
+    """
+    Upstream change serial of the package, if the upstream reports one
+    """
 
     code_files: Mapped[list[CodeFile]] = relationship(
-        "CodeFile", back_populates="package", order_by="CodeFile.sort_order", cascade="delete"
+        "CodeFile", back_populates="package", order_by="CodeFile.sort_order", cascade="save-update, merge, delete"
     )
 
     @property
@@ -56,6 +64,23 @@ class Package(Base):
         """
         return f"{self.repository.simple_url}/{self.name}/"
 
+    @property
+    def upstream_urls(self) -> list[str]:
+        """
+        URLs for this package on the repository's primary upstream and each mirror
+        """
+        return [f"{url}/{self.name}/" for url in self.repository.upstream_urls]
+
+    @property
+    def tracks(self) -> list[str]:
+        """
+        URLs of the upstream package pages this package tracks.
+        A virtual repository tracks the package in each of its members.
+        """
+        if self.repository.is_virtual:
+            return [f"{member.member.simple_url}/{self.name}/" for member in self.repository.members]
+        return [self.repository_url]
+
     @property
     def log_name(self) -> str:
         """
@@ -71,8 +96,6 @@ class Package(Base):
         count = 0
         for code_file in self.code_files:
             count += 1
-            count += len(code_file.hashes)
             if code_file.metadata_file:
                 count += 1
-                count += len(code_file.metadata_file.hashes)
         return count
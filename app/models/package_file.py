@@ -1,17 +1,20 @@
 from __future__ import annotations
 
+import datetime
 import uuid
 from typing import TYPE_CHECKING
 
-from sqlalchemy import Boolean, ForeignKey, Text, UniqueConstraint
+from sqlalchemy import JSON, BigInteger, Boolean, DateTime, ForeignKey, Integer, Text, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
+from app.constants import CONTENT_ADDRESS_HASH
 from app.models.database import Base
+from app.models.package_file_hash import PackageFileHash
 
 if TYPE_CHECKING:
     from app.models.package import Package  # pragma: no cover
-    from app.models.package_file_hash import PackageFileHash  # pragma: no cover
 
 
 class PackageFile(Base):
@@ -50,14 +53,42 @@ class PackageFile(Base):
     """
     Have we already downloaded this package?
     """
+    size: Mapped[int | None] = mapped_column(BigInteger, nullable=True, default=None)
+    """
+    Size in bytes of the file. Upstream's reported size until the file has been verified,
+    then the size of the stored file.
+    """
+    sha256: Mapped[str | None] = mapped_column(Text, nullable=True, default=None)
+    """
+    sha256 of the stored file, recorded once it has been verified.
+    Always available for cached files, even if upstream did not provide one.
+    """
+    storage_path: Mapped[str | None] = mapped_column(Text, nullable=True, default=None, index=True)
+    """
+    Path of the stored file, relative to the storage root.
+    Files with the same content share a path across repositories.
+    Kept when a file is evicted, so we know it is no longer in storage.
+    """
+    last_accessed: Mapped[datetime.datetime | None] = mapped_column(DateTime, nullable=True, default=None)
+    """
+    Last time this file was stored or downloaded. Recorded in batches, so may lag slightly.
+    """
+    access_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    """
+    Number of times this file has been downloaded. Recorded in batches, so may lag slightly.
+    """
 
-    @declared_attr
-    def hashes(cls) -> Mapped[list[PackageFileHash]]:
-        """
-        This needs to be overridden in the subclasses.
-        This is kept here for type checking only.
-        """
-        return relationship("PackageFileHash", lazy="joined")  # pragma: no cover
+    _hashes: Mapped[dict[str, str] | None] = mapped_column(
+        "hashes",
+        JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql"),
+        nullable=True,
+        default=dict,
+    )
+    """
+    Hashes of the file by kind. Kept on the row, rather than in a table of their own,
+    so loading files doesn't multiply the rows returned by the number of hashes.
+    Null for files stored before this column existed that had no hashes.
+    """
 
     # utility properties
 
@@ -68,13 +99,53 @@ class PackageFile(Base):
         """
         return self.version or "UNKNOWN"
 
+    @property
+    def has_upstream(self) -> bool:
+        """
+        Can this file be downloaded from upstream as-is?
+        """
+        return True
+
+    @property
+    def is_offline(self) -> bool:
+        """
+        Is this file's repository offline, so it can only be served if already cached?
+        """
+        return self.package.repository.is_offline
+
+    @property
+    def upstream_urls(self) -> list[str]:
+        """
+        Returns the upstream URL for this file, followed by the same file on any mirrors.
+        """
+        return self.package.repository.equivalent_urls(self.upstream_url)
+
+    @property
+    def hashes(self) -> list[PackageFileHash]:
+        """
+        Returns a list of hashes for this file, with sha256 first.
+        PostgreSQL doesn't keep the order of JSON keys, so the order is fixed here.
+        """
+        return [
+            PackageFileHash(kind=kind, value=value)
+            for kind, value in sorted(self.hashes_dict.items(), key=lambda item: item[0] != CONTENT_ADDRESS_HASH)
+        ]
+
     @property
     def hashes_dict(self) -> dict[str, str]:
         """
         Returns a dictionary of all hashes for this file.
         Used in the JSON API.
         """
-        return {hash.kind: hash.value for hash in self.hashes}
+        return dict(self._hashes or {})
+
+    @property
+    def digest(self) -> str | None:
+        """
+        Returns the best known sha256 for this file.
+        Prefers the digest we verified ourselves over what upstream reported.
+        """
+        return self.sha256 or self.hashes_dict.get("sha256")
 
     @property
     def hash_value(self) -> str | None:
@@ -88,3 +159,11 @@ class PackageFile(Base):
         if not self.hashes:
             return None
         return f"{self.hashes[0].kind}={self.hashes[0].value}"
+
+    def add_hash(self, kind: str, value: str) -> None:
+        """
+        Add a hash to this file. An existing hash of the same kind is kept.
+        """
+        if kind not in self.hashes_dict:
+            # replaced rather than changed in place, so sqlalchemy sees the change
+            self._hashes = {**self.hashes_dict, kind: value}
@@ -1,25 +1,21 @@
 from __future__ import annotations
 
-from sqlalchemy import Text
-from sqlalchemy.orm import Mapped, mapped_column
+import dataclasses
 
-from app.models.database import Base
 
-
-class PackageFileHash(Base):
+@dataclasses.dataclass(frozen=True)
+class PackageFileHash:
     """
-    This model represents a content hash for a file associated with a package.
-    Since the JSON API allows for files to have multiple hashes, we need a seperate
-    table. This is a base model meant to inherited.
+    A content hash for a file associated with a package.
+    Since the JSON API allows for files to have multiple hashes,
+    they are stored together in a JSON column on each file.
     """
 
-    __abstract__ = True
-
-    kind: Mapped[str] = mapped_column(Text)
+    kind: str
     """
     Type of hash of the file
     """
-    value: Mapped[str] = mapped_column(Text)
+    value: str
     """
     Hash of the file
     """
@@ -1,12 +1,18 @@
 from __future__ import annotations
 
 from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
 
-from sqlalchemy import Integer, Text
+from sqlalchemy import Boolean, Integer, Text, false
 from sqlalchemy.orm import Mapped, mapped_column, relationship, validates
 
 from app.models.database import Base
 
+# imported at runtime so the members and mirrors relationships always resolve,
+# even when only the repository model has been imported
+from app.models.repository_member import RepositoryMember
+from app.models.repository_mirror import RepositoryMirror
+
 if TYPE_CHECKING:
     from app.models.package import Package  # pragma: no cover
 
@@ -28,6 +34,7 @@ class Repository(Base):
     """
     The repository simple URL. Will have no trailing slash.
     Any value with a trailing slash provided will have it removed.
+    Virtual repositories have no upstream of their own, and store an empty string.
     """
     cache_minutes: Mapped[int] = mapped_column(Integer)
     """
@@ -37,8 +44,89 @@ class Repository(Base):
     """
     Number of seconds to wait for a response from the upstream server
     """
+    synthesize_metadata: Mapped[bool] = mapped_column(Boolean, default=False, server_default=false())
+    """
+    Extract metadata from wheels ourselves when upstream doesn't provide it
+    """
+    prefetch_metadata_versions: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    """
+    Number of the newest versions of a package to fetch metadata files for in the background
+    whenever the package is refreshed. 0 disables prefetching.
+    """
+    is_offline: Mapped[bool] = mapped_column(Boolean, default=False, server_default=false())
+    """
+    Serve only what is already in the database and storage, without contacting upstream
+    """
+    configured_offline: Mapped[bool] = mapped_column(Boolean, default=False, server_default=false())
+    """
+    Offline setting from the config when it was last applied.
+    The config only overrides is_offline when it changes, so `flask offline` survives restarts.
+    """
 
     packages: Mapped[list[Package]] = relationship("Package", back_populates="repository", cascade="delete")
+    members: Mapped[list[RepositoryMember]] = relationship(
+        "RepositoryMember",
+        foreign_keys="RepositoryMember.repository_id",
+        back_populates="repository",
+        order_by="RepositoryMember.priority",
+        # loaded alongside the repository, so checking for a virtual repository
+        # never triggers an autoflush of half-built packages
+        lazy="selectin",
+        cascade="all, delete-orphan",
+    )
+    """
+    For virtual repositories, the member repositories in priority order
+    """
+    mirrors: Mapped[list[RepositoryMirror]] = relationship(
+        "RepositoryMirror",
+        back_populates="repository",
+        order_by="RepositoryMirror.priority",
+        lazy="selectin",
+        cascade="all, delete-orphan",
+    )
+    """
+    Alternate simple URLs that serve the same content as the primary
+    """
+
+    @property
+    def is_virtual(self) -> bool:
+        """
+        Is this a virtual repository that merges other repositories?
+        """
+        return bool(self.members)
+
+    @property
+    def upstream_urls(self) -> list[str]:
+        """
+        The primary simple URL, followed by any mirrors
+        """
+        return [self.simple_url, *(mirror.simple_url for mirror in self.mirrors)]
+
+    def equivalent_urls(self, url: str) -> list[str]:
+        """
+        Return the given upstream URL, followed by the same URL on every other mirror.
+        Mirrors are expected to share a layout relative to the parent of their simple URL,
+        for example https://download.pytorch.org/whl/ and https://mirror.example.com/whl/.
+        URLs outside of every mirror are returned as-is.
+        """
+        if self.is_virtual:
+            for member in self.members:
+                urls = member.member.equivalent_urls(url)
+                if len(urls) > 1:
+                    return urls
+            return [url]
+
+        bases = []
+        for upstream_url in self.upstream_urls:
+            parts = urlsplit(upstream_url)
+            bases.append(f"{parts.scheme}://{parts.netloc}{parts.path.rsplit('/', 1)[0]}/")
+
+        for base in bases:
+            if url.startswith(base):
+                path = url.removeprefix(base)
+                return [url, *(f"{other}{path}" for other in bases if other != base)]
+
+        return [url]
 
     @validates("simple_url")
     def validate_simple_url(self, key: str, simple_url: str) -> str:
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import uuid
+from typing import TYPE_CHECKING
+
+from sqlalchemy import ForeignKey, Integer, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from app.models.database import Base
+
+if TYPE_CHECKING:
+    from app.models.repository import Repository  # pragma: no cover
+
+
+class RepositoryMember(Base):
+    """
+    This model links a virtual repository to one of its member repositories.
+    Members are queried concurrently, but their files are merged in priority order.
+    """
+
+    __tablename__ = "repository_member"
+    __table_args__ = (UniqueConstraint("repository_id", "member_id"),)
+
+    repository_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("repository.id"))
+    repository: Mapped[Repository] = relationship("Repository", foreign_keys=[repository_id], back_populates="members")
+    """
+    The parent virtual repository
+    """
+    member_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("repository.id"))
+    member: Mapped[Repository] = relationship("Repository", foreign_keys=[member_id], lazy="joined")
+    """
+    The member repository
+    """
+    priority: Mapped[int] = mapped_column(Integer)
+    """
+    Lower values are preferred when the same filename is offered by multiple members
+    """
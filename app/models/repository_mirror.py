@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import uuid
+from typing import TYPE_CHECKING
+
+from sqlalchemy import ForeignKey, Integer, Text, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column, relationship, validates
+
+from app.models.database import Base
+
+if TYPE_CHECKING:
+    from app.models.repository import Repository  # pragma: no cover
+
+
+class RepositoryMirror(Base):
+    """
+    This model records an alternate simple URL for a repository.
+    Mirrors serve the same content as the repository's primary simple URL,
+    and are raced against it when the primary is slow.
+    """
+
+    __tablename__ = "repository_mirror"
+    __table_args__ = (UniqueConstraint("repository_id", "simple_url"),)
+
+    repository_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("repository.id"))
+    repository: Mapped[Repository] = relationship("Repository", back_populates="mirrors")
+    """
+    The parent repository
+    """
+    simple_url: Mapped[str] = mapped_column(Text)
+    """
+    The mirror simple URL. Will have no trailing slash.
+    """
+    priority: Mapped[int] = mapped_column(Integer)
+    """
+    Order the mirror was configured in. Health tracking may reorder mirrors at runtime.
+    """
+
+    @validates("simple_url")
+    def validate_simple_url(self, key: str, simple_url: str) -> str:
+        """
+        Remove any trailing slashes from the simple URL and strip precedding/trailing whitespace
+        """
+        return simple_url.rstrip("/").strip()
@@ -0,0 +1,151 @@
+"""
+Send reads to database replicas, and everything else to the primary.
+Once a session has written, or needs to see something the replicas may not have yet,
+it stays on the primary until the end of the request.
+"""
+
+from __future__ import annotations
+
+import functools
+import random
+import threading
+import time
+from typing import Any, Callable, ParamSpec, TypeVar
+
+import sqlalchemy as sa
+from flask_sqlalchemy.session import Session
+from loguru import logger
+
+from app.config import Config
+from app.constants import REPLICA_LAG_CHECK_SECONDS
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+REPLICA_BIND_PREFIX = "replica-"
+# session info keys
+PRIMARY_ONLY = "primary_only"
+REPLICA = "replica"
+
+# replication lag in seconds, 0 when the replica has replayed everything it has received
+POSTGRESQL_LAG_QUERY = sa.text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+def replica_binds() -> dict[str, str]:
+    """
+    Bind key for each configured replica, for SQLALCHEMY_BINDS
+    """
+    return {f"{REPLICA_BIND_PREFIX}{i}": url for i, url in enumerate(Config.database.replica_urls)}
+
+
+class ReplicaHealth:
+    """
+    Which replicas are close enough to the primary to read from, checked at most every few seconds.
+    Replicas that can't be reached or are too far behind are left out until the next check.
+    """
+
+    def __init__(self) -> None:
+        self._healthy: list[str] = []
+        self._checked_at: float | None = None
+        self._lock = threading.Lock()
+
+    def _lag(self, engine: sa.Engine) -> float:
+        if engine.dialect.name != "postgresql":
+            return 0
+        with engine.connect() as connection:
+            return float(connection.execute(POSTGRESQL_LAG_QUERY).scalar() or 0)
+
+    def check(self, engines: dict[str, sa.Engine]) -> None:
+        healthy = []
+        for bind_key, engine in engines.items():
+            try:
+                lag = self._lag(engine)
+            except Exception as e:
+                logger.warning(f"Database {bind_key} is unavailable: {e}")
+                continue
+
+            if lag > Config.database.replica_max_lag_seconds:
+                logger.warning(f"Database {bind_key} is {lag:.1f} seconds behind, reading from the primary instead")
+                continue
+            healthy.append(bind_key)
+
+        self._healthy = healthy
+
+    def healthy(self, engines: dict[str, sa.Engine]) -> list[str]:
+        """
+        Replicas that can be read from. Only one thread checks at a time, the rest use the last result.
+        """
+        due = self._checked_at is None or time.monotonic() - self._checked_at >= REPLICA_LAG_CHECK_SECONDS
+        if due and self._lock.acquire(blocking=self._checked_at is None):
+            try:
+                self.check(engines)
+                self._checked_at = time.monotonic()
+            finally:
+                self._lock.release()
+        return self._healthy
+
+
+health = ReplicaHealth()
+
+
+def _is_read(clause: Any) -> bool:
+    """
+    Plain selects can go to a replica. Anything else, including selects that lock rows,
+    and connections asked for without a statement, such as for a flush, go to the primary.
+    """
+    return isinstance(clause, sa.Select) and clause._for_update_arg is None
+
+
+class RoutingSession(Session):
+    """
+    Session that reads from a replica while it can, sticking to one replica for the whole session
+    """
+
+    def get_bind(self, mapper: Any | None = None, clause: Any | None = None, bind: Any | None = None, **kwargs: Any):
+        engines = self._db.engines
+        if bind is None and len(engines) > 1 and not self.info.get(PRIMARY_ONLY):
+            if _is_read(clause):
+                bind_key = self.info.get(REPLICA)
+                if bind_key is None:
+                    replicas = {key: engine for key, engine in engines.items() if key is not None}
+                    healthy = health.healthy(replicas)
+                    if healthy:
+                        bind_key = self.info[REPLICA] = random.choice(healthy)
+                if bind_key is not None:
+                    return engines[bind_key]
+            else:
+                # whatever this session reads next may depend on this write
+                self.info[PRIMARY_ONLY] = True
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_primary(session: sa.orm.Session) -> bool:
+    """
+    Send the rest of a session's reads to the primary.
+    Returns whether the session had been reading from a replica.
+    """
+    was_on_replica = REPLICA in session.info and not session.info.get(PRIMARY_ONLY)
+    session.info[PRIMARY_ONLY] = True
+    return was_on_replica
+
+
+def retry_on_primary(function: Callable[P, T | None]) -> Callable[P, T | None]:
+    """
+    Decorate a lookup so that if it finds nothing on a replica, it is asked again on the primary.
+    Something just created may not have reached the replica yet, and creating it again would fail.
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args: P.args, **kwargs: P.kwargs) -> T | None:
+        from app.models.database import db
+
+        result = function(*args, **kwargs)
+        if result is None and use_primary(db.session):
+            result = function(*args, **kwargs)
+        return result
+
+    return wrapper
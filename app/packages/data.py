@@ -1,14 +1,29 @@
+import concurrent.futures
 import datetime
+import hashlib
+from http import HTTPStatus
 
 import requests
 from loguru import logger
 
+import app.data.cache.generation
+import app.data.cache.inline
 import app.data.sql
 import app.data.storage.active
 import app.http
-from app.constants import CONTENT_TYPE_HEADER
+import app.packages.jobs
+import app.packages.metadata
+import app.packages.prefetch
+from app.constants import CONTENT_TYPE_HEADER, ETAG_HEADER, IF_NONE_MATCH_HEADER, LAST_SERIAL_HEADER
 from app.models.code_file import CodeFile
-from app.models.exceptions import IndexParsingError, IndexTimeoutError, PackageNotFound
+from app.models.exceptions import (
+    FileNotAvailableOffline,
+    IndexNotModified,
+    IndexParsingError,
+    IndexTimeoutError,
+    PackageNotFound,
+)
+from app.models.metadata_file import MetadataFile
 from app.models.package import Package
 from app.models.package_file import PackageFile
 from app.models.repository import Repository
@@ -24,32 +39,30 @@ from app.packages.simple import (
 from app.utils import time_this_context
 
 
-def fetch_package_data(package: Package) -> list[CodeFile]:
+def _request_index(urls: list[str], timeout: int, etag: str | None = None) -> requests.Response:
     """
-    Fetch package data.
+    Request a package page from an upstream index, racing any mirrors.
+    Given an ETag, the page is only sent if it has changed.
+    Any errors are left for the caller to handle.
     """
-    logger.debug(f"Fetching package {package.log_name}")
-
-    # make the request upstream
-    url = package.repository_url
     content_types = [
         f"{PYPI_CONTENT_TYPE_JSON_V1};q=1",
         f"{PYPI_CONTENT_TYPE_HTML_V1};q=0.2",
         f"{PYPI_CONTENT_TYPE_LEGACY};q=0.01",
     ]
     headers = {"Accept": ",".join(content_types)}
-    try:
-        with time_this_context(f"Fetched {package.repository_url}"):
-            response = app.http.get(url, headers=headers, timeout=package.repository.timeout_seconds)
-            response.raise_for_status()
-    except requests.exceptions.Timeout as e:
-        # we need to handle this one specifically to pretend nothing happend
-        raise IndexTimeoutError from e
-    except Exception as e:
-        # if we have any error, we need to raise a PackageNotFound
-        raise PackageNotFound(package_name=package.name, repository_slug=package.repository.slug) from e
+    if etag is not None:
+        headers[IF_NONE_MATCH_HEADER] = etag
+    with time_this_context(f"Fetched {urls[0]}"):
+        return app.http.hedged_get(urls, headers=headers, timeout=timeout)
+
 
-    # now, figure out how to parse the response.
+def _parse_index(response: requests.Response, package: Package) -> list[CodeFile]:
+    """
+    Parse a package page from an upstream index, based on the content type.
+    Relative URLs are resolved against whichever mirror answered.
+    """
+    url = response.url
     content_type = response.headers.get(CONTENT_TYPE_HEADER)
 
     # if content type is not in our mapping, raise an error
@@ -59,37 +72,158 @@ def fetch_package_data(package: Package) -> list[CodeFile]:
     # parse the response
     index_format = PYPI_CONTENT_TYPE_INDEX_FORMAT_MAPPING[content_type]
     if index_format == IndexFormat.json:
-        code_files = parse_simple_json(response.text, package)
+        return parse_simple_json(response.text, package, base_url=url)
     elif index_format == IndexFormat.html:
-        code_files = parse_simple_html(response.text, package)
+        return parse_simple_html(response.text, package, base_url=url)
     else:
         raise IndexParsingError(url)
 
-    # in some weird situations, (looking at you pytorch), we can have code files
-    # with different URLs but the same filename.
-    # In that situation, we discard any duplicates, preferring ones that occur first.
+
+def _fetch_upstream_code_files(package: Package) -> list[CodeFile]:
+    """
+    Fetch the code files for a package from a single upstream index.
+    Raises IndexNotModified if the page hasn't changed since it was last fetched.
+    """
+    try:
+        response = _request_index(package.upstream_urls, timeout=package.repository.timeout_seconds, etag=package.etag)
+    except requests.exceptions.Timeout as e:
+        # we need to handle this one specifically to pretend nothing happend
+        raise IndexTimeoutError from e
+    except Exception as e:
+        # if we have any error, we need to raise a PackageNotFound
+        raise PackageNotFound(package_name=package.name, repository_slug=package.repository.slug) from e
+
+    if response.status_code == HTTPStatus.NOT_MODIFIED:
+        raise IndexNotModified
+
+    code_files = _parse_index(response, package)
+
+    # only remembered once the page has been parsed
+    package.etag = response.headers.get(ETAG_HEADER)
+    serial = response.headers.get(LAST_SERIAL_HEADER)
+    package.serial = int(serial) if serial and serial.isdigit() else None
+
+    return code_files
+
+
+def _fetch_virtual_code_files(package: Package) -> list[CodeFile]:
+    """
+    Fetch the code files for a package from every member of a virtual repository.
+    Members are requested concurrently with a single shared deadline, and the results
+    are concatenated in member priority order.
+    """
+    repository = package.repository
+    # resolve everything from the database up front, the threads only make HTTP requests.
+    # Offline members aren't asked
+    members = [member.member for member in repository.members if not member.member.is_offline]
+    if not members:
+        raise PackageNotFound(package_name=package.name, repository_slug=repository.slug)
+
+    member_slugs = [member.slug for member in members]
+    member_urls = [[f"{url}/{package.name}/" for url in member.upstream_urls] for member in members]
+    deadline = repository.timeout_seconds
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(member_urls))
+    futures = [executor.submit(_request_index, urls, deadline) for urls in member_urls]
+    done, _ = concurrent.futures.wait(futures, timeout=deadline)
+    # don't block on stragglers, they are bounded by their own request timeout
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    found = False
+    timed_out = False
+    code_files: list[CodeFile] = []
+    for member_slug, urls, future in zip(member_slugs, member_urls, futures):
+        url = urls[0]
+        if future not in done:
+            logger.warning(f"Deadline exceeded fetching {url} for {package.log_name}")
+            timed_out = True
+            continue
+
+        try:
+            response = future.result()
+        except requests.exceptions.Timeout:
+            logger.warning(f"Timed out fetching {url} for {package.log_name}")
+            timed_out = True
+            continue
+        except Exception as e:
+            # most commonly, the package just doesn't exist in this member
+            logger.debug(f"Package {package.name} not available from {member_slug}: {e}")
+            continue
+
+        # one member sending a bad page shouldn't take down the others
+        try:
+            member_code_files = _parse_index(response, package)
+        except Exception as e:
+            logger.warning(f"Unable to parse {url} for {package.log_name}: {e}")
+            continue
+
+        found = True
+        code_files.extend(member_code_files)
+
+    if not found:
+        if timed_out:
+            raise IndexTimeoutError
+        raise PackageNotFound(package_name=package.name, repository_slug=repository.slug)
+
+    return code_files
+
+
+def deduplicate_code_files(code_files: list[CodeFile], warn: bool = True) -> list[CodeFile]:
+    """
+    Discard code files with a filename that has already been seen, preferring ones that occur first.
+    The sort order of the remaining files is renumbered to be contiguous.
+    """
     unique_code_filenames = set()
     out_code_files: list[CodeFile] = []
     for code_file in code_files:
         # if we have already seen this filename, skip it
         if code_file.filename in unique_code_filenames:
-            logger.warning(
-                f"Discarding duplicate code file {
-                    code_file.filename
-                }. This should not happen. The upstream registry is not configured properly."
-            )
+            if warn:
+                logger.warning(
+                    f"Discarding duplicate code file {
+                        code_file.filename
+                    }. This should not happen. The upstream registry is not configured properly."
+                )
             continue
 
         unique_code_filenames.add(code_file.filename)
+        code_file.sort_order = len(out_code_files)
         out_code_files.append(code_file)
 
     return out_code_files
 
 
+def fetch_package_data(package: Package) -> list[CodeFile]:
+    """
+    Fetch package data.
+    """
+    logger.debug(f"Fetching package {package.log_name}")
+
+    # make the request(s) upstream
+    if package.repository.is_virtual:
+        # members commonly offer the same files (pytorch re-hosts a lot of pypi),
+        # so the higher priority member silently wins
+        code_files = deduplicate_code_files(_fetch_virtual_code_files(package), warn=False)
+    else:
+        # in some weird situations, (looking at you pytorch), we can have code files
+        # with different URLs but the same filename.
+        # In that situation, we discard any duplicates, preferring ones that occur first.
+        code_files = deduplicate_code_files(_fetch_upstream_code_files(package))
+
+    if package.repository.synthesize_metadata:
+        app.packages.metadata.add_synthesized_metadata_files(code_files)
+
+    return code_files
+
+
 def create_package_data(repository: Repository, package_name: str) -> Package:
     """
     Fetch package data for the first time.
     """
+    # an offline repository only knows the packages it already has
+    if repository.is_offline:
+        raise PackageNotFound(package_name=package_name, repository_slug=repository.slug)
+
     package = Package(repository=repository, name=package_name)
     logger.debug(f"Creating package {package.log_name}")
 
@@ -115,6 +249,13 @@ def update_package_data(repository: Repository, package: Package) -> Package:
     """
     Update the package data for a given package in our database
     """
+    # serve what we have
+    if repository.is_offline:
+        return package
+
+    # the files we compare against must be the latest, or we'd insert ones that already exist
+    app.data.sql.read_from_primary(package)
+
     # first, we need to get the existing code files
     old_code_files_dict = {code_file.filename: code_file for code_file in package.code_files}
     old_code_files_filenames_set = set(old_code_files_dict.keys())
@@ -124,6 +265,11 @@ def update_package_data(repository: Repository, package: Package) -> Package:
     except IndexTimeoutError:
         # pretend nothing happened
         return package
+    except IndexNotModified:
+        logger.debug(f"Package {package.log_name} has not changed")
+        package.last_updated = datetime.datetime.now()
+        app.data.sql.save()
+        return package
 
     # we need to compare a list of code files parsed to the ones we have already seen
     # We won't delete existing files, but only add new files.
@@ -147,11 +293,16 @@ def update_package_data(repository: Repository, package: Package) -> Package:
 
     # also have to update existing code files list
     package.code_files += to_save_code_files
+    changed = app.data.sql.has_changes(CodeFile, MetadataFile)
 
     logger.debug(f"Saving {len(to_save_code_files)} new code files for package {package.log_name}")
     package.last_updated = datetime.datetime.now()
     app.data.sql.save()
 
+    # only once committed, so a page can't be cached from the old data under the new generation
+    if changed:
+        app.data.cache.generation.bump(repository.slug, package.name)
+
     return package
 
 
@@ -168,14 +319,42 @@ def get_package(repository_slug: str, package_name: str) -> Package:
     # if package is not in the database, we need to fetch it
     if package is None:
         package = create_package_data(repository, package_name)
+        app.packages.prefetch.prefetch_metadata_files(package)
 
     # or if the package is not current, we need to update it
     elif not package.is_current:
         package = update_package_data(repository, package)
+        app.packages.prefetch.prefetch_metadata_files(package)
 
     return package
 
 
+def store_package_file(package_file: PackageFile) -> None:
+    """
+    Save a file to storage and mark it as cached, without committing
+    """
+    # synthesized metadata can still be extracted from a cached wheel
+    if package_file.is_offline and not (
+        isinstance(package_file, MetadataFile) and package_file.is_synthesized and package_file.code_file.is_cached
+    ):
+        raise FileNotAvailableOffline(package_file.filename)
+
+    if isinstance(package_file, MetadataFile) and package_file.is_synthesized:
+        content = app.packages.metadata.extract_metadata(package_file.code_file)
+        app.data.storage.active.StorageDriver.cache_file(package_file, content=content)
+        app.data.cache.inline.set_content(package_file, content)
+
+        # advertise the hash now that we know it
+        if not package_file.hashes:
+            package_file.add_hash("sha256", hashlib.sha256(content).hexdigest())
+    else:
+        app.data.storage.active.StorageDriver.cache_file(package_file)
+
+    package_file.is_cached = True
+    # a file that was just stored shouldn't look unused to eviction
+    package_file.last_accessed = datetime.datetime.now()
+
+
 def cache_package_file(package_file: PackageFile) -> None:
     """
     Cache a file
@@ -184,17 +363,22 @@ def cache_package_file(package_file: PackageFile) -> None:
     if package_file.is_cached:
         return
 
+    # let a download worker fetch it, so a slow upstream doesn't hold up this worker
+    if app.packages.jobs.is_enabled() and not package_file.is_offline:
+        app.packages.jobs.wait(package_file)
+        return
+
     # actually cache the file
-    app.data.storage.active.StorageDriver.cache_file(package_file)
+    store_package_file(package_file)
 
     # update the database
-    package_file.is_cached = True
     app.data.sql.save()
 
 
-def get_package_file(repository_slug: str, package_name: str, filename: str) -> PackageFile:
+def find_package_file(repository_slug: str, package_name: str, filename: str) -> PackageFile:
     """
-    Return a PackageFile object for a given repository, package name, and filename.
+    Return a PackageFile object for a given repository, package name, and filename,
+    without caching the file.
     """
     # first try to find the repository
     repository = app.data.sql.get_repository_with_exception(repository_slug)
@@ -208,7 +392,14 @@ def get_package_file(repository_slug: str, package_name: str, filename: str) ->
         package = create_package_data(repository, package_name)
 
     # try to find the file in the database
-    package_file = app.data.sql.get_package_file_with_exception(repository, package, filename)
+    return app.data.sql.get_package_file_with_exception(repository, package, filename)
+
+
+def get_package_file(repository_slug: str, package_name: str, filename: str) -> PackageFile:
+    """
+    Return a PackageFile object for a given repository, package name, and filename.
+    """
+    package_file = find_package_file(repository_slug, package_name, filename)
 
     # if we haven't cached the file yet, do so now
     cache_package_file(package_file)
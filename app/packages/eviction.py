@@ -0,0 +1,133 @@
+"""
+Keep storage under a quota by deleting files that are rarely or no longer downloaded
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import datetime
+
+from loguru import logger
+from sqlalchemy import select, update
+
+import app.data.storage.active
+from app.constants import MEGABYTES_TO_BYTES
+from app.models.code_file import CodeFile
+from app.models.database import db
+from app.models.metadata_file import MetadataFile
+from app.models.package_file import PackageFile
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+@dataclasses.dataclass
+class StoredFile:
+    """
+    Dataclass to hold a file in storage, and every package file that references it.
+    Files with the same content are shared across repositories, so are only evicted together.
+    """
+
+    path: str
+    size: int = 0
+    access_count: int = 0
+    last_accessed: datetime.datetime | None = None
+    package_files: list[PackageFile] = dataclasses.field(default_factory=list)
+
+    def add(self, package_file: PackageFile) -> None:
+        self.package_files.append(package_file)
+        self.size = max(self.size, package_file.size or 0)
+        self.access_count += package_file.access_count
+        if package_file.last_accessed is not None and (
+            self.last_accessed is None or package_file.last_accessed > self.last_accessed
+        ):
+            self.last_accessed = package_file.last_accessed
+
+    def score(self, now: datetime.datetime) -> float:
+        """
+        How much this file is worth keeping. Downloads count for less the longer
+        the file has gone unused, so a file that was popular years ago doesn't stay forever.
+        """
+        if self.last_accessed is None:
+            return 0
+        idle_days = max((now - self.last_accessed).total_seconds(), 0) / SECONDS_PER_DAY
+        return self.access_count / (1 + idle_days)
+
+
+def get_stored_files() -> list[StoredFile]:
+    """
+    Find every file in storage, grouped by storage path
+    """
+    storage_driver = app.data.storage.active.StorageDriver
+    stored_files: dict[str, StoredFile] = {}
+
+    for model in (CodeFile, MetadataFile):
+        package_files = db.session.execute(select(model).where(model.is_cached)).unique().scalars()
+        for package_file in package_files:
+            path = storage_driver._get_path(package_file)
+            stored_files.setdefault(path, StoredFile(path=path)).add(package_file)
+
+    return list(stored_files.values())
+
+
+def plan_eviction(
+    stored_files: list[StoredFile], quota_bytes: int, min_idle: datetime.timedelta, now: datetime.datetime
+) -> list[StoredFile]:
+    """
+    Choose the files to delete to get under the quota, least valuable first.
+    Files used within the minimum idle time are never chosen.
+    """
+    total = sum(stored_file.size for stored_file in stored_files)
+    candidates = sorted(
+        (
+            stored_file
+            for stored_file in stored_files
+            if stored_file.last_accessed is None or now - stored_file.last_accessed >= min_idle
+        ),
+        key=lambda stored_file: (stored_file.score(now), stored_file.last_accessed or datetime.datetime.min),
+    )
+
+    to_evict = []
+    for stored_file in candidates:
+        if total <= quota_bytes:
+            break
+        to_evict.append(stored_file)
+        total -= stored_file.size
+
+    return to_evict
+
+
+def evict(stored_file: StoredFile) -> None:
+    """
+    Mark every package file that references a stored file as no longer cached, then delete it from storage
+    """
+    logger.info(f"Evicting {stored_file.path} ({stored_file.size} bytes, {stored_file.access_count} downloads)")
+
+    for package_file in stored_file.package_files:
+        # the path is kept, so existence checks know the file is gone
+        package_file.storage_path = stored_file.path
+    db.session.flush()
+
+    # including package files cached since this one was chosen, as they share the stored file
+    for model in (CodeFile, MetadataFile):
+        db.session.execute(update(model).where(model.storage_path == stored_file.path).values(is_cached=False))
+
+    # commit each file, before deleting it, so nothing says a file is cached once it is gone
+    db.session.commit()
+    app.data.storage.active.StorageDriver.delete_file(stored_file.package_files[0])
+
+
+def enforce_quota(quota_megabytes: int, min_idle_hours: int, dry_run: bool = False) -> list[StoredFile]:
+    """
+    Evict files until storage is under the quota. Returns the files that were, or would be, evicted.
+    """
+    now = datetime.datetime.now()
+    stored_files = get_stored_files()
+    to_evict = plan_eviction(
+        stored_files, quota_megabytes * MEGABYTES_TO_BYTES, datetime.timedelta(hours=min_idle_hours), now
+    )
+
+    if not dry_run:
+        for stored_file in to_evict:
+            evict(stored_file)
+
+    return to_evict
@@ -12,9 +12,7 @@ from app.constants import (
     METADATA_KEY_LEGACY,
 )
 from app.models.code_file import CodeFile
-from app.models.code_file_hash import CodeFileHash
 from app.models.metadata_file import MetadataFile
-from app.models.metadata_file_hash import MetadataFileHash
 from app.models.package import Package
 from app.models.package_file import PackageFile
 from app.utils import time_this_decorator
@@ -46,21 +44,18 @@ def add_hash(given: str, package_file: PackageFile) -> None:
     if kind not in app.packages.simple.SUPPORTED_HASHES:
         return
 
-    # sqlalchemy automatically appends itself
-    if isinstance(package_file, CodeFile):
-        CodeFileHash(code_file=package_file, kind=kind, value=value)
-    elif isinstance(package_file, MetadataFile):
-        MetadataFileHash(metadata_file=package_file, kind=kind, value=value)
+    package_file.add_hash(kind, value)
 
 
-def _parse_single_record(anchor: Any, package: Package, index: int = 0) -> CodeFile:
+def _parse_single_record(anchor: Any, package: Package, index: int = 0, base_url: str | None = None) -> CodeFile:
     # required fields
     # inner text is filename
     filename: str = anchor.text
 
     # get upstream url and make it absolute
+    # relative URLs are resolved against base_url, defaulting to the package's repository URL
     href: str = anchor.attrib["href"]
-    upstream_url = app.packages.simple.absoluify_url(package.repository_url, href)
+    upstream_url = app.packages.simple.absoluify_url(base_url or package.repository_url, href)
 
     # parse out the hash which should be in the fragment
     upstream_url, upstream_fragment = urldefrag(upstream_url)
@@ -129,7 +124,7 @@ def _parse_single_record(anchor: Any, package: Package, index: int = 0) -> CodeF
 
 
 @time_this_decorator("Parsed HTML content")
-def parse_simple_html(html_content: str, package: Package) -> list[CodeFile]:
+def parse_simple_html(html_content: str, package: Package, base_url: str | None = None) -> list[CodeFile]:
     """
     Parse the simple registry HTML content.
     Return a list of code files.
@@ -140,4 +135,4 @@ def parse_simple_html(html_content: str, package: Package) -> list[CodeFile]:
 
     # iterate over all anchor tags
     # tried using threadpoolexecutor, but it was slower
-    return [_parse_single_record(record, package, i) for i, record in enumerate(upstream_tree.iter("a"))]
+    return [_parse_single_record(record, package, i, base_url) for i, record in enumerate(upstream_tree.iter("a"))]
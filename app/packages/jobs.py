@@ -0,0 +1,262 @@
+"""
+Download files to storage in worker processes, rather than in web requests.
+Jobs are kept in the database, so they survive restarts and any number of workers can share them.
+"""
+
+from __future__ import annotations
+
+import datetime
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import TYPE_CHECKING
+
+import flask
+import sqlalchemy.exc
+from loguru import logger
+from sqlalchemy import and_, case, or_, select, update
+
+from app.config import Config
+from app.constants import (
+    DOWNLOAD_FAILED_COOLDOWN_SECONDS,
+    DOWNLOAD_JOB_HEARTBEAT_SECONDS,
+    DOWNLOAD_JOB_POLL_SECONDS,
+    DOWNLOAD_RETRY_AFTER_SECONDS,
+    DOWNLOAD_WORKER_IDLE_SECONDS,
+)
+from app.data.storage.integrity import progress_callback
+from app.models.code_file import CodeFile
+from app.models.database import db
+from app.models.download_job import DownloadJob
+from app.models.enums import DownloadJobStatus
+from app.models.exceptions import DownloadFailed, DownloadPending
+from app.models.metadata_file import MetadataFile
+
+if TYPE_CHECKING:
+    from app.models.package_file import PackageFile  # pragma: no cover
+
+_FILE_MODELS: dict[str, type[PackageFile]] = {
+    CodeFile.__tablename__: CodeFile,
+    MetadataFile.__tablename__: MetadataFile,
+}
+
+
+def is_enabled() -> bool:
+    return Config.storage.download_queue.enabled
+
+
+def get_job(package_file: PackageFile) -> DownloadJob | None:
+    """
+    Lookup the download job for a package file
+    """
+    return db.session.execute(
+        select(DownloadJob).where(
+            DownloadJob.file_table == package_file.__tablename__, DownloadJob.package_file_id == package_file.id
+        )
+    ).scalar_one_or_none()
+
+
+def enqueue(package_file: PackageFile) -> DownloadJob:
+    """
+    Queue a package file to be downloaded, or find the job already downloading it.
+    Raises DownloadFailed if the file was given up on recently.
+    """
+    job = get_job(package_file)
+
+    if job is None:
+        job = DownloadJob(
+            file_table=package_file.__tablename__, package_file_id=package_file.id, bytes_total=package_file.size
+        )
+        db.session.add(job)
+        try:
+            db.session.commit()
+        except sqlalchemy.exc.IntegrityError:
+            # another request queued it first
+            db.session.rollback()
+            job = get_job(package_file)
+            assert job is not None
+
+    elif job.status == DownloadJobStatus.failed and job.next_attempt_at > datetime.datetime.now():
+        # don't hammer upstream for a file that keeps failing
+        raise DownloadFailed(package_file.filename, job.error)
+
+    elif job.status in (DownloadJobStatus.done, DownloadJobStatus.failed):
+        # evicted since it was downloaded, or it's worth another try now someone is asking for it
+        logger.debug(f"Queueing {package_file.filename} again")
+        job.status = DownloadJobStatus.queued
+        job.attempts = 0
+        job.next_attempt_at = datetime.datetime.now()
+        job.bytes_done = 0
+        job.error = None
+        db.session.commit()
+
+    return job
+
+
+def wait(package_file: PackageFile) -> None:
+    """
+    Queue a package file to be downloaded, and wait a bounded time for a worker to finish it.
+    Raises DownloadPending if it takes too long, so the client can retry without holding up a web worker.
+    """
+    job = enqueue(package_file)
+    deadline = time.monotonic() + Config.storage.download_queue.wait_seconds
+
+    while True:
+        # end the transaction, so each check sees the worker's latest commit
+        db.session.commit()
+
+        if job.status == DownloadJobStatus.done:
+            return
+        if job.status == DownloadJobStatus.failed:
+            raise DownloadFailed(package_file.filename, job.error)
+        if time.monotonic() >= deadline:
+            logger.debug(f"{package_file.filename} is {job.bytes_done} of {job.bytes_total} bytes in")
+            raise DownloadPending(package_file.filename, retry_after=DOWNLOAD_RETRY_AFTER_SECONDS)
+
+        time.sleep(DOWNLOAD_JOB_POLL_SECONDS)
+
+
+def _claimable() -> sqlalchemy.ColumnElement[bool]:
+    """
+    Jobs that are due, or whose worker has stopped reporting progress
+    """
+    now = datetime.datetime.now()
+    stale = now - datetime.timedelta(seconds=Config.storage.download_queue.stale_seconds)
+    return or_(
+        and_(DownloadJob.status == DownloadJobStatus.queued, DownloadJob.next_attempt_at <= now),
+        and_(DownloadJob.status == DownloadJobStatus.running, DownloadJob.heartbeat_at < stale),
+    )
+
+
+def claim(worker: str) -> DownloadJob | None:
+    """
+    Claim the oldest claimable job. The claim is a conditional update,
+    so two workers racing for the same job can't both win.
+    Reclaiming a job from a worker that stopped reporting progress counts as a failed attempt,
+    so a file that kills its worker isn't retried forever.
+    """
+    candidates = db.session.execute(
+        select(DownloadJob.id).where(_claimable()).order_by(DownloadJob.created_at).limit(10)
+    ).scalars()
+
+    for job_id in list(candidates):
+        result = db.session.execute(
+            update(DownloadJob)
+            .where(DownloadJob.id == job_id, _claimable())
+            .values(
+                status=DownloadJobStatus.running,
+                worker=worker,
+                heartbeat_at=datetime.datetime.now(),
+                attempts=case(
+                    (DownloadJob.status == DownloadJobStatus.running, DownloadJob.attempts + 1),
+                    else_=DownloadJob.attempts,
+                ),
+            )
+        )
+        db.session.commit()
+        if result.rowcount == 1:  # ty:ignore[unresolved-attribute]
+            return db.session.get(DownloadJob, job_id)
+
+    return None
+
+
+def _heartbeat(flask_app: flask.Flask, job_id: uuid.UUID, progress: dict[str, int], stop: threading.Event) -> None:
+    """
+    Report progress on a job until told to stop, so other workers know it is still alive.
+    Uses its own connection, as the job's session is busy with the download.
+    """
+    while not stop.wait(DOWNLOAD_JOB_HEARTBEAT_SECONDS):
+        try:
+            with flask_app.app_context(), db.engine.begin() as connection:
+                connection.execute(
+                    update(DownloadJob.__table__)
+                    .where(DownloadJob.__table__.c.id == job_id)
+                    .values(heartbeat_at=datetime.datetime.now(), bytes_done=progress["bytes"])
+                )
+        except Exception as e:
+            logger.debug(f"Unable to report progress on job {job_id}: {e}")
+
+
+def _give_up(job: DownloadJob, error: str) -> None:
+    """
+    Mark a job as failed. Requests for the file fail straight away until the cooldown has passed.
+    """
+    job.status = DownloadJobStatus.failed
+    job.error = error
+    job.worker = None
+    job.next_attempt_at = datetime.datetime.now() + datetime.timedelta(seconds=DOWNLOAD_FAILED_COOLDOWN_SECONDS)
+
+
+def run(flask_app: flask.Flask, job: DownloadJob) -> None:
+    """
+    Download the file for a claimed job, retrying later with backoff if it fails
+    """
+    # local import, as the data module queues jobs
+    import app.packages.data
+
+    config = Config.storage.download_queue
+    package_file = db.session.get(_FILE_MODELS[job.file_table], job.package_file_id)
+    if package_file is None or package_file.is_cached:
+        job.status = DownloadJobStatus.done
+        db.session.commit()
+        return
+
+    if job.attempts >= config.max_attempts:
+        logger.error(f"Giving up on {package_file.filename}, its download workers stopped responding")
+        _give_up(job, job.error or "Download worker stopped responding")
+        db.session.commit()
+        return
+
+    logger.info(f"Downloading {package_file.filename}, attempt {job.attempts + 1}")
+    progress = {"bytes": 0}
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(flask_app, job.id, progress, stop), daemon=True)
+    heartbeat.start()
+    token = progress_callback.set(lambda size: progress.__setitem__("bytes", size))
+
+    try:
+        app.packages.data.store_package_file(package_file)
+        # the file is marked cached in the same commit the job is marked done
+        job.status = DownloadJobStatus.done
+        job.bytes_done = package_file.size or progress["bytes"]
+        job.error = None
+        db.session.commit()
+        logger.info(f"Downloaded {package_file.filename}")
+
+    except Exception as e:
+        db.session.rollback()
+        job.attempts += 1
+        job.error = str(e)
+        job.worker = None
+        if job.attempts >= config.max_attempts:
+            logger.error(f"Giving up on {package_file.filename} after {job.attempts} attempts: {e}")
+            _give_up(job, str(e))
+        else:
+            delay = config.backoff_seconds * 2 ** (job.attempts - 1)
+            logger.warning(f"Unable to download {package_file.filename}, retrying in {delay} seconds: {e}")
+            job.status = DownloadJobStatus.queued
+            job.next_attempt_at = datetime.datetime.now() + datetime.timedelta(seconds=delay)
+        db.session.commit()
+
+    finally:
+        stop.set()
+        progress_callback.reset(token)
+
+
+def work(flask_app: flask.Flask) -> None:
+    """
+    Claim and run jobs forever
+    """
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    logger.info(f"Download worker {worker} started")
+
+    while True:
+        with flask_app.app_context():
+            job = claim(worker)
+            if job is not None:
+                run(flask_app, job)
+                continue
+
+        time.sleep(DOWNLOAD_WORKER_IDLE_SECONDS)
@@ -10,9 +10,7 @@ from app.constants import (
     METADATA_KEY_LEGACY2,
 )
 from app.models.code_file import CodeFile
-from app.models.code_file_hash import CodeFileHash
 from app.models.metadata_file import MetadataFile
-from app.models.metadata_file_hash import MetadataFileHash
 from app.models.package import Package
 from app.models.package_file import PackageFile
 from app.utils import time_this_decorator
@@ -28,20 +26,17 @@ def add_hashes(hash_dict: dict, package_file: PackageFile) -> None:
         if kind not in app.packages.simple.SUPPORTED_HASHES:
             continue
 
-        # sqlalchemy automatically appends itself
-        if isinstance(package_file, CodeFile):
-            CodeFileHash(code_file=package_file, kind=kind, value=value)
-        elif isinstance(package_file, MetadataFile):
-            MetadataFileHash(metadata_file=package_file, kind=kind, value=value)
+        package_file.add_hash(kind, value)
 
 
-def _parse_single_record(record: dict, package: Package, index: int = 0) -> CodeFile:
+def _parse_single_record(record: dict, package: Package, index: int = 0, base_url: str | None = None) -> CodeFile:
     """
-    Parse a single record
+    Parse a single record.
+    Relative URLs are resolved against base_url, defaulting to the package's repository URL.
     """
     # required fields
     filename = record["filename"]
-    upstream_url = app.packages.simple.urljoin(package.repository_url, record["url"])
+    upstream_url = app.packages.simple.urljoin(base_url or package.repository_url, record["url"])
 
     # optional fields
     requires_python = record.get("requires-python")
@@ -110,7 +105,7 @@ def _parse_single_record(record: dict, package: Package, index: int = 0) -> Code
 
 
 @time_this_decorator("Parsed JSON content")
-def parse_simple_json(json_content: str, package: Package) -> list[CodeFile]:
+def parse_simple_json(json_content: str, package: Package, base_url: str | None = None) -> list[CodeFile]:
     """
     Parse the simple registry JSON content.
     Return a list of code files.
@@ -121,4 +116,4 @@ def parse_simple_json(json_content: str, package: Package) -> list[CodeFile]:
     data = pyjson5.loads(json_content)
 
     # tried using threadpoolexecutor, but it was slower
-    return [_parse_single_record(record, package, i) for i, record in enumerate(data["files"])]
+    return [_parse_single_record(record, package, i, base_url) for i, record in enumerate(data["files"])]
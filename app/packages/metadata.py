@@ -0,0 +1,146 @@
+"""
+Synthesize PEP 658 metadata files for wheels when upstream doesn't provide them
+"""
+
+from __future__ import annotations
+
+import io
+import zipfile
+from typing import IO
+
+import requests
+from loguru import logger
+
+import app.data.storage.active
+import app.http
+from app.constants import METADATA_EXTENSION
+from app.models.code_file import CodeFile
+from app.models.exceptions import MetadataUnavailable
+from app.models.metadata_file import MetadataFile
+
+WHEEL_EXTENSION = ".whl"
+DIST_INFO_SUFFIX = ".dist-info"
+METADATA_FILENAME = "METADATA"
+# zipfile reads the end of the file in a few small pieces, so read ahead a little
+RANGE_BUFFER_SIZE = 64 * 1024
+
+
+class HttpRangeFile(io.RawIOBase):
+    """
+    A read-only, seekable file backed by HTTP range requests.
+    Lets zipfile read the central directory and a single member of a remote wheel
+    without downloading the rest of it.
+    """
+
+    def __init__(self, url: str, size: int) -> None:
+        self._url = url
+        self._size = size
+        self._position = 0
+        self._session = requests.Session()
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self._size + offset
+        return self._position
+
+    def readinto(self, buffer: bytearray | memoryview) -> int:  # type: ignore[override]
+        end = min(self._position + len(buffer), self._size) - 1
+        if end < self._position:
+            return 0
+
+        with app.http.stream_range(self._url, self._position, end, session=self._session) as response:
+            response.raise_for_status()
+            if response.status_code != requests.codes.partial_content:
+                raise MetadataUnavailable(self._url, "upstream does not support range requests")
+            data = response.content
+
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self) -> None:
+        self._session.close()
+        super().close()
+
+
+def _open_upstream(code_file: CodeFile) -> IO[bytes]:
+    """
+    Open a wheel on the upstream server
+    """
+    try:
+        response = app.http.hedged_head(code_file.upstream_urls)
+    except requests.exceptions.RequestException as e:
+        raise MetadataUnavailable(code_file.filename, str(e))
+
+    if response.headers.get("Accept-Ranges") != "bytes" or "Content-Length" not in response.headers:
+        raise MetadataUnavailable(code_file.filename, "upstream does not support range requests")
+
+    # use the final URL, so each range doesn't have to follow redirects again
+    raw = HttpRangeFile(response.url, int(response.headers["Content-Length"]))
+    return io.BufferedReader(raw, buffer_size=RANGE_BUFFER_SIZE)
+
+
+def _find_metadata(zip_file: zipfile.ZipFile) -> str | None:
+    """
+    Find the METADATA file in the top-level .dist-info directory of a wheel
+    """
+    for name in zip_file.namelist():
+        parts = name.split("/")
+        if len(parts) == 2 and parts[0].endswith(DIST_INFO_SUFFIX) and parts[1] == METADATA_FILENAME:
+            return name
+    return None
+
+
+def extract_metadata(code_file: CodeFile) -> bytes:
+    """
+    Extract the METADATA file from a wheel.
+    Cached wheels are read from storage, otherwise only the needed parts are
+    requested from upstream.
+    """
+    if code_file.is_cached:
+        fp = app.data.storage.active.StorageDriver.open_file(code_file)
+    else:
+        fp = _open_upstream(code_file)
+
+    with fp:
+        try:
+            with zipfile.ZipFile(fp) as zip_file:
+                name = _find_metadata(zip_file)
+                if name is None:
+                    raise MetadataUnavailable(code_file.filename, "no METADATA file in wheel")
+
+                logger.debug(f"Extracting {name} from {code_file.filename}")
+                return zip_file.read(name)
+        except (zipfile.BadZipFile, requests.exceptions.RequestException) as e:
+            raise MetadataUnavailable(code_file.filename, str(e))
+
+
+def add_synthesized_metadata_files(code_files: list[CodeFile]) -> None:
+    """
+    Add a metadata file to every wheel that upstream didn't provide one for.
+    Nothing is downloaded until a metadata file is requested.
+    """
+    for code_file in code_files:
+        if code_file.metadata_file is not None or not code_file.filename.endswith(WHEEL_EXTENSION):
+            continue
+
+        code_file.metadata_file = MetadataFile(
+            filename=f"{code_file.filename}{METADATA_EXTENSION}",
+            upstream_url=code_file.upstream_url,
+            version=code_file.version,
+            code_file=code_file,
+            is_synthesized=True,
+        )
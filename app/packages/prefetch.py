@@ -0,0 +1,124 @@
+"""
+Fetch metadata files in the background when a package is refreshed,
+so a resolver walking a package's metadata only hits local storage
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import threading
+import uuid
+from typing import TYPE_CHECKING
+
+import flask
+import packaging.version
+from loguru import logger
+from sqlalchemy import select
+
+import app.packages.jobs
+from app.constants import METADATA_PREFETCH_WORKERS
+from app.models.database import db
+from app.models.metadata_file import MetadataFile
+
+if TYPE_CHECKING:
+    from app.models.package import Package  # pragma: no cover
+
+# shared by every request, so prefetching is bounded per process
+_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=METADATA_PREFETCH_WORKERS, thread_name_prefix="metadata-prefetch"
+)
+# metadata files queued or being fetched, so concurrent refreshes don't fetch them twice
+_in_flight: set[uuid.UUID] = set()
+_in_flight_lock = threading.Lock()
+
+
+def _parse_version(version_text: str) -> packaging.version.Version | None:
+    """
+    Parse a version, returning None if it can't be parsed
+    """
+    try:
+        return packaging.version.Version(version_text)
+    except packaging.version.InvalidVersion:
+        return None
+
+
+def _newest_versions(package: Package, count: int) -> set[packaging.version.Version]:
+    """
+    Find the newest versions of a package. Versions that can't be parsed are ignored.
+    """
+    versions = {_parse_version(code_file.version_text) for code_file in package.code_files}
+    versions.discard(None)
+    return set(sorted(versions, reverse=True)[:count])  # type: ignore[type-var]
+
+
+def _fetch(flask_app: flask.Flask, metadata_file_ids: list[uuid.UUID]) -> None:
+    """
+    Fetch a batch of metadata files in a background thread, committing once at the end
+    """
+    # local import, as the data module schedules prefetching
+    import app.packages.data
+
+    try:
+        with flask_app.app_context():
+            metadata_files = (
+                db.session.execute(select(MetadataFile).where(MetadataFile.id.in_(metadata_file_ids)))
+                .unique()
+                .scalars()
+            )
+            for metadata_file in metadata_files:
+                if metadata_file.is_cached:
+                    continue
+
+                try:
+                    app.packages.data.store_package_file(metadata_file)
+                except Exception as e:
+                    # the file will still be fetched when it is requested
+                    logger.warning(f"Unable to prefetch {metadata_file.filename}: {e}")
+
+            db.session.commit()
+            logger.debug(f"Prefetched {len(metadata_file_ids)} metadata files")
+    finally:
+        with _in_flight_lock:
+            _in_flight.difference_update(metadata_file_ids)
+
+
+def prefetch_metadata_files(package: Package) -> None:
+    """
+    Queue the metadata files for the newest versions of a package to be fetched in the background.
+    Does nothing unless the repository has prefetching enabled.
+    """
+    count = package.repository.prefetch_metadata_versions
+    if count <= 0 or package.repository.is_offline:
+        return
+
+    versions = _newest_versions(package, count)
+    metadata_file_ids = [
+        code_file.metadata_file.id
+        for code_file in package.code_files
+        if code_file.metadata_file is not None
+        and not code_file.metadata_file.is_cached
+        # compared as versions, as upstream's text may not be normalized
+        and _parse_version(code_file.version_text) in versions
+    ]
+
+    if app.packages.jobs.is_enabled():
+        # download workers will pick these up
+        for code_file in package.code_files:
+            if code_file.metadata_file is not None and code_file.metadata_file.id in metadata_file_ids:
+                app.packages.jobs.enqueue(code_file.metadata_file)
+        return
+
+    with _in_flight_lock:
+        metadata_file_ids = [id_ for id_ in metadata_file_ids if id_ not in _in_flight]
+        _in_flight.update(metadata_file_ids)
+
+    if not metadata_file_ids:
+        return
+
+    logger.debug(f"Prefetching {len(metadata_file_ids)} metadata files for {package.log_name}")
+    # spread the files across the workers, each commits its share once
+    flask_app = flask.current_app._get_current_object()  # type: ignore[attr-defined]
+    for i in range(METADATA_PREFETCH_WORKERS):
+        batch = metadata_file_ids[i::METADATA_PREFETCH_WORKERS]
+        if batch:
+            _executor.submit(_fetch, flask_app, batch)
@@ -0,0 +1,427 @@
+"""
+Export the database, and optionally stored files, to a single streamed archive, and load it elsewhere.
+A node loaded from a snapshot starts warm, rather than filling up from live traffic.
+
+The archive is a gzipped tar stream, so it can be piped between hosts. It holds a manifest,
+then each table as numbered batches of JSON lines, parents before children,
+then each stored file under its storage path.
+"""
+
+from __future__ import annotations
+
+import collections
+import concurrent.futures
+import dataclasses
+import datetime
+import io
+import json
+import os
+import pathlib
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+from typing import IO, TYPE_CHECKING, Any, Iterator
+
+import flask
+from loguru import logger
+from sqlalchemy import DateTime, Table, Uuid, insert, select, update
+
+import app.data.sql
+import app.data.storage.active
+from app.constants import DOWNLOAD_CHUNK_SIZE, SNAPSHOT_BATCH_ROWS
+from app.data.storage.integrity import StreamVerifier
+from app.models.code_file import CodeFile
+from app.models.database import db
+from app.models.metadata_file import MetadataFile
+from app.models.package import Package
+from app.models.repository import Repository
+
+if TYPE_CHECKING:
+    from app.models.package_file import PackageFile  # pragma: no cover
+
+SNAPSHOT_VERSION = 2
+MANIFEST_NAME = "manifest.json"
+TABLES_PREFIX = "tables/"
+FILES_PREFIX = "files/"
+
+# parents before children, so every row's parents are loaded before it
+TABLES: list[Table] = [
+    Repository.__table__,  # type: ignore[list-item]
+    Package.__table__,  # type: ignore[list-item]
+    CodeFile.__table__,  # type: ignore[list-item]
+    MetadataFile.__table__,  # type: ignore[list-item]
+]
+TABLES_BY_NAME = {table.name: table for table in TABLES}
+FILE_MODELS: dict[str, type[PackageFile]] = {
+    CodeFile.__tablename__: CodeFile,
+    MetadataFile.__tablename__: MetadataFile,
+}
+# rows are only loaded if the parents they reference were loaded too
+PARENT_COLUMNS = {
+    "code_file": ["package_id"],
+    "metadata_file": ["package_id", "code_file_id"],
+}
+
+
+@dataclasses.dataclass
+class SnapshotReport:
+    """
+    Dataclass to hold the outcome of an export or import
+    """
+
+    rows: int = 0
+    skipped_rows: int = 0
+    files: int = 0
+    # files that no loaded row is waiting on, as their packages were already here
+    skipped_files: int = 0
+    file_bytes: int = 0
+    failed_files: list[str] = dataclasses.field(default_factory=list)
+    elapsed_seconds: float = 0
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__} in a snapshot")
+
+
+def _decode(table: Table, row: dict[str, Any]) -> dict[str, Any]:
+    """
+    Turn a row back into column values. Columns this version doesn't have are dropped.
+    """
+    decoded = {}
+    for column in table.columns:
+        if column.name not in row:
+            continue
+
+        value = row[column.name]
+        if value is not None and isinstance(column.type, Uuid):
+            value = uuid.UUID(value)
+        elif value is not None and isinstance(column.type, DateTime):
+            value = datetime.datetime.fromisoformat(value)
+        decoded[column.name] = value
+    return decoded
+
+
+def _is_safe_path(path: str) -> bool:
+    """
+    Is a storage path relative, without parent references, so it can't point outside storage?
+    """
+    pure_path = pathlib.PurePosixPath(path.replace("\\", "/"))
+    return not pure_path.is_absolute() and ".." not in pure_path.parts
+
+
+def _add_member(archive: tarfile.TarFile, name: str, fileobj: IO[bytes], size: int) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(time.time())
+    archive.addfile(info, fileobj)
+
+
+def _storage_paths(table: Table, rows: list[dict[str, Any]]) -> dict[uuid.UUID, str]:
+    """
+    Find the storage paths of the cached files in a batch of package file rows.
+    Files stored before storage paths were recorded get theirs now, so they can be matched up on import.
+    """
+    paths = {row["id"]: row["storage_path"] for row in rows if row["is_cached"] and row["storage_path"]}
+
+    missing = [row["id"] for row in rows if row["is_cached"] and not row["storage_path"]]
+    if missing:
+        model = FILE_MODELS[table.name]
+        for package_file in db.session.execute(select(model).where(model.id.in_(missing))).unique().scalars():
+            paths[package_file.id] = app.data.storage.active.StorageDriver._get_path(package_file)
+    return paths
+
+
+def _iter_stored_files() -> Iterator[tuple[str, type[PackageFile], uuid.UUID]]:
+    """
+    Find every file in storage, in batches, with the first package file that references it
+    """
+    seen: set[str] = set()
+    for table_name, model in FILE_MODELS.items():
+        table = TABLES_BY_NAME[table_name]
+        result = db.session.execute(
+            select(table.c.id, table.c.is_cached, table.c.storage_path).where(table.c.is_cached),
+            execution_options={"yield_per": SNAPSHOT_BATCH_ROWS},
+        )
+        for partition in result.mappings().partitions():
+            for package_file_id, path in _storage_paths(table, [dict(row) for row in partition]).items():
+                # files with the same content share a path
+                if path not in seen:
+                    seen.add(path)
+                    yield path, model, package_file_id
+
+
+def _export_tables(archive: tarfile.TarFile, report: SnapshotReport) -> None:
+    """
+    Write every table in batches, so memory use doesn't grow with the database
+    """
+    for table in TABLES:
+        result = db.session.execute(select(table), execution_options={"yield_per": SNAPSHOT_BATCH_ROWS})
+        for number, partition in enumerate(result.mappings().partitions()):
+            rows = [dict(row) for row in partition]
+            if table.name in FILE_MODELS:
+                rows_by_id = {row["id"]: row for row in rows}
+                for package_file_id, path in _storage_paths(table, rows).items():
+                    rows_by_id[package_file_id]["storage_path"] = path
+
+            lines = [json.dumps(row, default=_encode) for row in rows]
+
+            data = "\n".join(lines).encode()
+            _add_member(archive, f"{TABLES_PREFIX}{table.name}/{number:06d}.jsonl", io.BytesIO(data), len(data))
+            report.rows += len(partition)
+
+
+def _read_stored_file(flask_app: flask.Flask, model: type[PackageFile], package_file_id: uuid.UUID) -> IO[bytes]:
+    """
+    Copy a stored file to a temporary file, as storage may be remote
+    """
+    with flask_app.app_context():
+        package_file = db.session.get(model, package_file_id)
+        assert package_file is not None
+
+        temporary_file = tempfile.TemporaryFile()
+        with app.data.storage.active.StorageDriver.open_file(package_file) as fp:
+            shutil.copyfileobj(fp, temporary_file, DOWNLOAD_CHUNK_SIZE)
+        return temporary_file
+
+
+def _export_files(
+    flask_app: flask.Flask,
+    archive: tarfile.TarFile,
+    stored_files: Iterator[tuple[str, type[PackageFile], uuid.UUID]],
+    concurrency: int,
+    report: SnapshotReport,
+) -> None:
+    """
+    Write every stored file. Files are read from storage concurrently, a bounded
+    number ahead, while they are written to the archive one after another.
+    """
+    window: collections.deque[tuple[str, concurrent.futures.Future]] = collections.deque()
+
+    def write_next() -> None:
+        path, future = window.popleft()
+        try:
+            temporary_file = future.result()
+        except Exception as e:
+            logger.warning(f"Unable to read {path} from storage: {e}")
+            report.failed_files.append(path)
+            return
+
+        with temporary_file:
+            size = temporary_file.seek(0, os.SEEK_END)
+            temporary_file.seek(0)
+            _add_member(archive, f"{FILES_PREFIX}{path}", temporary_file, size)
+        report.files += 1
+        report.file_bytes += size
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="snapshot") as executor:
+        for path, model, package_file_id in stored_files:
+            window.append((path, executor.submit(_read_stored_file, flask_app, model, package_file_id)))
+            if len(window) >= concurrency * 2:
+                write_next()
+
+        while window:
+            write_next()
+
+
+def export_snapshot(flask_app: flask.Flask, fileobj: IO[bytes], with_files: bool, concurrency: int) -> SnapshotReport:
+    """
+    Write a snapshot of the database, and optionally every stored file, to a stream
+    """
+    report = SnapshotReport()
+    start = time.monotonic()
+
+    with tarfile.open(fileobj=fileobj, mode="w|gz") as archive:
+        manifest = json.dumps(
+            {"version": SNAPSHOT_VERSION, "created": datetime.datetime.now().isoformat(), "with_files": with_files}
+        ).encode()
+        _add_member(archive, MANIFEST_NAME, io.BytesIO(manifest), len(manifest))
+
+        _export_tables(archive, report)
+        if with_files:
+            _export_files(flask_app, archive, _iter_stored_files(), concurrency, report)
+
+    report.elapsed_seconds = time.monotonic() - start
+    return report
+
+
+class _TableLoader:
+    """
+    Load batches of rows into this database. Repositories come from the config, so are matched up
+    by slug rather than loaded, and packages that already exist here are left alone, along with their files.
+    """
+
+    def __init__(self, shared_storage: bool) -> None:
+        self._shared_storage = shared_storage
+        # snapshot repository ids to ours
+        self._repository_ids: dict[uuid.UUID, uuid.UUID] = {}
+        # every row loaded so far, so children of skipped rows are skipped too
+        self._loaded: set[uuid.UUID] = set()
+
+    def _accept_package(self, rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        existing = set(
+            db.session.execute(
+                select(Package.repository_id, Package.name).where(Package.name.in_({row["name"] for row in rows}))
+            ).tuples()
+        )
+
+        accepted = []
+        for row in rows:
+            repository_id = self._repository_ids.get(row["repository_id"])
+            if repository_id is None or (repository_id, row["name"]) in existing:
+                continue
+            row["repository_id"] = repository_id
+            accepted.append(row)
+        return accepted
+
+    def load(self, table: Table, rows: list[dict[str, Any]], report: SnapshotReport) -> None:
+        rows = [_decode(table, row) for row in rows]
+
+        if table.name == Repository.__tablename__:
+            for row in rows:
+                repository = app.data.sql.get_repository(row["slug"])
+                if repository is None:
+                    logger.warning(f"Skipping repository {row['slug']}, as it isn't configured here")
+                    continue
+                self._repository_ids[row["id"]] = repository.id
+            return
+
+        if table.name == Package.__tablename__:
+            accepted = self._accept_package(rows)
+        else:
+            parent_columns = PARENT_COLUMNS[table.name]
+            accepted = [row for row in rows if all(row[column] in self._loaded for column in parent_columns)]
+
+        if table.name in FILE_MODELS:
+            for row in accepted:
+                if row.get("storage_path") and not _is_safe_path(row["storage_path"]):
+                    logger.warning(f"Not trusting storage path {row['storage_path']} of {row['filename']}")
+                    # fetched from upstream when next requested instead
+                    row["storage_path"] = None
+                    row["is_cached"] = False
+
+        if "is_cached" in table.columns and not self._shared_storage:
+            # files are only cached once they arrive
+            for row in accepted:
+                row["is_cached"] = False
+
+        if accepted:
+            db.session.execute(insert(table), accepted)
+            db.session.commit()
+
+        self._loaded.update(row["id"] for row in accepted)
+        report.rows += len(accepted)
+        report.skipped_rows += len(rows) - len(accepted)
+
+
+def _store_file(flask_app: flask.Flask, path: str, local_path: pathlib.Path) -> int | None:
+    """
+    Verify a file from a snapshot against the package files that reference it, store it,
+    and mark them as cached. Returns the size of the file, or None if no package file is waiting on it,
+    such as when its package was already here and so wasn't loaded.
+    """
+    try:
+        with flask_app.app_context():
+            package_file: PackageFile | None = None
+            for model in FILE_MODELS.values():
+                package_file = (
+                    db.session.execute(
+                        select(model).where(model.storage_path == path, model.is_cached.is_(False)).limit(1)
+                    )
+                    .unique()
+                    .scalar_one_or_none()
+                )
+                if package_file is not None:
+                    break
+
+            if package_file is None:
+                logger.debug(f"Skipping {path}, as nothing here is waiting on it")
+                return None
+
+            size = local_path.stat().st_size
+            with open(local_path, "rb") as fp:
+                verifier = StreamVerifier(package_file)
+                verifier.update_from_file(fp, size)
+                verifier.verify()
+
+            app.data.storage.active.StorageDriver.save_local_file(package_file, local_path)
+            for model in FILE_MODELS.values():
+                db.session.execute(update(model).where(model.storage_path == path).values(is_cached=True))
+            db.session.commit()
+            return size
+    finally:
+        local_path.unlink(missing_ok=True)
+
+
+def import_snapshot(
+    flask_app: flask.Flask, fileobj: IO[bytes], shared_storage: bool, concurrency: int
+) -> SnapshotReport:
+    """
+    Load a snapshot from a stream. Rows are inserted in batches, and files are verified
+    and stored concurrently, a bounded number at a time, while the archive is read.
+    With shared storage, files the snapshot marks as cached are trusted to already be in storage.
+    """
+    report = SnapshotReport()
+    start = time.monotonic()
+    loader = _TableLoader(shared_storage)
+
+    # bounds the temporary files waiting to be stored
+    slots = threading.Semaphore(concurrency * 2)
+    storing: dict[concurrent.futures.Future, str] = {}
+
+    def release(future: concurrent.futures.Future) -> None:
+        slots.release()
+
+    with (
+        tempfile.TemporaryDirectory() as temporary_directory,
+        concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="snapshot") as executor,
+        tarfile.open(fileobj=fileobj, mode="r|*") as archive,
+    ):
+        for number, member in enumerate(archive):
+            member_fp = archive.extractfile(member)
+            if member_fp is None:
+                continue
+
+            if member.name == MANIFEST_NAME:
+                manifest = json.load(member_fp)
+                if manifest["version"] != SNAPSHOT_VERSION:
+                    raise ValueError(f"Unsupported snapshot version {manifest['version']}")
+
+            elif member.name.startswith(TABLES_PREFIX):
+                table = TABLES_BY_NAME[member.name.removeprefix(TABLES_PREFIX).split("/")[0]]
+                rows = [json.loads(line) for line in member_fp.read().splitlines() if line]
+                loader.load(table, rows, report)
+
+            elif member.name.startswith(FILES_PREFIX):
+                path = member.name.removeprefix(FILES_PREFIX)
+                # members must be read in order, so copy it out for a thread to store
+                local_path = pathlib.Path(temporary_directory, str(number))
+                slots.acquire()
+                with open(local_path, "wb") as fp:
+                    shutil.copyfileobj(member_fp, fp, DOWNLOAD_CHUNK_SIZE)
+                future = executor.submit(_store_file, flask_app, path, local_path)
+                future.add_done_callback(release)
+                storing[future] = path
+
+        for future in concurrent.futures.as_completed(storing):
+            try:
+                size = future.result()
+            except Exception as e:
+                logger.warning(f"Unable to store {storing[future]}: {e}")
+                report.failed_files.append(storing[future])
+                continue
+
+            if size is None:
+                report.skipped_files += 1
+            else:
+                report.file_bytes += size
+                report.files += 1
+
+    report.elapsed_seconds = time.monotonic() - start
+    return report
@@ -0,0 +1,236 @@
+"""
+Mirror every file of chosen packages ahead of time, for builds that can't reach upstream.
+Progress is checkpointed to a file, so an interrupted sync picks up where it left off.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import dataclasses
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from typing import TYPE_CHECKING, Callable
+
+import flask
+import lxml.html
+from loguru import logger
+
+import app.data.sql
+import app.http
+import app.packages.data
+import app.packages.warmup
+from app.config import RepositoryConfig
+from app.constants import CONTENT_TYPE_HEADER
+from app.models.code_file import CodeFile
+from app.models.exceptions import IndexParsingError
+from app.models.metadata_file import MetadataFile
+from app.packages.simple import (
+    PYPI_CONTENT_TYPE_HTML_V1,
+    PYPI_CONTENT_TYPE_INDEX_FORMAT_MAPPING,
+    PYPI_CONTENT_TYPE_JSON_V1,
+    IndexFormat,
+    normalize_name,
+)
+
+if TYPE_CHECKING:
+    from app.models.package_file import PackageFile  # pragma: no cover
+
+
+@dataclasses.dataclass
+class SyncReport:
+    """
+    Dataclass to hold the outcome of a sync
+    """
+
+    packages: int = 0
+    unchanged: int = 0
+    resumed: int = 0
+    downloaded: int = 0
+    queued: int = 0
+    downloaded_bytes: int = 0
+    failed: list[str] = dataclasses.field(default_factory=list)
+    elapsed_seconds: float = 0
+
+
+class Checkpoint:
+    """
+    File of the packages a sync has finished, one per line.
+    Lines are appended as packages finish, so an interrupted sync loses at most one line.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self.done: set[str] = set()
+        if os.path.exists(path):
+            with open(path) as fp:
+                self.done = {line.strip() for line in fp if line.strip()}
+
+    def mark(self, key: str) -> None:
+        with self._lock:
+            self.done.add(key)
+            with open(self.path, "a") as fp:
+                fp.write(f"{key}\n")
+
+    def clear(self) -> None:
+        """
+        Forget progress once a sync has finished, so the next sync checks everything again
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def list_upstream_projects(simple_url: str, timeout: int) -> dict[str, int | None]:
+    """
+    Fetch every project name from an upstream index,
+    along with its change serial if the index reports one
+    """
+    headers = {"Accept": f"{PYPI_CONTENT_TYPE_JSON_V1};q=1,{PYPI_CONTENT_TYPE_HTML_V1};q=0.2"}
+    response = app.http.get(f"{simple_url}/", headers=headers, timeout=timeout)
+    response.raise_for_status()
+
+    index_format = PYPI_CONTENT_TYPE_INDEX_FORMAT_MAPPING.get(response.headers.get(CONTENT_TYPE_HEADER, ""))
+    if index_format == IndexFormat.json:
+        return {
+            normalize_name(project["name"]): project.get("_last-serial")
+            for project in json.loads(response.text)["projects"]
+        }
+    if index_format == IndexFormat.html:
+        return {normalize_name(anchor.text_content()): None for anchor in lxml.html.fromstring(response.text).iter("a")}
+    raise IndexParsingError(response.url)
+
+
+def select_packages(repository_config: RepositoryConfig) -> dict[str, int | None]:
+    """
+    Choose the packages to sync for a repository, with their upstream serial if known.
+    The upstream project list is only fetched when a pattern is configured, as it can be very large.
+    """
+    packages: dict[str, int | None] = {normalize_name(name): None for name in repository_config.sync_packages}
+
+    if repository_config.sync_pattern is not None:
+        pattern = re.compile(repository_config.sync_pattern)
+        projects = list_upstream_projects(
+            str(repository_config.simple_url).rstrip("/"), repository_config.timeout_seconds
+        )
+        # the listing serials apply to named packages too
+        packages = {name: projects.get(name) for name in packages}
+        packages.update({name: serial for name, serial in projects.items() if pattern.fullmatch(name)})
+
+    return packages
+
+
+def _refresh(
+    flask_app: flask.Flask, repository_slug: str, package_name: str, serial: int | None
+) -> tuple[bool, list[tuple[type[PackageFile], uuid.UUID]]]:
+    """
+    Bring a package up to date with upstream, and find its files that aren't in storage yet.
+    Returns whether the package was unchanged upstream, and the files to download.
+    """
+    with flask_app.app_context():
+        # the package is refreshed and its files checked, based on what we read here
+        app.data.sql.read_from_primary()
+        repository = app.data.sql.get_repository_with_exception(repository_slug)
+        package = app.data.sql.get_package(repository, package_name)
+
+        unchanged = False
+        if package is None:
+            package = app.packages.data.create_package_data(repository, package_name)
+        elif serial is not None and package.serial == serial:
+            # the listing says nothing has changed, skip fetching the page
+            unchanged = True
+        else:
+            # an ETag from the last sync lets upstream answer without the page
+            etag = package.etag
+            package = app.packages.data.update_package_data(repository, package)
+            unchanged = etag is not None and package.etag == etag
+
+        files: list[tuple[type[PackageFile], uuid.UUID]] = []
+        for code_file in package.code_files:
+            if not code_file.is_cached:
+                files.append((CodeFile, code_file.id))
+            if code_file.metadata_file is not None and not code_file.metadata_file.is_cached:
+                files.append((MetadataFile, code_file.metadata_file.id))
+        return unchanged, files
+
+
+def sync(
+    flask_app: flask.Flask,
+    repository_configs: list[RepositoryConfig],
+    checkpoint: Checkpoint,
+    concurrency: int,
+    progress: Callable[[str], None] | None = None,
+) -> SyncReport:
+    """
+    Sync every configured package of every repository. Packages are refreshed, and their files
+    downloaded, on a pool of threads. A package is checkpointed once all of its files are stored.
+    """
+    report = SyncReport()
+    start = time.monotonic()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="sync") as executor:
+        refreshing: dict[concurrent.futures.Future, str] = {}
+        for repository_config in repository_configs:
+            for package_name, serial in select_packages(repository_config).items():
+                key = f"{repository_config.slug}/{package_name}"
+                report.packages += 1
+                if key in checkpoint.done:
+                    report.resumed += 1
+                    continue
+                refreshing[executor.submit(_refresh, flask_app, repository_config.slug, package_name, serial)] = key
+
+        # files left to download per package, and packages with a file that failed
+        remaining: dict[str, int] = {}
+        failed_keys: set[str] = set()
+        downloading: dict[concurrent.futures.Future, str] = {}
+
+        def finish(key: str) -> None:
+            # failed packages are left out of the checkpoint, so they're tried again
+            if key in failed_keys:
+                return
+            checkpoint.mark(key)
+            if progress is not None:
+                progress(key)
+
+        for future in concurrent.futures.as_completed(refreshing):
+            key = refreshing[future]
+            try:
+                unchanged, files = future.result()
+            except Exception as e:
+                logger.warning(f"Unable to sync {key}: {e}")
+                report.failed.append(key)
+                continue
+
+            if unchanged:
+                report.unchanged += 1
+            if not files:
+                finish(key)
+                continue
+
+            remaining[key] = len(files)
+            for model, package_file_id in files:
+                downloading[executor.submit(app.packages.warmup.warm_file, flask_app, model, package_file_id)] = key
+
+        for future in concurrent.futures.as_completed(downloading):
+            key = downloading[future]
+            try:
+                _, outcome, size = future.result()
+            except Exception as e:
+                logger.warning(f"Unable to download a file of {key}: {e}")
+                if key not in failed_keys:
+                    failed_keys.add(key)
+                    report.failed.append(key)
+            else:
+                if outcome != "already_cached":
+                    setattr(report, outcome, getattr(report, outcome) + 1)
+                report.downloaded_bytes += size
+
+            remaining[key] -= 1
+            if remaining[key] == 0:
+                finish(key)
+
+    report.elapsed_seconds = time.monotonic() - start
+    return report
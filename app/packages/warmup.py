@@ -0,0 +1,293 @@
+"""
+Download every file referenced by lockfiles or requirements files ahead of time,
+so the first install after a dependency bump doesn't find an empty cache
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import dataclasses
+import os
+import threading
+import time
+import tomllib
+import urllib.parse
+import uuid
+from typing import TYPE_CHECKING, Callable
+
+import flask
+import packaging.requirements
+import packaging.specifiers
+import packaging.version
+from loguru import logger
+
+import app.data.sql
+import app.packages.data
+import app.packages.jobs
+from app.models.code_file import CodeFile
+from app.models.database import db
+from app.models.metadata_file import MetadataFile
+from app.packages.simple import normalize_name
+
+if TYPE_CHECKING:
+    from app.models.package_file import PackageFile  # pragma: no cover
+
+
+@dataclasses.dataclass
+class Pin:
+    """
+    Dataclass to hold a package to warm. Lockfiles name the exact files to download,
+    requirements files only a specifier, which is resolved to the newest matching version.
+    """
+
+    name: str
+    specifier: packaging.specifiers.SpecifierSet = dataclasses.field(default_factory=packaging.specifiers.SpecifierSet)
+    filenames: set[str] | None = None
+
+
+@dataclasses.dataclass
+class WarmupReport:
+    """
+    Dataclass to hold the outcome of a warmup
+    """
+
+    downloaded: int = 0
+    already_cached: int = 0
+    queued: int = 0
+    downloaded_bytes: int = 0
+    # filenames, with why they failed
+    failed: list[str] = dataclasses.field(default_factory=list)
+    not_found: list[str] = dataclasses.field(default_factory=list)
+    elapsed_seconds: float = 0
+
+
+def _url_filename(url: str) -> str:
+    return os.path.basename(urllib.parse.urlparse(url).path)
+
+
+def _locked_filenames(entry: dict) -> set[str]:
+    """
+    Find the filenames of the artifacts of a package in a TOML lockfile.
+    pylock.toml may give a name, otherwise it is the last part of the URL.
+    """
+    artifacts = list(entry.get("wheels", []))
+    if "sdist" in entry:
+        artifacts.append(entry["sdist"])
+
+    filenames = set()
+    for artifact in artifacts:
+        filename = artifact.get("name") or _url_filename(artifact.get("url", artifact.get("path", "")))
+        if filename:
+            filenames.add(filename)
+    return filenames
+
+
+def parse_uv_lock(text: str) -> list[Pin]:
+    """
+    Parse a uv.lock file. Packages without artifacts, such as the project itself, are skipped.
+    """
+    pins = []
+    for entry in tomllib.loads(text).get("package", []):
+        filenames = _locked_filenames(entry)
+        if filenames:
+            pins.append(Pin(name=normalize_name(entry["name"]), filenames=filenames))
+    return pins
+
+
+def parse_pylock(text: str) -> list[Pin]:
+    """
+    Parse a pylock.toml file, as specified by PEP 751
+    """
+    pins = []
+    for entry in tomllib.loads(text).get("packages", []):
+        filenames = _locked_filenames(entry)
+        if filenames:
+            pins.append(Pin(name=normalize_name(entry["name"]), filenames=filenames))
+    return pins
+
+
+def parse_requirements(text: str) -> list[Pin]:
+    """
+    Parse a requirements file. Options, such as hashes and index URLs,
+    and anything that isn't a requirement on a named package are skipped.
+    """
+    pins = []
+    # join continued lines before splitting off options
+    for line in text.replace("\\\n", " ").splitlines():
+        line = line.split(" #", 1)[0].split(" --", 1)[0].strip()
+        if not line or line.startswith(("#", "-")):
+            continue
+
+        try:
+            requirement = packaging.requirements.Requirement(line)
+        except packaging.requirements.InvalidRequirement:
+            logger.warning(f"Skipping requirement {line}")
+            continue
+
+        if requirement.url is None:
+            pins.append(Pin(name=normalize_name(requirement.name), specifier=requirement.specifier))
+    return pins
+
+
+def parse_file(path: str) -> list[Pin]:
+    """
+    Parse a lockfile or requirements file, based on its name
+    """
+    with open(path) as fp:
+        text = fp.read()
+
+    filename = os.path.basename(path)
+    if filename == "uv.lock":
+        return parse_uv_lock(text)
+    if filename.startswith("pylock.") and filename.endswith(".toml"):
+        return parse_pylock(text)
+    return parse_requirements(text)
+
+
+def select_code_files(code_files: list[CodeFile], pin: Pin) -> list[CodeFile]:
+    """
+    Choose the files to download for a pin. Without filenames,
+    every file of the newest version matching the specifier is chosen.
+    """
+    if pin.filenames is not None:
+        return [code_file for code_file in code_files if code_file.filename in pin.filenames]
+
+    versions: dict[packaging.version.Version, list[CodeFile]] = {}
+    for code_file in code_files:
+        try:
+            version = packaging.version.Version(code_file.version_text)
+        except packaging.version.InvalidVersion:
+            continue
+        if version in pin.specifier:
+            versions.setdefault(version, []).append(code_file)
+
+    if not versions:
+        return []
+    return versions[max(versions)]
+
+
+class RateLimiter:
+    """
+    Space out calls to at most a given number per second, across threads.
+    A rate of 0 is unlimited.
+    """
+
+    def __init__(self, per_second: float) -> None:
+        self._interval = 1 / per_second if per_second > 0 else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self._interval:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now)
+            self._next = start + self._interval
+
+        time.sleep(start - now)
+
+
+def _resolve(flask_app: flask.Flask, repository_slug: str, pin: Pin) -> dict[tuple[type[PackageFile], uuid.UUID], str]:
+    """
+    Refresh a package from upstream, and find the files to download for it, with their filenames
+    """
+    with flask_app.app_context():
+        # the package is refreshed based on what we read here
+        app.data.sql.read_from_primary()
+        package = app.packages.data.get_package(repository_slug, pin.name)
+        files: dict[tuple[type[PackageFile], uuid.UUID], str] = {}
+        for code_file in select_code_files(package.code_files, pin):
+            files[(CodeFile, code_file.id)] = code_file.filename
+            if code_file.metadata_file is not None:
+                files[(MetadataFile, code_file.metadata_file.id)] = code_file.metadata_file.filename
+        return files
+
+
+def warm_file(flask_app: flask.Flask, model: type[PackageFile], package_file_id: uuid.UUID) -> tuple[str, str, int]:
+    """
+    Download a single file to storage, or queue it for the download workers.
+    Returns the filename, what was done, and the bytes downloaded.
+    """
+    with flask_app.app_context():
+        # the file was only just found, and is about to be marked as cached
+        app.data.sql.read_from_primary()
+        package_file = db.session.get(model, package_file_id)
+        assert package_file is not None
+
+        if package_file.is_cached:
+            return package_file.filename, "already_cached", 0
+
+        if app.packages.jobs.is_enabled():
+            app.packages.jobs.enqueue(package_file)
+            return package_file.filename, "queued", 0
+
+        app.packages.data.store_package_file(package_file)
+        db.session.commit()
+        return package_file.filename, "downloaded", package_file.size or 0
+
+
+def warm(
+    flask_app: flask.Flask,
+    repository_slugs: list[str],
+    pins: list[Pin],
+    concurrency: int,
+    per_second: float,
+    progress: Callable[[int, int, str], None] | None = None,
+) -> WarmupReport:
+    """
+    Resolve every pin against every repository, then download every file found.
+    Downloads are spread across a pool of threads, and started at most per_second times a second.
+    """
+    report = WarmupReport()
+    start = time.monotonic()
+    limiter = RateLimiter(per_second)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="warmup") as executor:
+        resolving = {
+            executor.submit(_resolve, flask_app, repository_slug, pin): (repository_slug, pin)
+            for repository_slug in repository_slugs
+            for pin in pins
+        }
+
+        files: dict[tuple[type[PackageFile], uuid.UUID], str] = {}
+        for future in concurrent.futures.as_completed(resolving):
+            repository_slug, pin = resolving[future]
+            try:
+                found = future.result()
+            except Exception as e:
+                logger.warning(f"Unable to resolve {pin.name} in {repository_slug}: {e}")
+                report.not_found.append(f"{repository_slug}/{pin.name}")
+                continue
+
+            if not found:
+                report.not_found.append(f"{repository_slug}/{pin.name}")
+            # a package listed in several files is only downloaded once
+            files.update(found)
+
+        def warm_one(model: type[PackageFile], package_file_id: uuid.UUID) -> tuple[str, str, int]:
+            limiter.wait()
+            return warm_file(flask_app, model, package_file_id)
+
+        warming = {
+            executor.submit(warm_one, model, package_file_id): filename
+            for (model, package_file_id), filename in files.items()
+        }
+        for done, future in enumerate(concurrent.futures.as_completed(warming), start=1):
+            filename = warming[future]
+            try:
+                _, outcome, size = future.result()
+            except Exception as e:
+                logger.warning(f"Unable to warm {filename}: {e}")
+                report.failed.append(f"{filename}: {e}")
+            else:
+                # tallied here rather than in the threads, so counts aren't lost
+                setattr(report, outcome, getattr(report, outcome) + 1)
+                report.downloaded_bytes += size
+
+            if progress is not None:
+                progress(done, len(warming), filename)
+
+    report.elapsed_seconds = time.monotonic() - start
+    return report
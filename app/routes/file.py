@@ -1,20 +1,96 @@
+import flask
 from flask import Blueprint
 
+import app.data.access
+import app.data.cache.inline
 import app.data.storage.active
 import app.packages.data
-from app.data.cache.wrappers import cache_repository_timeout_decorator
+import app.utils
+from app.constants import METADATA_EXTENSION
+from app.data.cache.wrappers import cache_repository_timeout_function
 
 file_bp = Blueprint("file", __name__)
 
 
+def _inline_digest(repository_slug: str, package_name: str, filename: str) -> str | None:
+    """
+    Cache a file if needed, and return its sha256 if it can be served inline
+    """
+    package_file = app.packages.data.get_package_file(repository_slug, package_name, filename)
+    if not app.data.cache.inline.load(package_file):
+        return None
+    return package_file.sha256
+
+
+def _send_inline(filename: str, sha256: str, content: bytes) -> flask.Response:
+    """
+    Send a file kept inline, with its sha256 as a strong ETag
+    """
+    response = flask.Response(content, mimetype="application/octet-stream")
+    response.headers.set("Content-Disposition", "attachment", filename=filename)
+    response.set_etag(sha256)
+    app.utils.add_digest_headers(response, sha256)
+    return response.make_conditional(flask.request)
+
+
+def _is_download() -> bool:
+    """
+    Is the client downloading the whole file, rather than reading part of it, such as a
+    resolver reading a wheel's metadata, or resuming an interrupted download?
+    """
+    requested_range = flask.request.range
+    return requested_range is None or requested_range.ranges[0][0] == 0
+
+
+def _send_file(repository_slug: str, package_name: str, filename: str) -> flask.Response:
+    """
+    Cache a file if needed, and send it
+    """
+    package_file = app.packages.data.get_package_file(repository_slug, package_name, filename)
+    return app.data.storage.active.StorageDriver.send_file(package_file)
+
+
 @file_bp.route("/<string:repository_slug>/file/<string:package_name>/<string:version>/<string:filename>")
-@cache_repository_timeout_decorator
 def file_route(repository_slug: str, package_name: str, version: str, filename: str):
     """
     This route is used to download a specific file
     """
-    # this is not cached permamently because the file could potentially not exist
-    # and then exist at a future time
-    package_file = app.packages.data.get_package_file(repository_slug, package_name, filename)
+    storage_driver = app.data.storage.active.StorageDriver
 
-    return app.data.storage.active.StorageDriver.send_file(package_file)
+    # answer from what we know about the file, without downloading it
+    if flask.request.method == "HEAD":
+        package_file = app.packages.data.find_package_file(repository_slug, package_name, filename)
+        return storage_driver.head_file(package_file)
+
+    # eviction ranks files by downloads, so partial reads don't count
+    if _is_download():
+        app.data.access.record(repository_slug, package_name, filename)
+
+    # clients after part of a file, such as the zip central directory,
+    # shouldn't have to wait for the whole file to be cached
+    range_header = flask.request.headers.get("Range")
+    if range_header is not None:
+        package_file = app.packages.data.find_package_file(repository_slug, package_name, filename)
+        if not package_file.is_cached and package_file.has_upstream and not package_file.is_offline:
+            return storage_driver.send_upstream_range(package_file, range_header)
+
+        app.packages.data.cache_package_file(package_file)
+        return storage_driver.send_file(package_file)
+
+    kwargs = {"repository_slug": repository_slug, "package_name": package_name, "filename": filename}
+
+    # metadata files are small and resolvers fetch hundreds of them,
+    # so skip the round trip to storage
+    if filename.endswith(METADATA_EXTENSION) and app.data.cache.inline.is_enabled():
+        sha256 = cache_repository_timeout_function(_inline_digest, repository_slug, kwargs)
+        if sha256 is not None:
+            content = app.data.cache.inline.get_content(sha256)
+            if content is not None:
+                return _send_inline(filename, sha256, content)
+
+    # only redirects can be reused, a response with a body can only be sent once.
+    # This is not cached permamently because the file could potentially not exist
+    # and then exist at a future time
+    if storage_driver.redirects:
+        return cache_repository_timeout_function(_send_file, repository_slug, kwargs)
+    return _send_file(**kwargs)
@@ -1,9 +1,10 @@
+import base64
 import functools
 import time
 from contextlib import contextmanager
 from typing import Any, Callable, Generator
 
-from flask import url_for
+from flask import Response, url_for
 from loguru import logger
 
 from app.config import Config
@@ -50,3 +51,14 @@ def time_this_decorator(message: str) -> Callable:
         return wrapper
 
     return decorator
+
+
+def add_digest_headers(response: Response, sha256: str | None) -> Response:
+    """
+    Add the sha256 of a file as Digest and Repr-Digest headers, so clients can verify downloads
+    """
+    if sha256 is not None:
+        encoded = base64.b64encode(bytes.fromhex(sha256)).decode()
+        response.headers["Digest"] = f"sha-256={encoded}"
+        response.headers["Repr-Digest"] = f"sha-256=:{encoded}:"
+    return response
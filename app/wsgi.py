@@ -1,6 +1,7 @@
 from flask import Flask, Response, request
 from loguru import logger
 
+import app.models.instrumentation
 from app.config import Config
 
 
@@ -14,8 +15,15 @@ def init_app_db(flask_app: Flask) -> None:
     and database.
     """
     import app.models.database
+    import app.models.engine
+    import app.models.routing
 
     flask_app.config["SQLALCHEMY_DATABASE_URI"] = Config.database.url
+    flask_app.config["SQLALCHEMY_ENGINE_OPTIONS"] = app.models.engine.engine_options(Config.database.url)
+    flask_app.config["SQLALCHEMY_BINDS"] = {
+        bind_key: {"url": url, **app.models.engine.engine_options(url)}
+        for bind_key, url in app.models.routing.replica_binds().items()
+    }
     app.models.database.init_db(flask_app, create=True)
 
 
@@ -25,9 +33,12 @@ def create_app() -> Flask:
     """
     flask_app = app_factory()
 
+    app.models.instrumentation.install()
+
     @flask_app.before_request
     def log_before_request() -> None:
         logger.info(f"{request.method} {request.full_path}")
+        app.models.instrumentation.start()
 
     @flask_app.after_request
     def log_after_request(response: Response) -> Response:
@@ -36,6 +47,12 @@ def create_app() -> Flask:
             # show redirect
             text = f"{text} {response.location}"
 
+        # database use, which for a streamed response doesn't include the body
+        stats = app.models.instrumentation.get_stats()
+        if stats is not None:
+            text = f"{text} ({stats})"
+            response.headers.add("Server-Timing", stats.server_timing)
+
         logger.info(text)
         return response
 
@@ -64,4 +81,21 @@ def create_app() -> Flask:
     flask_app.register_blueprint(healthcheck_bp)
     flask_app.register_blueprint(simple_bp)
 
+    # setup commands
+    from app.commands.evict import evict_command
+    from app.commands.migrate import drop_hash_tables_command
+    from app.commands.offline import offline_command
+    from app.commands.snapshot import snapshot_group
+    from app.commands.sync import sync_command
+    from app.commands.warmup import warmup_command
+    from app.commands.worker import download_worker_command
+
+    flask_app.cli.add_command(drop_hash_tables_command)
+    flask_app.cli.add_command(evict_command)
+    flask_app.cli.add_command(offline_command)
+    flask_app.cli.add_command(snapshot_group)
+    flask_app.cli.add_command(sync_command)
+    flask_app.cli.add_command(warmup_command)
+    flask_app.cli.add_command(download_worker_command)
+
     return flask_app
@@ -0,0 +1,97 @@
+import datetime
+
+import pytest
+
+import app.data.sql
+
+from app.data.cache.database import DatabaseCache
+from app.data.cache.memory import MemoryCache
+
+
+def test_many_without_ttl() -> None:
+    """
+    Test batch operations on a cache that keeps expirations itself
+    """
+    cache = MemoryCache()
+    cache.set_many({"a": 1, "b": 2}, ttl=60)
+    cache.set_many({"c": 3}, ttl=None)
+    assert cache.get_many(["a", "b", "c", "missing"]) == {"a": 1, "b": 2, "c": 3}
+    assert cache.get("a") == 1
+
+    # expired values are removed along with their expirations
+    cache._set(cache._expiration_key("a"), (datetime.datetime.now() - datetime.timedelta(seconds=1)).isoformat())
+    assert cache.get_many(["a", "b"]) == {"b": 2}
+    assert cache._get("a") is None
+    assert cache._get(cache._expiration_key("a")) is None
+
+    cache.delete_many(["b", "c"])
+    assert cache.get_many(["b", "c"]) == {}
+    assert cache._cache == {}
+
+
+@pytest.mark.usefixtures("app_request_context")
+def test_many_database() -> None:
+    """
+    Test batch operations on the database cache, replacing existing values
+    """
+    cache = DatabaseCache()
+    cache.set_many({"a": 1, "b": 2}, ttl=60)
+    cache.set_many({"b": 3, "c": 4}, ttl=None)
+    assert cache.get_many(["a", "b", "c", "missing"]) == {"a": 1, "b": 3, "c": 4}
+
+    cache.set("a", 5, ttl=-1)
+    assert cache.get("a") is None
+
+    cache.delete_many(["b", "c"])
+    assert cache.get_many(["b", "c"]) == {}
+
+
+@pytest.mark.usefixtures("app_request_context")
+def test_set_database_concurrent(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that setting a key another process set since it was last read replaces it, rather than failing
+    """
+    cache = DatabaseCache()
+    cache.set("a", 1, ttl=None)
+
+    # as if the other process's value wasn't there yet when this one looked
+    monkeypatch.setattr(app.data.sql, "get_caches", lambda keys: [])
+    cache.set_many({"a": 2, "b": 3}, ttl=None)
+
+    monkeypatch.undo()
+    assert cache.get_many(["a", "b"]) == {"a": 2, "b": 3}
+
+
+def test_memory_max_keys() -> None:
+    """
+    Test that the memory cache drops the least recently used keys once it is full
+    """
+    cache = MemoryCache(max_keys=4)
+    cache.set("a", 1, ttl=None)
+    cache.set("b", 2, ttl=None)
+    assert cache.get("a") == 1
+
+    # each value is kept with its expiration, so "b" is dropped
+    cache.set("c", 3, ttl=None)
+    assert cache.get_many(["a", "b", "c"]) == {"a": 1, "c": 3}
+    assert len(cache._cache) <= 4
+
+
+def test_memory_max_bytes() -> None:
+    """
+    Test that the memory cache drops the least recently used keys once they hold too much
+    """
+    cache = MemoryCache(max_bytes=100)
+    cache.set("a", b"a" * 40, ttl=None)
+    cache.set("b", "b" * 30, ttl=None)
+
+    # replacing a value doesn't count it twice
+    cache.set("b", "b" * 20, ttl=None)
+    assert cache.get("a") == b"a" * 40
+
+    cache.set("c", b"c" * 30, ttl=None)
+    assert cache.get_many(["a", "b", "c"]) == {"a": b"a" * 40, "c": b"c" * 30}
+    assert cache._bytes <= 100
+
+    cache.delete_many(["a", "b", "c"])
+    assert cache._bytes == 0
@@ -0,0 +1,29 @@
+import app.data.cache.generation
+import app.data.cache.wrappers
+
+
+def test_generation() -> None:
+    """
+    Test that a package keeps its generation until it is bumped
+    """
+    generation = app.data.cache.generation.get("pypi", "generation-test")
+    assert app.data.cache.generation.get("pypi", "generation-test") == generation
+    assert app.data.cache.generation.get("pypi", "other") != generation
+
+    bumped = app.data.cache.generation.bump("pypi", "generation-test")
+    assert bumped != generation
+    assert app.data.cache.generation.get("pypi", "generation-test") == bumped
+
+
+def test_package_key() -> None:
+    """
+    Test that bumping a package's generation changes the keys of its pages, and only its pages
+    """
+    kwargs = {"repository_slug": "pypi", "package_name": "generation-key-test"}
+    key = app.data.cache.wrappers._package_key(test_package_key, "pypi", kwargs)
+    other_key = app.data.cache.wrappers._package_key(test_package_key, "pypi", {"repository_slug": "pypi"})
+    assert key == app.data.cache.wrappers._package_key(test_package_key, "pypi", kwargs)
+
+    app.data.cache.generation.bump("pypi", "generation-key-test")
+    assert app.data.cache.wrappers._package_key(test_package_key, "pypi", kwargs) != key
+    assert app.data.cache.wrappers._package_key(test_package_key, "pypi", {"repository_slug": "pypi"}) == other_key
@@ -0,0 +1,27 @@
+import hashlib
+
+import app.data.cache.inline
+from app.models.metadata_file import MetadataFile
+
+
+def test_set_content() -> None:
+    """
+    Test that only small, verified files are kept inline
+    """
+    content = b"Metadata-Version: 2.1\nName: test\n"
+    sha256 = hashlib.sha256(content).hexdigest()
+
+    # not verified yet
+    metadata_file = MetadataFile(filename="test-1.0-py3-none-any.whl.metadata")
+    app.data.cache.inline.set_content(metadata_file, content)
+    assert app.data.cache.inline.get_content(sha256) is None
+
+    # too big
+    metadata_file.sha256 = sha256
+    metadata_file.size = 1024 * 1024 * 1024
+    app.data.cache.inline.set_content(metadata_file, content)
+    assert app.data.cache.inline.get_content(sha256) is None
+
+    metadata_file.size = len(content)
+    app.data.cache.inline.set_content(metadata_file, content)
+    assert app.data.cache.inline.get_content(sha256) == content
@@ -0,0 +1,69 @@
+import pathlib
+import threading
+
+import pytest
+from flask import Flask
+
+from app.data.storage.filesystem import FilesystemStorage
+from app.models.code_file import CodeFile
+from app.models.package import Package
+
+
+def test_get_path(package: Package, tmp_path: pathlib.Path) -> None:
+    """
+    Test that files are stored by content when the sha256 is known
+    """
+    storage = FilesystemStorage(str(tmp_path))
+    code_file = CodeFile(package=package, filename="test-1.0.tar.gz", version="1.0", is_cached=False)
+
+    # no hash, so keyed by repository
+    assert storage._get_path(code_file) == "pypi/vscode-task-runner/1.0/test-1.0.tar.gz"
+
+    code_file.add_hash("sha256", "ABCDEF")
+    assert storage._get_path(code_file) == "sha256/ab/abcdef/test-1.0.tar.gz"
+
+    # files cached before content addressing stay where they were
+    code_file.is_cached = True
+    assert storage._get_path(code_file) == "pypi/vscode-task-runner/1.0/test-1.0.tar.gz"
+
+    # a recorded path always wins
+    code_file.storage_path = "somewhere/else.tar.gz"
+    assert storage._get_path(code_file) == "somewhere/else.tar.gz"
+
+
+def test_head_file(package: Package, tmp_path: pathlib.Path, app_request_context: None) -> None:
+    """
+    Test that a cached file is described from the database alone
+    """
+    storage = FilesystemStorage(str(tmp_path))
+    code_file = CodeFile(package=package, filename="test-1.0.tar.gz", size=1234, sha256="00" * 32)
+
+    response = storage.head_file(code_file)
+    assert response.content_length == 1234
+    assert response.headers["ETag"] == f'"{"00" * 32}"'
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert "Digest" in response.headers
+
+
+def test_start_index(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path, app: Flask) -> None:
+    """
+    Test that the index is only built once, the first time a request checks for a file
+    """
+    storage = FilesystemStorage(str(tmp_path))
+    builds = []
+    monkeypatch.setattr(storage, "build_index", lambda: builds.append(True))
+
+    # CLI commands don't build it
+    with app.app_context():
+        storage._start_index()
+    assert not storage._index_started
+
+    with app.test_request_context():
+        storage._start_index()
+        storage._start_index()
+    assert storage._index_started
+
+    for thread in threading.enumerate():
+        if thread.name == "storage-index":
+            thread.join()
+    assert builds == [True]
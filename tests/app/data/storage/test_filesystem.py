@@ -0,0 +1,242 @@
+import concurrent.futures
+import fcntl
+import hashlib
+import pathlib
+import time
+from typing import Iterator
+
+import pytest
+import requests
+
+import app.data.storage.segmented
+import app.http
+from app.config import StorageFilesystemOffload
+from app.constants import LOCK_EXTENSION, PARTIAL_EXTENSION, PROGRESS_EXTENSION
+from app.data.storage.filesystem import DownloadProgress, FilesystemStorage
+from app.models.code_file import CodeFile
+from app.models.package import Package
+
+
+@pytest.mark.parametrize(
+    "offload, header, expected",
+    (
+        (StorageFilesystemOffload.X_ACCEL_REDIRECT, "X-Accel-Redirect", "/protected/files/a%20b.tar.gz"),
+        (StorageFilesystemOffload.X_SENDFILE, "X-Sendfile", "files/a b.tar.gz"),
+    ),
+)
+def test_offload_file(
+    package: Package,
+    tmp_path: pathlib.Path,
+    app_request_context: None,
+    offload: StorageFilesystemOffload,
+    header: str,
+    expected: str,
+) -> None:
+    """
+    Test that offloaded downloads only point the proxy at the file
+    """
+    storage = FilesystemStorage(str(tmp_path), offload=offload, offload_prefix="/protected/")
+    code_file = CodeFile(package=package, filename="a b.tar.gz", storage_path="files/a b.tar.gz")
+    tmp_path.joinpath("files").mkdir()
+    tmp_path.joinpath("files", "a b.tar.gz").write_bytes(b"hello")
+
+    response = storage.send_file(code_file)
+    assert response.headers[header].endswith(expected)
+    assert "attachment" in response.headers["Content-Disposition"]
+    assert response.get_data() == b""
+
+
+def test_save_local_file(package: Package, tmp_path: pathlib.Path) -> None:
+    """
+    Test that a local file is copied into place, leaving the original
+    """
+    storage = FilesystemStorage(str(tmp_path.joinpath("storage")))
+    code_file = CodeFile(package=package, filename="a.tar.gz", storage_path="files/a.tar.gz")
+    local_path = tmp_path.joinpath("a.tar.gz")
+    local_path.write_bytes(b"hello")
+
+    storage.save_local_file(code_file, local_path)
+
+    assert tmp_path.joinpath("storage", "files", "a.tar.gz").read_bytes() == b"hello"
+    assert local_path.exists()
+
+
+@pytest.mark.parametrize("storage_path", ("../a.tar.gz", "files/../../a.tar.gz", "/tmp/a.tar.gz"))
+def test_save_local_file_outside(package: Package, tmp_path: pathlib.Path, storage_path: str) -> None:
+    """
+    Test that a storage path pointing outside storage is refused
+    """
+    storage = FilesystemStorage(str(tmp_path.joinpath("storage")))
+    code_file = CodeFile(package=package, filename="a.tar.gz", storage_path=storage_path)
+    local_path = tmp_path.joinpath("b.tar.gz")
+    local_path.write_bytes(b"hello")
+
+    with pytest.raises(ValueError):
+        storage.save_local_file(code_file, local_path)
+
+    assert not tmp_path.joinpath("a.tar.gz").exists()
+
+
+CONTENT = b"0123456789"
+
+
+class FakeStream:
+    def __init__(self, status_code: int, content: bytes) -> None:
+        self.status_code = status_code
+        self._content = content
+
+    def __enter__(self) -> "FakeStream":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        pass
+
+    def iter_content(self, chunk_size: int) -> Iterator[bytes]:
+        yield self._content
+
+
+@pytest.fixture
+def code_file(package: Package) -> CodeFile:
+    code_file = CodeFile(package=package, filename="a.tar.gz", upstream_url="https://a/a.tar.gz")
+    code_file.add_hash("sha256", hashlib.sha256(CONTENT).hexdigest())
+    return code_file
+
+
+@pytest.fixture
+def upstream(monkeypatch: pytest.MonkeyPatch) -> list[dict[str, str] | None]:
+    """
+    Record the headers of each request upstream. Ranges are honoured unless the test replaces this.
+    """
+    requests_made: list[dict[str, str] | None] = []
+
+    def hedged_stream(urls: list[str], headers: dict[str, str] | None = None) -> FakeStream:
+        requests_made.append(headers)
+        if headers is None:
+            return FakeStream(200, CONTENT)
+        start = int(headers["Range"].removeprefix("bytes=").removesuffix("-"))
+        return FakeStream(206, CONTENT[start:])
+
+    monkeypatch.setattr(app.data.storage.segmented, "probe", lambda package_file: None)
+    monkeypatch.setattr(app.http, "hedged_stream", hedged_stream)
+    return requests_made
+
+
+def _start_partial(storage: FilesystemStorage, code_file: CodeFile, content: bytes) -> pathlib.Path:
+    """
+    Leave behind a partial download, as if a previous attempt was interrupted
+    """
+    local_path = storage.local_path(code_file)
+    local_path.parent.mkdir(parents=True, exist_ok=True)
+    local_path.with_name(f"{local_path.name}{PARTIAL_EXTENSION}").write_bytes(content)
+    DownloadProgress(offset=len(content)).save(local_path.with_name(f"{local_path.name}{PROGRESS_EXTENSION}"))
+    return local_path
+
+
+def _assert_saved(local_path: pathlib.Path) -> None:
+    """
+    The file was moved into place, and nothing was left behind
+    """
+    assert local_path.read_bytes() == CONTENT
+    assert sorted(path.name for path in local_path.parent.iterdir()) == [local_path.name]
+
+
+def test_save_file_resume(tmp_path: pathlib.Path, code_file: CodeFile, upstream: list) -> None:
+    """
+    Test that an interrupted download resumes from the recorded offset
+    """
+    storage = FilesystemStorage(str(tmp_path))
+    local_path = _start_partial(storage, code_file, CONTENT[:4])
+
+    verifier = storage.save_file(code_file)
+    assert upstream == [{"Range": "bytes=4-"}]
+    assert verifier.sha256 == hashlib.sha256(CONTENT).hexdigest()
+    _assert_saved(local_path)
+
+
+def test_save_file_range_ignored(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path, code_file: CodeFile, upstream: list
+) -> None:
+    """
+    Test that the download starts over if upstream sends the whole file
+    """
+    monkeypatch.setattr(app.http, "hedged_stream", lambda urls, headers=None: FakeStream(200, CONTENT))
+    storage = FilesystemStorage(str(tmp_path))
+    local_path = _start_partial(storage, code_file, b"xxxx")
+
+    storage.save_file(code_file)
+    _assert_saved(local_path)
+
+
+@pytest.mark.parametrize("content_range, restarts", ((f"bytes */{len(CONTENT)}", False), ("bytes */100", True)))
+def test_save_file_range_not_satisfiable(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: pathlib.Path,
+    code_file: CodeFile,
+    upstream: list,
+    content_range: str,
+    restarts: bool,
+) -> None:
+    """
+    Test that a partial file that was already complete is kept, and anything else starts over
+    """
+    hedged_stream = app.http.hedged_stream
+
+    def not_satisfiable(urls: list[str], headers: dict[str, str] | None = None) -> FakeStream:
+        if headers is None:
+            return hedged_stream(urls, headers)
+        response = requests.Response()
+        response.status_code = 416
+        response.headers["Content-Range"] = content_range
+        raise requests.exceptions.HTTPError(response=response)
+
+    monkeypatch.setattr(app.http, "hedged_stream", not_satisfiable)
+    storage = FilesystemStorage(str(tmp_path))
+    local_path = _start_partial(storage, code_file, CONTENT)
+
+    storage.save_file(code_file)
+    assert upstream == ([None] if restarts else [])
+    _assert_saved(local_path)
+
+
+def test_save_file_known_size(tmp_path: pathlib.Path, code_file: CodeFile, upstream: list) -> None:
+    """
+    Test that a partial file of the expected size isn't requested again
+    """
+    code_file.size = len(CONTENT)
+    storage = FilesystemStorage(str(tmp_path))
+    local_path = _start_partial(storage, code_file, CONTENT)
+
+    storage.save_file(code_file)
+    assert upstream == []
+    _assert_saved(local_path)
+
+
+def test_save_file_lock(tmp_path: pathlib.Path, code_file: CodeFile, upstream: list) -> None:
+    """
+    Test that a download waits for another worker downloading the same file, and uses its result
+    """
+    storage = FilesystemStorage(str(tmp_path))
+    local_path = _start_partial(storage, code_file, b"")
+    partial_path = local_path.with_name(f"{local_path.name}{PARTIAL_EXTENSION}")
+
+    with open(local_path.with_name(f"{local_path.name}{LOCK_EXTENSION}"), "ab") as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            future = executor.submit(storage.save_file, code_file)
+            time.sleep(0.1)
+            assert not future.done()
+
+            # the other worker finishes, and a third starts downloading again, as if the file had been evicted
+            partial_path.replace(local_path)
+            local_path.write_bytes(CONTENT)
+            local_path.with_name(f"{local_path.name}{PROGRESS_EXTENSION}").unlink()
+            partial_path.write_bytes(b"third")
+            fcntl.flock(fp, fcntl.LOCK_UN)
+
+            assert future.result(timeout=5).sha256 == hashlib.sha256(CONTENT).hexdigest()
+
+    assert upstream == []
+    # the third worker's download is left alone
+    assert partial_path.read_bytes() == b"third"
+    partial_path.unlink()
+    _assert_saved(local_path)
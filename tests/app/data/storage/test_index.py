@@ -0,0 +1,22 @@
+from app.data.storage.index import ExistenceIndex
+
+
+def test_existence_index() -> None:
+    """
+    Test that the index answers from the listing and later changes
+    """
+    index = ExistenceIndex()
+    index.add("written/before/listing.whl")
+    # not built yet, so only changes are known
+    assert index.contains("listed.whl") is None
+    assert index.contains("written/before/listing.whl") is True
+
+    index.build(["listed.whl", "evicted.whl"])
+    assert index.contains("listed.whl") is True
+    assert index.contains("missing.whl") is False
+    assert index.contains("written/before/listing.whl") is True
+
+    index.remove("evicted.whl")
+    assert index.contains("evicted.whl") is False
+    index.add("evicted.whl")
+    assert index.contains("evicted.whl") is True
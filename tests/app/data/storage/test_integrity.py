@@ -0,0 +1,62 @@
+import hashlib
+
+import pytest
+
+from app.data.storage.integrity import StreamVerifier
+from app.models.code_file import CodeFile
+from app.models.exceptions import FileIntegrityError
+from app.models.package import Package
+
+
+@pytest.mark.parametrize(
+    "kind, value, should_pass",
+    (
+        ("sha256", hashlib.sha256(b"hello world").hexdigest(), True),
+        ("sha256", hashlib.sha256(b"hello world").hexdigest().upper(), True),
+        ("sha256", hashlib.sha256(b"goodbye world").hexdigest(), False),
+        ("md5", hashlib.md5(b"hello world").hexdigest(), True),
+        ("md5", hashlib.md5(b"goodbye world").hexdigest(), False),
+        # hashlib can't compute this one, so it can't fail verification
+        ("blake2b_256", hashlib.blake2b(b"goodbye world", digest_size=32).hexdigest(), True),
+    ),
+)
+def test_stream_verifier(package: Package, kind: str, value: str, should_pass: bool) -> None:
+    """
+    Test that chunks are hashed as they arrive and compared against upstream
+    """
+    code_file = CodeFile(package=package, filename="test.tar.gz")
+    code_file.add_hash(kind, value)
+
+    verifier = StreamVerifier(code_file)
+    verifier.update(b"hello ")
+    verifier.update(b"world")
+
+    # sha256 is always available, even if upstream didn't provide it
+    assert verifier.sha256 == hashlib.sha256(b"hello world").hexdigest()
+    assert verifier.size == len(b"hello world")
+
+    if should_pass:
+        verifier.verify()
+    else:
+        with pytest.raises(FileIntegrityError):
+            verifier.verify()
+
+
+def test_stream_verifier_parts(package: Package) -> None:
+    """
+    Test that parts arriving out of order are hashed in order
+    """
+    value = hashlib.sha256(b"abc").hexdigest()
+    code_file = CodeFile(package=package, filename="test.tar.gz")
+    code_file.add_hash("sha256", value)
+
+    verifier = StreamVerifier(code_file)
+    verifier.update_part(3, b"c")
+    verifier.update_part(1, b"a")
+
+    # part 2 is still missing
+    with pytest.raises(FileIntegrityError):
+        verifier.verify()
+
+    verifier.update_part(2, b"b")
+    verifier.verify()
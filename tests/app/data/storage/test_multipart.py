@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+
+from app.constants import MEGABYTES_TO_BYTES
+from app.data.storage.multipart import MultipartUpload
+
+
+class FakeS3:
+    """
+    Record the S3 calls made by an upload
+    """
+
+    def __init__(self, fail_part: int | None = None) -> None:
+        self.calls: list[tuple[str, dict]] = []
+        self.parts: dict[int, bytes] = {}
+        self.fail_part = fail_part
+        self.lock = threading.Lock()
+
+    def split_path(self, path: str) -> tuple[str, str, None]:
+        bucket, key = path.split("/", 1)
+        return bucket, key, None
+
+    def call_s3(self, method: str, **kwargs) -> dict:
+        with self.lock:
+            self.calls.append((method, kwargs))
+        if method == "create_multipart_upload":
+            return {"UploadId": "upload"}
+        if method == "upload_part":
+            if kwargs["PartNumber"] == self.fail_part:
+                raise OSError("part failed")
+            with self.lock:
+                self.parts[kwargs["PartNumber"]] = kwargs["Body"]
+            return {"ETag": f"etag{kwargs['PartNumber']}"}
+        return {}
+
+    def methods(self) -> list[str]:
+        return [method for method, _ in self.calls]
+
+
+def _upload(interface: FakeS3) -> MultipartUpload:
+    return MultipartUpload(interface, "bucket/key", part_size_megabytes=5, concurrency=2, checksums=True)  # type: ignore[arg-type]
+
+
+def test_multipart_upload() -> None:
+    """
+    Test that data is split into parts, which are completed in order with checksums
+    """
+    interface = FakeS3()
+    upload = _upload(interface)
+    data = b"x" * (12 * MEGABYTES_TO_BYTES)
+    for i in range(0, len(data), MEGABYTES_TO_BYTES):
+        upload.write(data[i : i + MEGABYTES_TO_BYTES])
+    upload.complete()
+
+    assert b"".join(interface.parts[i] for i in sorted(interface.parts)) == data
+    method, kwargs = interface.calls[-1]
+    assert method == "complete_multipart_upload"
+    parts = kwargs["MultipartUpload"]["Parts"]
+    assert [part["PartNumber"] for part in parts] == [1, 2, 3]
+    assert all("ChecksumSHA256" in part for part in parts)
+
+
+def test_multipart_upload_small() -> None:
+    """
+    Test that objects smaller than a part are uploaded with a single request
+    """
+    interface = FakeS3()
+    upload = _upload(interface)
+    upload.write(b"small")
+    upload.complete()
+
+    assert interface.methods() == ["put_object"]
+
+
+def test_multipart_upload_abort() -> None:
+    """
+    Test that a failed part aborts the upload
+    """
+    interface = FakeS3(fail_part=1)
+    upload = _upload(interface)
+    with pytest.raises(OSError):
+        upload.write(b"x" * (11 * MEGABYTES_TO_BYTES))
+        upload.complete()
+    upload.abort()
+
+    assert interface.methods()[-1] == "abort_multipart_upload"
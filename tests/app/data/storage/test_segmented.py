@@ -0,0 +1,171 @@
+import threading
+from typing import Iterator
+
+import pytest
+import requests
+
+import app.data.storage.segmented
+import app.http
+from app.config import Config
+from app.constants import MEGABYTES_TO_BYTES
+from app.data.storage.segmented import RangedSource
+from app.models.code_file import CodeFile
+from app.models.exceptions import IncompleteDownloadError
+from app.models.package import Package
+
+
+@pytest.mark.parametrize(
+    "size, part_size, expected",
+    (
+        (10, 5, [(0, 4), (5, 9)]),
+        (11, 5, [(0, 4), (5, 9), (10, 10)]),
+        (4, 5, [(0, 3)]),
+        (0, 5, []),
+    ),
+)
+def test_plan_ranges(size: int, part_size: int, expected: list[tuple[int, int]]) -> None:
+    """
+    Test that ranges are inclusive, contiguous, and cover the whole file
+    """
+    assert app.data.storage.segmented.plan_ranges(size, part_size) == expected
+
+
+class FakeRangeResponse:
+    def __init__(self, status_code: int, chunks: list[bytes], fail: bool = False) -> None:
+        self.status_code = status_code
+        self._chunks = chunks
+        self._fail = fail
+
+    def __enter__(self) -> "FakeRangeResponse":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        pass
+
+    def iter_content(self, chunk_size: int) -> Iterator[bytes]:
+        yield from self._chunks
+        if self._fail:
+            raise requests.exceptions.ChunkedEncodingError("connection dropped")
+
+
+@pytest.fixture
+def no_sleep(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(app.data.storage.segmented.time, "sleep", lambda seconds: None)
+
+
+@pytest.mark.usefixtures("no_sleep")
+def test_fetch_range_resumes(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that a dropped connection resumes from the last byte received
+    """
+    content = b"0123456789"
+    requested: list[tuple[int, int]] = []
+
+    def stream_range(url: str, start: int, end: int, session: object = None) -> FakeRangeResponse:
+        requested.append((start, end))
+        if len(requested) == 1:
+            # send part of the range, then drop
+            return FakeRangeResponse(206, [content[start:4]], fail=True)
+        return FakeRangeResponse(206, [content[start : end + 1]])
+
+    monkeypatch.setattr(app.http, "stream_range", stream_range)
+
+    received = bytearray(len(content))
+
+    def on_chunk(offset: int, chunk: bytes) -> None:
+        received[offset : offset + len(chunk)] = chunk
+
+    app.data.storage.segmented._fetch_range(None, "https://a/f", 2, 9, on_chunk)  # type: ignore[arg-type]
+    assert requested == [(2, 9), (4, 9)]
+    assert received[2:] == content[2:]
+
+
+@pytest.mark.usefixtures("no_sleep")
+def test_fetch_range_gives_up(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that an upstream ignoring the range, or a short range, fails after the configured retries
+    """
+    responses = iter([FakeRangeResponse(200, [b"whole file"])] + [FakeRangeResponse(206, [b"ab"])] * 10)
+    attempts = []
+
+    def stream_range(url: str, start: int, end: int, session: object = None) -> FakeRangeResponse:
+        attempts.append(start)
+        return next(responses)
+
+    monkeypatch.setattr(app.http, "stream_range", stream_range)
+    monkeypatch.setattr(Config.storage.segmented_download, "retries", 2)
+
+    with pytest.raises(IncompleteDownloadError):
+        app.data.storage.segmented._fetch_range(None, "https://a/f", 0, 9, lambda offset, chunk: None)  # type: ignore[arg-type]
+    assert len(attempts) == 3
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    (
+        ({"Accept-Ranges": "bytes", "Content-Length": str(100 * MEGABYTES_TO_BYTES)}, True),
+        ({"Accept-Ranges": "none", "Content-Length": str(100 * MEGABYTES_TO_BYTES)}, False),
+        ({"Accept-Ranges": "bytes", "Content-Length": "10"}, False),
+        (
+            {
+                "Accept-Ranges": "bytes",
+                "Content-Length": str(100 * MEGABYTES_TO_BYTES),
+                "Content-Encoding": "gzip",
+            },
+            False,
+        ),
+    ),
+)
+@pytest.mark.usefixtures("app")
+def test_probe(monkeypatch: pytest.MonkeyPatch, package: Package, headers: dict[str, str], expected: bool) -> None:
+    """
+    Test that only large files from upstreams supporting ranges are segmented
+    """
+    response = requests.Response()
+    response.url = "https://final/f"
+    response.headers.update(headers)
+    monkeypatch.setattr(app.http, "hedged_head", lambda urls: response)
+    monkeypatch.setattr(Config.storage.segmented_download, "enabled", True)
+    monkeypatch.setattr(Config.storage.segmented_download, "threshold_megabytes", 10)
+
+    code_file = CodeFile(package=package, filename="f.whl", upstream_url="https://a/f.whl")
+
+    source = app.data.storage.segmented.probe(code_file)
+    if expected:
+        assert source == RangedSource(url="https://final/f", size=100 * MEGABYTES_TO_BYTES)
+    else:
+        assert source is None
+
+
+def test_map_ranges_window(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that parts aren't started too far past a slow earlier part
+    """
+    monkeypatch.setattr(Config.storage.segmented_download, "part_size_megabytes", 1)
+    monkeypatch.setattr(Config.storage.segmented_download, "concurrency", 4)
+
+    started = []
+    first_release = threading.Event()
+    second_done = threading.Event()
+
+    def func(session: requests.Session, part_number: int, start: int, end: int) -> None:
+        started.append(part_number)
+        if part_number == 1:
+            assert first_release.wait(timeout=5)
+        elif part_number == 2:
+            second_done.set()
+
+    def check() -> None:
+        assert second_done.wait(timeout=5)
+        # part 2 finished, but part 3 is outside the window while part 1 is still running
+        threading.Event().wait(0.05)
+        assert sorted(started) == [1, 2]
+        first_release.set()
+
+    checker = threading.Thread(target=check)
+    checker.start()
+    app.data.storage.segmented._map_ranges(RangedSource(url="https://a/f", size=4 * MEGABYTES_TO_BYTES), func, window=2)
+    checker.join()
+
+    assert first_release.is_set()
+    assert sorted(started) == [1, 2, 3, 4]
@@ -0,0 +1,72 @@
+import os
+import pathlib
+
+import pytest
+
+import app.data.storage.tiered
+from app.constants import MEGABYTES_TO_BYTES
+from app.data.storage.filesystem import FilesystemStorage
+from app.data.storage.tiered import TieredStorage, evict
+
+
+def _write(path: pathlib.Path, size: int, mtime: int) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    os.utime(path, (mtime, mtime))
+
+
+def test_evict(tmp_path: pathlib.Path) -> None:
+    """
+    Test that the least recently used files are evicted first
+    """
+    _write(tmp_path / "sha256" / "aa" / "old.whl", 100, 1)
+    _write(tmp_path / "repo" / "pkg" / "middle.whl", 100, 2)
+    _write(tmp_path / "repo" / "pkg" / "new.whl", 100, 3)
+    _write(tmp_path / "repo" / "pkg" / "writing.whl.partial", 1000, 0)
+
+    assert evict(tmp_path, 250) == (100, 200)
+    assert not (tmp_path / "sha256" / "aa").exists()
+    assert (tmp_path / "repo" / "pkg" / "middle.whl").exists()
+    # files still being written are left alone
+    assert (tmp_path / "repo" / "pkg" / "writing.whl.partial").exists()
+
+    # the kept file survives, even if it is the oldest
+    assert evict(tmp_path, 50, keep=tmp_path / "repo" / "pkg" / "middle.whl") == (100, 100)
+    assert (tmp_path / "repo" / "pkg" / "middle.whl").exists()
+    assert not (tmp_path / "repo" / "pkg" / "new.whl").exists()
+
+
+def test_enforce_limit(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path) -> None:
+    """
+    Test that the local directory is only walked when it may be over its limit, or hasn't been in a while
+    """
+    walks = []
+
+    def counting_evict(directory: pathlib.Path, max_bytes: int, keep: pathlib.Path | None = None) -> tuple[int, int]:
+        walks.append(keep)
+        return evict(directory, max_bytes, keep=keep)
+
+    monkeypatch.setattr(app.data.storage.tiered, "evict", counting_evict)
+    storage = TieredStorage(local=FilesystemStorage(directory=str(tmp_path)), remote=None, max_megabytes=1)  # type: ignore[arg-type]
+
+    # the first file triggers a walk, to find out how much is already stored
+    _write(tmp_path / "a.whl", 100, 1)
+    storage._enforce_limit(keep=tmp_path / "a.whl")
+    assert walks == [tmp_path / "a.whl"]
+
+    # still under the limit
+    _write(tmp_path / "b.whl", 100, 2)
+    storage._enforce_limit(keep=tmp_path / "b.whl")
+    assert len(walks) == 1
+
+    # over the limit, so the oldest file is evicted
+    _write(tmp_path / "c.whl", MEGABYTES_TO_BYTES, 3)
+    storage._enforce_limit(keep=tmp_path / "c.whl")
+    assert len(walks) == 2
+    assert not (tmp_path / "a.whl").exists()
+    assert storage._usage_bytes == MEGABYTES_TO_BYTES
+
+    # walked again once it's been a while
+    monkeypatch.setattr(storage, "_next_scan", 0.0)
+    storage._enforce_limit(keep=tmp_path / "c.whl")
+    assert len(walks) == 3
@@ -3,7 +3,6 @@ import datetime
 import pytest
 
 from app.models.code_file import CodeFile
-from app.models.code_file_hash import CodeFileHash
 from app.models.package import Package
 
 
@@ -64,14 +63,14 @@ def test_html_download_url(package: Package, app_request_context: None) -> None:
     assert "#" not in code_file.html_download_url
 
     # test one hash
-    CodeFileHash(code_file=code_file, kind="sha256", value="1234567890abcdef")
+    code_file.add_hash("sha256", "1234567890abcdef")
     assert package.repository.slug in code_file.html_download_url
     assert package.name in code_file.html_download_url
     assert filename in code_file.html_download_url
     assert "#sha256=1234567890abcdef" in code_file.html_download_url
 
     # test multiple hashes
-    CodeFileHash(code_file=code_file, kind="md5", value="abcdef1234567890")
+    code_file.add_hash("md5", "abcdef1234567890")
     assert package.repository.slug in code_file.html_download_url
     assert package.name in code_file.html_download_url
     assert filename in code_file.html_download_url
@@ -92,7 +91,7 @@ def test_update() -> None:
         size=12345,
         upload_time=datetime.datetime.now(),
     )
-    CodeFileHash(code_file=file1, kind="sha256", value="1234567890abcdef")
+    file1.add_hash("sha256", "1234567890abcdef")
 
     # update the file
     file2 = CodeFile(
@@ -105,7 +104,7 @@ def test_update() -> None:
         size=6789,
         upload_time=datetime.datetime(2021, 1, 1),
     )
-    CodeFileHash(code_file=file2, kind="md5", value="abcdef1234567890")
+    file2.add_hash("md5", "abcdef1234567890")
 
     file1.update(file2)
     # make sure filename is unchanged
@@ -122,3 +121,14 @@ def test_update() -> None:
     assert file1.hashes[0].value == "1234567890abcdef"
     assert file1.hashes[1].kind == "md5"
     assert file1.hashes[1].value == "abcdef1234567890"
+
+
+def test_update_verified_size() -> None:
+    """
+    Test that the size of a verified file isn't replaced by what upstream reports
+    """
+    file1 = CodeFile(filename="test.whl", version="1.0.0", upstream_url="https://example.com", size=3 * 2**30)
+    file1.sha256 = "1234567890abcdef"
+
+    file1.update(CodeFile(filename="test.whl", version="1.0.0", upstream_url="https://example.com", size=12345))
+    assert file1.size == 3 * 2**30
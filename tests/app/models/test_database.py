@@ -0,0 +1,37 @@
+import pytest
+
+import app.data.sql
+from app.config import Config
+from app.models.database import db, load_repositories
+
+
+def _restart() -> bool:
+    load_repositories()
+    db.session.commit()
+    return app.data.sql.get_repository_with_exception("pypi").is_offline
+
+
+@pytest.mark.usefixtures("app_request_context")
+def test_load_repositories_offline(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that taking a repository offline at runtime survives restarts, until the config changes
+    """
+    repository_config = next(config for config in Config.repositories if config.slug == "pypi")
+    monkeypatch.setattr(repository_config, "offline", False)
+
+    # flask offline pypi on
+    app.data.sql.get_repository_with_exception("pypi").is_offline = True
+    db.session.commit()
+    assert _restart() is True
+
+    # flask offline pypi off
+    app.data.sql.get_repository_with_exception("pypi").is_offline = False
+    db.session.commit()
+    assert _restart() is False
+
+    # the config changed
+    monkeypatch.setattr(repository_config, "offline", True)
+    assert _restart() is True
+
+    monkeypatch.setattr(repository_config, "offline", False)
+    assert _restart() is False
@@ -0,0 +1,31 @@
+import pytest
+import sqlalchemy.pool
+
+from app.config import Config
+from app.models.engine import engine_options
+
+POSTGRESQL_URL = "postgresql://user:pass@db:5432/mypypi"
+
+
+def test_engine_options(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that pool settings are only applied to PostgreSQL
+    """
+    monkeypatch.setattr(Config.database, "statement_timeout_seconds", 2.5)
+
+    options = engine_options(POSTGRESQL_URL)
+    assert options["pool_size"] == Config.database.pool_size
+    assert options["max_overflow"] == Config.database.max_overflow
+    assert options["connect_args"] == {"options": "-c statement_timeout=2500"}
+
+    assert engine_options("sqlite:///:memory:") == {}
+
+
+def test_engine_options_pgbouncer(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that PgBouncer is left to pool connections, without startup options
+    """
+    monkeypatch.setattr(Config.database, "pgbouncer", True)
+    monkeypatch.setattr(Config.database, "statement_timeout_seconds", 2.5)
+
+    assert engine_options(POSTGRESQL_URL) == {"poolclass": sqlalchemy.pool.NullPool}
@@ -0,0 +1,45 @@
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+
+import app.models.instrumentation
+from app.models.database import db
+
+
+def test_query_stats(app_request_context: None) -> None:
+    """
+    Test that statements run during a request are counted
+    """
+    app.models.instrumentation.start()
+    db.session.execute(sa.select(sa.literal(1))).all()
+
+    stats = app.models.instrumentation.get_stats()
+    assert stats is not None
+    assert stats.statements == 1
+    assert stats.seconds > 0
+    assert stats.server_timing.startswith("db;dur=")
+
+
+def test_server_timing_header(app: Flask) -> None:
+    """
+    Test that responses report the database time of the request
+    """
+    response = app.test_client().get("/healthcheck/")
+    assert response.headers["Server-Timing"] == 'db;dur=0.0;desc="0 statements, 0 rows"'
+
+
+def test_query_stats_error(app_request_context: None) -> None:
+    """
+    Test that a statement that fails leaves nothing behind on its connection
+    """
+    app.models.instrumentation.start()
+    with pytest.raises(sa.exc.OperationalError):
+        db.session.execute(sa.text("SELECT * FROM missing_table"))
+    db.session.rollback()
+
+    db.session.execute(sa.select(sa.literal(1))).all()
+    assert "query_start" not in db.session.connection().info
+
+    stats = app.models.instrumentation.get_stats()
+    assert stats is not None
+    assert stats.statements == 1
@@ -1,5 +1,4 @@
 from app.models.metadata_file import MetadataFile
-from app.models.metadata_file_hash import MetadataFileHash
 
 
 def test_update() -> None:
@@ -7,11 +6,11 @@ def test_update() -> None:
     Test updates to a metadata file
     """
     file1 = MetadataFile(filename="test.metadata", version="1.0.0", upstream_url="https://example.com")
-    MetadataFileHash(metadata_file=file1, kind="sha256", value="1234567890abcdef")
+    file1.add_hash("sha256", "1234567890abcdef")
 
     # update the file
     file2 = MetadataFile(filename="other.metadata", version="1.0.1", upstream_url="https://nathanv.me")
-    MetadataFileHash(metadata_file=file2, kind="md5", value="abcdef1234567890")
+    file2.add_hash("md5", "abcdef1234567890")
 
     file1.update(file2)
     # make sure filename is unchanged
@@ -23,3 +22,36 @@ def test_update() -> None:
     assert file1.hashes[0].value == "1234567890abcdef"
     assert file1.hashes[1].kind == "md5"
     assert file1.hashes[1].value == "abcdef1234567890"
+
+
+def test_update_no_longer_synthesized() -> None:
+    """
+    Test that a synthesized metadata file is replaced once upstream publishes its own
+    """
+    file1 = MetadataFile(
+        filename="test.metadata",
+        upstream_url="https://example.com/test.whl",
+        is_synthesized=True,
+        is_cached=True,
+        storage_path="ab/cd/test.metadata",
+        size=10,
+        sha256="1234567890abcdef",
+    )
+    file1.add_hash("sha256", "1234567890abcdef")
+
+    file2 = MetadataFile(
+        filename="test.metadata", upstream_url="https://example.com/test.metadata", is_synthesized=False
+    )
+    file2.add_hash("sha256", "abcdef1234567890")
+
+    file1.update(file2)
+    assert not file1.is_synthesized
+    assert not file1.is_cached
+    assert file1.storage_path is None
+    assert file1.sha256 is None
+    assert file1.hashes_dict == {"sha256": "abcdef1234567890"}
+
+    # a file upstream already published is left alone
+    file1.is_cached = True
+    file1.update(file2)
+    assert file1.is_cached
@@ -0,0 +1,71 @@
+import uuid
+
+import sqlalchemy as sa
+
+from app.models.code_file import CodeFile
+from app.models.database import Base
+from app.models.migrations import drop_hash_tables, fold_hash_tables
+
+
+def _create_hash_table() -> tuple[sa.Engine, uuid.UUID, uuid.UUID]:
+    """
+    Create a database with two code files, where hashes of the first are kept in their own table
+    """
+    engine = sa.create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+
+    with_hashes, without_hashes = uuid.uuid4(), uuid.uuid4()
+    with engine.begin() as connection:
+        for id_ in (with_hashes, without_hashes):
+            connection.execute(
+                sa.insert(CodeFile.__table__).values(
+                    id=id_,
+                    package_id=uuid.uuid4(),
+                    filename=f"{id_}.whl",
+                    upstream_url="https://example.com",
+                    sort_order=0,
+                    hashes=None,
+                )
+            )
+
+        connection.execute(
+            sa.text("CREATE TABLE code_file_hash (id CHAR(32), kind TEXT, value TEXT, code_file_id CHAR(32))")
+        )
+        connection.execute(
+            sa.text("INSERT INTO code_file_hash VALUES ('1', 'sha256', 'abc', :id), ('2', 'md5', 'def', :id)"),
+            {"id": with_hashes.hex},
+        )
+
+    return engine, with_hashes, without_hashes
+
+
+def _code_file_hashes(engine: sa.Engine) -> dict:
+    with engine.connect() as connection:
+        return dict(connection.execute(sa.select(CodeFile.__table__.c.id, CodeFile.__table__.c.hashes)).all())
+
+
+def test_fold_hash_tables() -> None:
+    """
+    Test that hashes kept in their own table are moved to the file they belong to, and the table is kept
+    """
+    engine, with_hashes, without_hashes = _create_hash_table()
+
+    fold_hash_tables(engine)
+    # running again, like another worker starting, changes nothing
+    fold_hash_tables(engine)
+
+    assert "code_file_hash" in sa.inspect(engine).get_table_names()
+    assert _code_file_hashes(engine) == {with_hashes: {"sha256": "abc", "md5": "def"}, without_hashes: None}
+
+
+def test_drop_hash_tables() -> None:
+    """
+    Test that hash tables are folded one last time before being dropped
+    """
+    engine, with_hashes, without_hashes = _create_hash_table()
+
+    assert drop_hash_tables(engine) == ["code_file_hash"]
+    assert drop_hash_tables(engine) == []
+
+    assert "code_file_hash" not in sa.inspect(engine).get_table_names()
+    assert _code_file_hashes(engine) == {with_hashes: {"sha256": "abc", "md5": "def"}, without_hashes: None}
@@ -3,6 +3,8 @@ import datetime
 from freezegun import freeze_time
 
 from app.models.package import Package
+from app.models.repository import Repository
+from app.models.repository_member import RepositoryMember
 
 
 @freeze_time("2020-01-01 12:00:00")
@@ -36,3 +38,25 @@ def test_log_name(package: Package) -> None:
     package.repository.slug = "pypi"
     package.name = "test_package"
     assert package.log_name == "pypi:test_package"
+
+
+def test_tracks(package: Package) -> None:
+    """
+    Test tracks attribute
+    """
+    package.repository.simple_url = "https://example.com/simple/"
+    package.name = "test_package"
+    assert package.tracks == ["https://example.com/simple/test_package/"]
+
+    # virtual repositories track every member
+    virtual = Repository(slug="virtual", simple_url="", cache_minutes=10, timeout_seconds=10)
+    other = Repository(slug="other", simple_url="https://other.com/simple", cache_minutes=10, timeout_seconds=10)
+    virtual.members = [
+        RepositoryMember(member=package.repository, priority=0),
+        RepositoryMember(member=other, priority=1),
+    ]
+    package.repository = virtual
+    assert package.tracks == [
+        "https://example.com/simple/test_package/",
+        "https://other.com/simple/test_package/",
+    ]
@@ -1,5 +1,4 @@
 from app.models.code_file import CodeFile
-from app.models.code_file_hash import CodeFileHash
 from app.models.package_file import PackageFile
 
 
@@ -26,11 +25,11 @@ def test_hashes_dict() -> None:
     assert code_file.hashes_dict == {}
 
     # test one hash
-    CodeFileHash(code_file=code_file, kind="sha256", value="1234567890abcdef")
+    code_file.add_hash("sha256", "1234567890abcdef")
     assert code_file.hashes_dict == {"sha256": "1234567890abcdef"}
 
     # test multiple hashes
-    CodeFileHash(code_file=code_file, kind="md5", value="abcdef1234567890")
+    code_file.add_hash("md5", "abcdef1234567890")
     assert code_file.hashes_dict == {"sha256": "1234567890abcdef", "md5": "abcdef1234567890"}
 
 
@@ -46,9 +45,26 @@ def test_hash_value() -> None:
     assert code_file.hash_value is None
 
     # test one hash
-    CodeFileHash(code_file=code_file, kind="sha256", value="1234567890abcdef")
+    code_file.add_hash("sha256", "1234567890abcdef")
     assert code_file.hash_value == "sha256=1234567890abcdef"
 
     # test multiple hashes
-    CodeFileHash(code_file=code_file, kind="md5", value="abcdef1234567890")
+    code_file.add_hash("md5", "abcdef1234567890")
     assert code_file.hash_value == "sha256=1234567890abcdef"
+
+
+def test_digest() -> None:
+    """
+    Test that our own verified digest is preferred over upstream's
+    """
+    code_file = CodeFile()
+    assert code_file.digest is None
+
+    # falls back to upstream
+    code_file.add_hash("md5", "abcdef1234567890")
+    assert code_file.digest is None
+    code_file.add_hash("sha256", "1234567890abcdef")
+    assert code_file.digest == "1234567890abcdef"
+
+    code_file.sha256 = "fedcba0987654321"
+    assert code_file.digest == "fedcba0987654321"
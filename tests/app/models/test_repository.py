@@ -1,4 +1,5 @@
 from app.models.repository import Repository
+from app.models.repository_mirror import RepositoryMirror
 
 
 def test_simple_url() -> None:
@@ -16,3 +17,36 @@ def test_simple_url() -> None:
     # make sure trailing slashes are removed
     repository.simple_url = "https://pypi.org/simple////"
     assert repository.simple_url == "https://pypi.org/simple"
+
+
+def test_equivalent_urls() -> None:
+    """
+    Test equivalent_urls method
+    """
+    repository = Repository(simple_url="https://download.pytorch.org/whl")
+    # no mirrors
+    url = "https://download.pytorch.org/whl/cu121/torch-2.4.0-cp312-none-any.whl"
+    assert repository.equivalent_urls(url) == [url]
+
+    repository.mirrors = [
+        RepositoryMirror(simple_url="https://mirror.example.com/whl/", priority=0),
+        RepositoryMirror(simple_url="https://other.example.com/pytorch/whl", priority=1),
+    ]
+    assert repository.upstream_urls == [
+        "https://download.pytorch.org/whl",
+        "https://mirror.example.com/whl",
+        "https://other.example.com/pytorch/whl",
+    ]
+    assert repository.equivalent_urls(url) == [
+        url,
+        "https://mirror.example.com/whl/cu121/torch-2.4.0-cp312-none-any.whl",
+        "https://other.example.com/pytorch/whl/cu121/torch-2.4.0-cp312-none-any.whl",
+    ]
+
+    # a URL served by a mirror maps back to the primary
+    mirror_url = "https://mirror.example.com/whl/cu121/torch-2.4.0-cp312-none-any.whl"
+    assert repository.equivalent_urls(mirror_url)[1] == url
+
+    # files hosted elsewhere can't be mirrored
+    other_url = "https://files.pythonhosted.org/packages/torch-2.4.0-cp312-none-any.whl"
+    assert repository.equivalent_urls(other_url) == [other_url]
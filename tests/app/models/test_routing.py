@@ -0,0 +1,102 @@
+import pathlib
+import uuid
+
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+
+import app.data.sql
+import app.models.routing
+import app.packages.data
+from app.config import Config
+from app.models.code_file import CodeFile
+from app.models.database import Base, db
+from app.models.package import Package
+from app.models.repository import Repository
+from app.models.routing import PRIMARY_ONLY, REPLICA, ReplicaHealth
+
+
+def test_is_read() -> None:
+    """
+    Test that only plain selects are sent to replicas
+    """
+    assert app.models.routing._is_read(sa.select(Package))
+    assert not app.models.routing._is_read(sa.select(Package).with_for_update())
+    assert not app.models.routing._is_read(sa.update(Package).values(name="a"))
+    assert not app.models.routing._is_read(sa.text("SELECT 1"))
+    assert not app.models.routing._is_read(None)
+
+
+def test_replica_health(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that replicas too far behind, or unreachable, are left out
+    """
+    lags = {"replica-0": 1.0, "replica-1": Config.database.replica_max_lag_seconds + 1}
+
+    def lag(self: ReplicaHealth, engine: str) -> float:
+        if engine not in lags:
+            raise ConnectionError("unreachable")
+        return lags[engine]
+
+    monkeypatch.setattr(ReplicaHealth, "_lag", lag)
+
+    health = ReplicaHealth()
+    engines = {"replica-0": "replica-0", "replica-1": "replica-1", "replica-2": "replica-2"}
+    assert health.healthy(engines) == ["replica-0"]  # type: ignore[arg-type]
+
+
+def test_update_package_data_on_primary(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path) -> None:
+    """
+    Test that reads go to a replica until a package is updated, which reads and writes on the primary,
+    and the session sticks to the primary afterwards
+    """
+    flask_app = Flask(__name__)
+    flask_app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'primary.db'}"
+    flask_app.config["SQLALCHEMY_BINDS"] = {"replica-0": f"sqlite:///{tmp_path / 'replica.db'}"}
+    # binds get their own metadata, which later apps without the bind would try to create
+    monkeypatch.setattr(db, "metadatas", dict(db.metadatas))
+    db.init_app(flask_app)
+    monkeypatch.setattr(app.models.routing, "health", ReplicaHealth())
+
+    repository_id, package_id = uuid.uuid4(), uuid.uuid4()
+    with flask_app.app_context():
+        for bind_key, engine in db.engines.items():
+            Base.metadata.create_all(engine)
+            with sa.orm.Session(engine) as session:
+                session.add(
+                    Repository(
+                        id=repository_id,
+                        slug="pypi",
+                        simple_url="https://pypi.org/simple",
+                        cache_minutes=10,
+                        timeout_seconds=10,
+                    )
+                )
+                package = Package(id=package_id, repository_id=repository_id, name="test", etag=bind_key)
+                # a file the replica hasn't caught up on yet
+                if bind_key is None:
+                    package.code_files = [
+                        CodeFile(filename="test-1.0.tar.gz", upstream_url="https://example.com/a", sort_order=0)
+                    ]
+                session.add(package)
+                session.commit()
+
+        repository = app.data.sql.get_repository_with_exception("pypi")
+        package = app.data.sql.get_package(repository, "test")
+        assert package is not None
+        assert package.etag == "replica-0"
+        assert db.session.info[REPLICA] == "replica-0"
+
+        upstream_file = CodeFile(
+            filename="test-1.0.tar.gz", upstream_url="https://example.com/b", sort_order=0, is_yanked=True
+        )
+        monkeypatch.setattr(app.packages.data, "fetch_package_data", lambda package: [upstream_file])
+        package = app.packages.data.update_package_data(repository, package)
+
+        # the file on the primary was updated, rather than inserted again
+        assert package.etag is None
+        assert [(code_file.upstream_url, code_file.is_yanked) for code_file in package.code_files] == [
+            ("https://example.com/b", True)
+        ]
+        assert db.session.info[PRIMARY_ONLY]
+        assert app.data.sql.get_package(repository, "test").etag is None  # type: ignore[union-attr]
@@ -0,0 +1,171 @@
+import json
+from http import HTTPStatus
+
+import pytest
+import requests
+
+import app.data.cache.generation
+import app.data.sql
+import app.packages.data
+from app.constants import ETAG_HEADER, LAST_SERIAL_HEADER
+from app.models.code_file import CodeFile
+from app.models.database import db
+from app.models.exceptions import FileNotAvailableOffline, IndexNotModified, PackageNotFound
+from app.models.package import Package
+from app.models.repository import Repository
+from app.models.repository_member import RepositoryMember
+from app.packages.simple import PYPI_CONTENT_TYPE_JSON_V1
+
+
+def test_deduplicate_code_files() -> None:
+    """
+    Test that duplicate filenames are discarded, preferring the first occurrence
+    """
+    code_files = [
+        CodeFile(filename="a.whl", upstream_url="https://one/a.whl", sort_order=0),
+        CodeFile(filename="b.whl", upstream_url="https://one/b.whl", sort_order=1),
+        # as if from a second member repository
+        CodeFile(filename="a.whl", upstream_url="https://two/a.whl", sort_order=0),
+        CodeFile(filename="c.whl", upstream_url="https://two/c.whl", sort_order=1),
+    ]
+
+    result = app.packages.data.deduplicate_code_files(code_files)
+
+    assert [code_file.filename for code_file in result] == ["a.whl", "b.whl", "c.whl"]
+    assert result[0].upstream_url == "https://one/a.whl"
+    # sort order is renumbered to be contiguous
+    assert [code_file.sort_order for code_file in result] == [0, 1, 2]
+
+
+def test_offline_repository(package: Package) -> None:
+    """
+    Test that an offline repository never goes upstream
+    """
+    package.repository.is_offline = True
+    code_file = CodeFile(filename="a.whl", upstream_url="https://one/a.whl", sort_order=0, package=package)
+
+    with pytest.raises(PackageNotFound):
+        app.packages.data.create_package_data(package.repository, "unknown")
+
+    assert app.packages.data.update_package_data(package.repository, package) is package
+
+    with pytest.raises(FileNotAvailableOffline):
+        app.packages.data.store_package_file(code_file)
+
+
+def _response(url: str, content_type: str, files: list[dict]) -> requests.Response:
+    response = requests.Response()
+    response.url = url
+    response.status_code = 200
+    response.headers[app.packages.data.CONTENT_TYPE_HEADER] = content_type
+    response._content = json.dumps({"files": files}).encode()
+    return response
+
+
+def test_fetch_virtual_code_files(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that members are combined in priority order, skipping members that fail or send a bad page
+    """
+    virtual = Repository(slug="virtual", simple_url="", cache_minutes=10, timeout_seconds=10)
+    virtual.members = [
+        RepositoryMember(
+            member=Repository(slug=slug, simple_url=f"https://{slug}/simple", cache_minutes=10, timeout_seconds=10),
+            priority=priority,
+        )
+        for priority, slug in enumerate(("broken", "missing", "first", "second"))
+    ]
+    package = Package(repository=virtual, name="test")
+
+    def request_index(urls: list[str], timeout: int, etag: str | None = None) -> requests.Response:
+        host = urls[0].split("/")[2]
+        if host == "missing":
+            raise requests.exceptions.HTTPError("404")
+        if host == "broken":
+            return _response(urls[0], "text/plain", [])
+        return _response(
+            urls[0],
+            PYPI_CONTENT_TYPE_JSON_V1,
+            [
+                {"filename": f"{host}-1.0.tar.gz", "url": f"{host}-1.0.tar.gz", "hashes": {}},
+                {"filename": "shared-1.0.tar.gz", "url": "shared-1.0.tar.gz", "hashes": {}},
+            ],
+        )
+
+    monkeypatch.setattr(app.packages.data, "_request_index", request_index)
+
+    code_files = app.packages.data.deduplicate_code_files(
+        app.packages.data._fetch_virtual_code_files(package), warn=False
+    )
+    assert [code_file.filename for code_file in code_files] == [
+        "first-1.0.tar.gz",
+        "shared-1.0.tar.gz",
+        "second-1.0.tar.gz",
+    ]
+    # the higher priority member wins
+    assert code_files[1].upstream_url == "https://first/simple/test/shared-1.0.tar.gz"
+
+
+@pytest.mark.parametrize("status_code", (HTTPStatus.NOT_MODIFIED, HTTPStatus.OK))
+def test_fetch_upstream_code_files(monkeypatch: pytest.MonkeyPatch, package: Package, status_code: int) -> None:
+    """
+    Test that the last ETag is sent, and only replaced once a changed page has been parsed
+    """
+    package.etag = '"old"'
+    package.serial = 1
+    sent = []
+
+    def request_index(urls: list[str], timeout: int, etag: str | None = None) -> requests.Response:
+        sent.append(etag)
+        response = _response(
+            urls[0],
+            PYPI_CONTENT_TYPE_JSON_V1,
+            [{"filename": "test-1.0.tar.gz", "url": "test-1.0.tar.gz", "hashes": {}}],
+        )
+        response.status_code = status_code
+        response.headers[ETAG_HEADER] = '"new"'
+        response.headers[LAST_SERIAL_HEADER] = "2"
+        return response
+
+    monkeypatch.setattr(app.packages.data, "_request_index", request_index)
+
+    if status_code == HTTPStatus.NOT_MODIFIED:
+        with pytest.raises(IndexNotModified):
+            app.packages.data._fetch_upstream_code_files(package)
+        assert package.etag == '"old"'
+        assert package.serial == 1
+    else:
+        code_files = app.packages.data._fetch_upstream_code_files(package)
+        assert [code_file.filename for code_file in code_files] == ["test-1.0.tar.gz"]
+        assert package.etag == '"new"'
+        assert package.serial == 2
+
+    assert sent == ['"old"']
+
+
+@pytest.mark.usefixtures("app_request_context")
+@pytest.mark.parametrize("changed", (True, False))
+def test_update_package_data_generation(monkeypatch: pytest.MonkeyPatch, changed: bool) -> None:
+    """
+    Test that a package's cached pages are invalidated when its files change, and only then
+    """
+
+    def code_file(filename: str) -> CodeFile:
+        return CodeFile(
+            filename=filename, upstream_url=f"https://example.com/{filename}", sort_order=0, is_yanked=False
+        )
+
+    filenames = ["test-1.0.tar.gz", "test-2.0.tar.gz"] if changed else ["test-1.0.tar.gz"]
+    monkeypatch.setattr(
+        app.packages.data, "fetch_package_data", lambda package: [code_file(filename) for filename in filenames]
+    )
+
+    repository = app.data.sql.get_repository_with_exception("pypi")
+    package = Package(repository=repository, name="generation-update-test", code_files=[code_file("test-1.0.tar.gz")])
+    db.session.add(package)
+    db.session.commit()
+    generation = app.data.cache.generation.get("pypi", package.name)
+
+    app.packages.data.update_package_data(repository, package)
+
+    assert [code_file.filename for code_file in package.code_files] == filenames
+    assert (app.data.cache.generation.get("pypi", package.name) != generation) == changed
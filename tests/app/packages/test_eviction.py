@@ -0,0 +1,82 @@
+import datetime
+
+import pytest
+from sqlalchemy import select
+
+import app.data.sql
+import app.data.storage.active
+from app.models.code_file import CodeFile
+from app.models.database import db
+from app.models.package import Package
+from app.models.package_file import PackageFile
+from app.packages.eviction import StoredFile, evict, plan_eviction
+
+NOW = datetime.datetime(2025, 1, 1)
+
+
+def _stored_file(path: str, access_count: int, idle_days: int | None, size: int = 100) -> StoredFile:
+    last_accessed = None if idle_days is None else NOW - datetime.timedelta(days=idle_days)
+    return StoredFile(path=path, size=size, access_count=access_count, last_accessed=last_accessed)
+
+
+def test_plan_eviction() -> None:
+    """
+    Test that the least valuable files are evicted first, until under the quota
+    """
+    stored_files = [
+        _stored_file("popular", access_count=1000, idle_days=2),
+        _stored_file("stale", access_count=1000, idle_days=900),
+        _stored_file("never", access_count=0, idle_days=None),
+        _stored_file("recent", access_count=0, idle_days=0),
+    ]
+
+    to_evict = plan_eviction(stored_files, quota_bytes=250, min_idle=datetime.timedelta(days=1), now=NOW)
+    assert [stored_file.path for stored_file in to_evict] == ["never", "stale"]
+
+    # recently used files are never evicted, even if that leaves storage over the quota
+    to_evict = plan_eviction(stored_files, quota_bytes=0, min_idle=datetime.timedelta(days=1), now=NOW)
+    assert [stored_file.path for stored_file in to_evict] == ["never", "stale", "popular"]
+
+
+def test_plan_eviction_under_quota() -> None:
+    """
+    Test that nothing is evicted when storage is under the quota
+    """
+    stored_files = [_stored_file("never", access_count=0, idle_days=None)]
+    assert plan_eviction(stored_files, quota_bytes=100, min_idle=datetime.timedelta(days=1), now=NOW) == []
+
+
+@pytest.mark.usefixtures("app_request_context")
+def test_evict(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that every package file sharing a stored file is uncached before it is deleted,
+    including ones cached since it was chosen
+    """
+    repository = app.data.sql.get_repository_with_exception("pypi")
+    code_files = [
+        CodeFile(
+            filename=f"evict-{i}.tar.gz",
+            upstream_url="https://example.com",
+            sort_order=i,
+            is_cached=True,
+            storage_path="ab/cd/evict.tar.gz",
+        )
+        for i in range(2)
+    ]
+    db.session.add(Package(repository=repository, name="evict-test", code_files=code_files))
+    db.session.commit()
+
+    cached_when_deleted = []
+
+    def delete_file(package_file: PackageFile) -> None:
+        cached_when_deleted.extend(db.session.execute(select(CodeFile.is_cached).where(CodeFile.is_cached)).scalars())
+
+    monkeypatch.setattr(app.data.storage.active.StorageDriver, "delete_file", delete_file)
+
+    # only the first was cached when files were chosen
+    stored_file = StoredFile(path="ab/cd/evict.tar.gz")
+    stored_file.add(code_files[0])
+    evict(stored_file)
+
+    assert cached_when_deleted == []
+    assert [code_file.is_cached for code_file in code_files] == [False, False]
@@ -0,0 +1,154 @@
+import datetime
+import uuid
+from typing import Iterator
+
+import flask
+import pytest
+from flask import Flask
+from sqlalchemy import update
+
+import app.packages.data
+import app.packages.jobs
+from app.config import Config
+from app.models.code_file import CodeFile
+from app.models.database import db
+from app.models.download_job import DownloadJob
+from app.models.enums import DownloadJobStatus
+from app.models.exceptions import DownloadFailed, DownloadPending
+from app.models.package import Package
+from app.models.repository import Repository
+from app.packages.jobs import claim
+
+
+def test_claim(app: Flask) -> None:
+    """
+    Test that a job can only be claimed by one worker
+    """
+    with app.app_context():
+        db.session.add(DownloadJob(file_table="code_file", package_file_id=uuid.uuid4()))
+        db.session.commit()
+
+        job = claim("first")
+        assert job is not None
+        assert job.status == DownloadJobStatus.running
+        assert job.worker == "first"
+
+        assert claim("second") is None
+
+
+def test_claim_stale(app: Flask) -> None:
+    """
+    Test that reclaiming a job from a worker that stopped responding counts as an attempt
+    """
+    with app.app_context():
+        stale = datetime.datetime.now() - datetime.timedelta(seconds=Config.storage.download_queue.stale_seconds + 1)
+        db.session.add(
+            DownloadJob(
+                file_table="code_file",
+                package_file_id=uuid.uuid4(),
+                status=DownloadJobStatus.running,
+                worker="dead",
+                heartbeat_at=stale,
+                attempts=1,
+            )
+        )
+        db.session.commit()
+
+        job = claim("alive")
+        assert job is not None
+        assert job.worker == "alive"
+        assert job.attempts == 2
+
+
+@pytest.fixture
+def code_file(app: Flask) -> Iterator[CodeFile]:
+    repository = Repository(slug="jobs", simple_url="https://example.com/simple", cache_minutes=10, timeout_seconds=10)
+    package = Package(repository=repository, name="test")
+    code_file = CodeFile(
+        package=package, filename="test-1.0.tar.gz", upstream_url="https://example.com/test-1.0.tar.gz", sort_order=0
+    )
+
+    with app.app_context():
+        db.session.add(code_file)
+        db.session.commit()
+        yield code_file
+
+
+def _set_status(status: DownloadJobStatus, error: str | None = None) -> None:
+    db.session.execute(update(DownloadJob).values(status=status, error=error))
+
+
+@pytest.mark.parametrize("status", (DownloadJobStatus.done, DownloadJobStatus.failed))
+def test_wait(monkeypatch: pytest.MonkeyPatch, code_file: CodeFile, status: DownloadJobStatus) -> None:
+    """
+    Test that waiting returns once a worker finishes the file, or raises once it gives up
+    """
+    # the worker finishes while the request is waiting
+    monkeypatch.setattr(app.packages.jobs.time, "sleep", lambda seconds: _set_status(status, error="gone"))
+
+    if status == DownloadJobStatus.done:
+        app.packages.jobs.wait(code_file)
+    else:
+        with pytest.raises(DownloadFailed, match="gone"):
+            app.packages.jobs.wait(code_file)
+
+
+def test_wait_pending(monkeypatch: pytest.MonkeyPatch, code_file: CodeFile) -> None:
+    """
+    Test that a client is told to retry when a download takes too long
+    """
+    monkeypatch.setattr(Config.storage.download_queue, "wait_seconds", 0)
+
+    with pytest.raises(DownloadPending) as exc_info:
+        app.packages.jobs.wait(code_file)
+
+    response = exc_info.value.get_response()
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(app.packages.jobs.DOWNLOAD_RETRY_AFTER_SECONDS)
+
+
+def test_enqueue_failed(code_file: CodeFile) -> None:
+    """
+    Test that a failed download keeps failing until its cooldown has passed, then is queued again
+    """
+    job = app.packages.jobs.enqueue(code_file)
+    job.status = DownloadJobStatus.failed
+    job.error = "gone"
+    job.next_attempt_at = datetime.datetime.now() + datetime.timedelta(minutes=1)
+    db.session.commit()
+
+    with pytest.raises(DownloadFailed):
+        app.packages.jobs.enqueue(code_file)
+
+    job.next_attempt_at = datetime.datetime.now() - datetime.timedelta(minutes=1)
+    db.session.commit()
+
+    job = app.packages.jobs.enqueue(code_file)
+    assert job.status == DownloadJobStatus.queued
+    assert job.attempts == 0
+
+
+def test_run(monkeypatch: pytest.MonkeyPatch, code_file: CodeFile) -> None:
+    """
+    Test that a failed download is retried with backoff, then given up on
+    """
+    monkeypatch.setattr(Config.storage.download_queue, "max_attempts", 2)
+    monkeypatch.setattr(Config.storage.download_queue, "backoff_seconds", 10)
+
+    def fail(package_file: CodeFile) -> None:
+        raise OSError("connection reset")
+
+    monkeypatch.setattr(app.packages.data, "store_package_file", fail)
+    job = app.packages.jobs.enqueue(code_file)
+
+    before = datetime.datetime.now()
+    app.packages.jobs.run(flask.current_app, job)
+    assert job.status == DownloadJobStatus.queued
+    assert job.attempts == 1
+    assert job.error == "connection reset"
+    assert job.next_attempt_at >= before + datetime.timedelta(seconds=10)
+
+    app.packages.jobs.run(flask.current_app, job)
+    assert job.status == DownloadJobStatus.failed
+    assert job.attempts == 2
+    assert job.next_attempt_at > datetime.datetime.now()
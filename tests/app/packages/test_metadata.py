@@ -0,0 +1,46 @@
+import io
+import zipfile
+
+import app.packages.metadata
+from app.models.code_file import CodeFile
+from app.models.metadata_file import MetadataFile
+
+
+def test_find_metadata() -> None:
+    """
+    Test that only the top-level dist-info METADATA file is found
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_file:
+        zip_file.writestr("package/METADATA", "")
+        zip_file.writestr("package/vendored.dist-info/METADATA", "")
+        zip_file.writestr("package-1.0.dist-info/METADATA", "")
+
+    with zipfile.ZipFile(buffer) as zip_file:
+        assert app.packages.metadata._find_metadata(zip_file) == "package-1.0.dist-info/METADATA"
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_file:
+        zip_file.writestr("package/__init__.py", "")
+
+    with zipfile.ZipFile(buffer) as zip_file:
+        assert app.packages.metadata._find_metadata(zip_file) is None
+
+
+def test_add_synthesized_metadata_files() -> None:
+    """
+    Test that only wheels without upstream metadata get a synthesized metadata file
+    """
+    wheel = CodeFile(filename="package-1.0-py3-none-any.whl", upstream_url="https://example.com/package.whl")
+    sdist = CodeFile(filename="package-1.0.tar.gz", upstream_url="https://example.com/package.tar.gz")
+    upstream_metadata = MetadataFile(filename="other-1.0-py3-none-any.whl.metadata")
+    wheel_with_metadata = CodeFile(filename="other-1.0-py3-none-any.whl", metadata_file=upstream_metadata)
+
+    app.packages.metadata.add_synthesized_metadata_files([wheel, sdist, wheel_with_metadata])
+
+    assert wheel.metadata_file is not None
+    assert wheel.metadata_file.is_synthesized
+    assert wheel.metadata_file.filename == "package-1.0-py3-none-any.whl.metadata"
+    assert wheel.metadata_file.has_upstream is False
+    assert sdist.metadata_file is None
+    assert wheel_with_metadata.metadata_file is upstream_metadata
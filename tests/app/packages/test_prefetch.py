@@ -0,0 +1,52 @@
+import uuid
+
+import packaging.version
+import pytest
+
+import app.packages.prefetch
+from app.models.code_file import CodeFile
+from app.models.metadata_file import MetadataFile
+from app.models.package import Package
+
+
+def test_newest_versions(package: Package) -> None:
+    """
+    Test that versions are compared as versions, not strings
+    """
+    package.code_files = [
+        CodeFile(filename="a", version="1.0"),
+        CodeFile(filename="b", version="10.0"),
+        CodeFile(filename="c", version="2.0"),
+        CodeFile(filename="d", version="2.0"),
+        CodeFile(filename="e", version=None),
+    ]
+
+    assert app.packages.prefetch._newest_versions(package, 2) == {
+        packaging.version.Version("10.0"),
+        packaging.version.Version("2.0"),
+    }
+    assert app.packages.prefetch._newest_versions(package, 5) == {
+        packaging.version.Version("10.0"),
+        packaging.version.Version("2.0"),
+        packaging.version.Version("1.0"),
+    }
+
+
+def test_prefetch_metadata_files(monkeypatch: pytest.MonkeyPatch, package: Package, app_request_context: None) -> None:
+    """
+    Test that files are matched to the newest versions even when upstream's version text isn't normalized
+    """
+    package.repository.prefetch_metadata_versions = 1
+    package.repository.is_offline = False
+    new = MetadataFile(id=uuid.uuid4(), filename="b.metadata", is_cached=False)
+    old = MetadataFile(id=uuid.uuid4(), filename="a.metadata", is_cached=False)
+    package.code_files = [
+        CodeFile(filename="a", version="1.0", metadata_file=old),
+        CodeFile(filename="b", version="2.0.0-RC1", metadata_file=new),
+    ]
+
+    batches = []
+    monkeypatch.setattr(app.packages.prefetch._executor, "submit", lambda func, flask_app, batch: batches.append(batch))
+    app.packages.prefetch.prefetch_metadata_files(package)
+
+    assert batches == [[new.id]]
@@ -0,0 +1,128 @@
+import datetime
+import hashlib
+import io
+import json
+import pathlib
+import uuid
+
+import pytest
+from flask import Flask
+from sqlalchemy import select
+
+import app.data.storage.active
+import app.packages.snapshot
+from app.data.sql import get_repository_with_exception
+from app.data.storage.filesystem import FilesystemStorage
+from app.models.code_file import CodeFile
+from app.models.database import db
+from app.models.package import Package
+from app.packages.snapshot import export_snapshot, import_snapshot
+from app.wsgi import create_app
+
+
+def test_encode_decode() -> None:
+    """
+    Test that rows survive the trip through JSON, and unknown columns are dropped
+    """
+    row = {
+        "id": uuid.uuid4(),
+        "package_id": uuid.uuid4(),
+        "filename": "a.whl",
+        "size": 5,
+        "upload_time": datetime.datetime(2024, 1, 2, 3, 4, 5),
+        "last_accessed": None,
+    }
+
+    encoded = json.loads(json.dumps({**row, "from_the_future": 1}, default=app.packages.snapshot._encode))
+    assert app.packages.snapshot._decode(CodeFile.__table__, encoded) == row  # type: ignore[arg-type]
+
+
+def _add_package(name: str, content: bytes | None) -> None:
+    """
+    Add a package with a single file, stored if content is given
+    """
+    code_file = CodeFile(
+        filename=f"{name}-1.0.tar.gz",
+        version="1.0",
+        upstream_url=f"https://example.com/{name}-1.0.tar.gz",
+        sort_order=0,
+        size=len(content or b""),
+    )
+    code_file.add_hash("sha256", hashlib.sha256(content or b"").hexdigest())
+    db.session.add(Package(repository=get_repository_with_exception("pypi"), name=name, code_files=[code_file]))
+    db.session.flush()
+
+    if content is not None:
+        app.data.storage.active.StorageDriver.cache_file(code_file, content)
+        code_file.is_cached = True
+    db.session.commit()
+
+
+def _get_code_file(name: str) -> CodeFile:
+    return db.session.execute(select(CodeFile).where(CodeFile.filename == f"{name}-1.0.tar.gz")).unique().scalar_one()
+
+
+@pytest.mark.parametrize(
+    "path, safe",
+    (
+        ("ab/cd/a.tar.gz", True),
+        ("pypi/a/a.tar.gz", True),
+        ("../a.tar.gz", False),
+        ("ab/../../a.tar.gz", False),
+        ("ab\\..\\..\\a.tar.gz", False),
+        ("/etc/a.tar.gz", False),
+    ),
+)
+def test_is_safe_path(path: str, safe: bool) -> None:
+    """
+    Test that storage paths from a snapshot can't point outside storage
+    """
+    assert app.packages.snapshot._is_safe_path(path) == safe
+
+
+@pytest.mark.parametrize("with_files", (True, False))
+def test_round_trip(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path, app: Flask, with_files: bool) -> None:
+    """
+    Test that a snapshot loads into another node, leaving packages it already has alone
+    """
+    source, target = FilesystemStorage(str(tmp_path / "source")), FilesystemStorage(str(tmp_path / "target"))
+
+    monkeypatch.setattr("app.data.storage.active.StorageDriver", source)
+    with app.app_context():
+        _add_package("new", b"new content")
+        _add_package("existing", b"existing content")
+
+        snapshot = io.BytesIO()
+        report = export_snapshot(app, snapshot, with_files=with_files, concurrency=2)
+        assert report.files == (2 if with_files else 0)
+        assert report.failed_files == []
+
+    target_app = create_app()
+    monkeypatch.setattr("app.data.storage.active.StorageDriver", target)
+    with target_app.app_context():
+        _add_package("existing", None)
+
+        snapshot.seek(0)
+        # the in-memory database shares one connection between threads, so files are stored one at a time
+        report = import_snapshot(target_app, snapshot, shared_storage=False, concurrency=1)
+        assert report.failed_files == []
+        # the package and its file
+        assert report.rows == 2
+        # the existing package and its file
+        assert report.skipped_rows == 2
+
+        # files were stored by other sessions
+        db.session.expire_all()
+        new = _get_code_file("new")
+        assert new.storage_path is not None
+        if with_files:
+            assert report.files == 1
+            assert report.skipped_files == 1
+            assert new.is_cached
+            assert target.local_path(new).read_bytes() == b"new content"
+        else:
+            assert report.files == 0
+            assert not new.is_cached
+
+        # left alone
+        assert not _get_code_file("existing").is_cached
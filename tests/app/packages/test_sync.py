@@ -0,0 +1,119 @@
+import os
+import uuid
+
+import flask
+import pytest
+from flask import Flask
+
+import app.data.sql
+import app.packages.data
+import app.packages.sync
+import app.packages.warmup
+from app.config import RepositoryConfig
+from app.models.code_file import CodeFile
+from app.models.database import db
+from app.models.exceptions import PackageNotFound
+from app.models.package import Package
+from app.models.repository import Repository
+from app.packages.sync import Checkpoint
+
+
+def test_checkpoint(tmp_path: str) -> None:
+    """
+    Test that finished packages survive a restart, until cleared
+    """
+    path = os.path.join(tmp_path, "sync.checkpoint")
+
+    checkpoint = Checkpoint(path)
+    checkpoint.mark("pypi/requests")
+    checkpoint.mark("pypi/idna")
+
+    assert Checkpoint(path).done == {"pypi/requests", "pypi/idna"}
+
+    checkpoint.clear()
+    assert Checkpoint(path).done == set()
+
+
+def test_select_packages(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that a pattern matches whole normalized names, and serials are kept
+    """
+    monkeypatch.setattr(
+        app.packages.sync,
+        "list_upstream_projects",
+        lambda simple_url, timeout: {"django": 1, "django-filter": 2, "my-django": 3, "requests": 4},
+    )
+
+    repository_config = RepositoryConfig(
+        slug="pypi", simple_url="https://pypi.org/simple", sync_packages=["Requests"], sync_pattern="django.*"
+    )  # ty:ignore[invalid-argument-type]
+    assert app.packages.sync.select_packages(repository_config) == {"requests": 4, "django": 1, "django-filter": 2}
+
+    repository_config = RepositoryConfig(slug="pypi", simple_url="https://pypi.org/simple", sync_packages=["Requests"])  # ty:ignore[invalid-argument-type]
+    assert app.packages.sync.select_packages(repository_config) == {"requests": None}
+
+
+def test_sync(monkeypatch: pytest.MonkeyPatch, tmp_path: str) -> None:
+    """
+    Test that checkpointed packages are skipped, and packages with a failure are left out of the checkpoint
+    """
+    monkeypatch.setattr(app.packages.sync, "select_packages", lambda repository_config: {name: None for name in "abcd"})
+    downloaded, failing = uuid.uuid4(), uuid.uuid4()
+
+    def refresh(
+        flask_app: Flask, repository_slug: str, package_name: str, serial: int | None
+    ) -> tuple[bool, list[tuple[type[CodeFile], uuid.UUID]]]:
+        if package_name == "b":
+            raise PackageNotFound(package_name, repository_slug)
+        if package_name == "c":
+            return False, [(CodeFile, downloaded), (CodeFile, failing)]
+        return True, []
+
+    def warm_file(flask_app: Flask, model: type[CodeFile], package_file_id: uuid.UUID) -> tuple[str, str, int]:
+        if package_file_id == failing:
+            raise OSError("connection reset")
+        return "c-1.0.tar.gz", "downloaded", 100
+
+    monkeypatch.setattr(app.packages.sync, "_refresh", refresh)
+    monkeypatch.setattr(app.packages.warmup, "warm_file", warm_file)
+
+    checkpoint = Checkpoint(os.path.join(tmp_path, "sync.checkpoint"))
+    checkpoint.mark("pypi/a")
+    progress = []
+
+    repository_config = RepositoryConfig(slug="pypi", simple_url="https://pypi.org/simple")  # ty:ignore[invalid-argument-type]
+    report = app.packages.sync.sync(None, [repository_config], checkpoint, concurrency=2, progress=progress.append)  # type: ignore[arg-type]
+
+    assert report.packages == 4
+    assert report.resumed == 1
+    assert report.unchanged == 1
+    assert report.downloaded == 1
+    assert report.downloaded_bytes == 100
+    assert sorted(report.failed) == ["pypi/b", "pypi/c"]
+    assert progress == ["pypi/d"]
+    assert Checkpoint(checkpoint.path).done == {"pypi/a", "pypi/d"}
+
+
+@pytest.mark.usefixtures("app_request_context")
+@pytest.mark.parametrize("serial, unchanged", ((5, True), (6, False), (None, False)))
+def test_refresh_serial(monkeypatch: pytest.MonkeyPatch, serial: int | None, unchanged: bool) -> None:
+    """
+    Test that a package whose serial matches the listing isn't fetched again
+    """
+    refreshed = []
+
+    def update_package_data(repository: Repository, package: Package) -> Package:
+        refreshed.append(package.name)
+        return package
+
+    monkeypatch.setattr(app.packages.data, "update_package_data", update_package_data)
+
+    repository = app.data.sql.get_repository_with_exception("pypi")
+    code_file = CodeFile(filename="test-1.0.tar.gz", upstream_url="https://example.com/test-1.0.tar.gz", sort_order=0)
+    db.session.add(Package(repository=repository, name="test", serial=5, code_files=[code_file]))
+    db.session.commit()
+
+    result = app.packages.sync._refresh(flask.current_app, "pypi", "test", serial)
+
+    assert result == (unchanged, [(CodeFile, code_file.id)])
+    assert refreshed == ([] if unchanged else ["test"])
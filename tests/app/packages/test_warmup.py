@@ -0,0 +1,133 @@
+import uuid
+
+import packaging.specifiers
+import pytest
+from flask import Flask
+
+import app.packages.warmup
+from app.models.code_file import CodeFile
+from app.packages.warmup import Pin
+
+UV_LOCK = """
+version = 1
+
+[[package]]
+name = "my-project"
+version = "0.1.0"
+source = { virtual = "." }
+
+[[package]]
+name = "Requests"
+version = "2.32.3"
+source = { registry = "https://pypi.org/simple" }
+sdist = { url = "https://files.example.com/requests-2.32.3.tar.gz", hash = "sha256:abc" }
+wheels = [
+    { url = "https://files.example.com/requests-2.32.3-py3-none-any.whl", hash = "sha256:def" },
+]
+"""
+
+PYLOCK = """
+lock-version = "1.0"
+
+[[packages]]
+name = "idna"
+version = "3.10"
+wheels = [
+    { name = "idna-3.10-py3-none-any.whl", url = "https://files.example.com/a/b", hashes = { sha256 = "abc" } },
+]
+"""
+
+REQUIREMENTS = """
+# comment
+--index-url https://example.com/simple
+-e ./local
+urllib3==2.2.3 \\
+    --hash=sha256:abc
+Charset_Normalizer>=3 ; python_version >= "3.8"  # trailing comment
+pkg @ https://example.com/pkg.whl
+"""
+
+
+def test_parse_uv_lock() -> None:
+    """
+    Test that uv.lock packages without artifacts are skipped
+    """
+    assert app.packages.warmup.parse_uv_lock(UV_LOCK) == [
+        Pin(name="requests", filenames={"requests-2.32.3.tar.gz", "requests-2.32.3-py3-none-any.whl"})
+    ]
+
+
+def test_parse_pylock() -> None:
+    """
+    Test that pylock.toml artifact names are preferred to URLs
+    """
+    assert app.packages.warmup.parse_pylock(PYLOCK) == [Pin(name="idna", filenames={"idna-3.10-py3-none-any.whl"})]
+
+
+def test_parse_requirements() -> None:
+    """
+    Test that options, editables, and URL requirements are skipped
+    """
+    assert app.packages.warmup.parse_requirements(REQUIREMENTS) == [
+        Pin(name="urllib3", specifier=packaging.specifiers.SpecifierSet("==2.2.3")),
+        Pin(name="charset-normalizer", specifier=packaging.specifiers.SpecifierSet(">=3")),
+    ]
+
+
+def test_select_code_files() -> None:
+    """
+    Test that a specifier selects every file of the newest matching version
+    """
+    code_files = [
+        CodeFile(filename="a-1.0.tar.gz", version="1.0"),
+        CodeFile(filename="a-1.0-py3-none-any.whl", version="1.0"),
+        CodeFile(filename="a-2.0.tar.gz", version="2.0"),
+        CodeFile(filename="a-bad.tar.gz", version="bad"),
+    ]
+
+    pin = Pin(name="a", specifier=packaging.specifiers.SpecifierSet("<2"))
+    assert [code_file.filename for code_file in app.packages.warmup.select_code_files(code_files, pin)] == [
+        "a-1.0.tar.gz",
+        "a-1.0-py3-none-any.whl",
+    ]
+
+    pin = Pin(name="a", filenames={"a-2.0.tar.gz"})
+    assert [code_file.filename for code_file in app.packages.warmup.select_code_files(code_files, pin)] == [
+        "a-2.0.tar.gz"
+    ]
+
+    pin = Pin(name="a", specifier=packaging.specifiers.SpecifierSet(">3"))
+    assert app.packages.warmup.select_code_files(code_files, pin) == []
+
+
+def test_warm_failed(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that a file that fails to download is reported by name
+    """
+    good, bad = uuid.uuid4(), uuid.uuid4()
+    monkeypatch.setattr(
+        app.packages.warmup,
+        "_resolve",
+        lambda flask_app, slug, pin: {(CodeFile, good): "a-1.0.tar.gz", (CodeFile, bad): "a-1.0-py3-none-any.whl"},
+    )
+
+    def warm_file(flask_app: Flask, model: type[CodeFile], package_file_id: uuid.UUID) -> tuple[str, str, int]:
+        if package_file_id == bad:
+            raise OSError("connection reset")
+        return "a-1.0.tar.gz", "downloaded", 100
+
+    monkeypatch.setattr(app.packages.warmup, "warm_file", warm_file)
+    progress = []
+    report = app.packages.warmup.warm(
+        None,  # type: ignore[arg-type]
+        ["pypi"],
+        [Pin(name="a")],
+        concurrency=2,
+        per_second=0,
+        progress=lambda done, total, filename: progress.append(filename),
+    )
+
+    assert report.downloaded == 1
+    assert report.downloaded_bytes == 100
+    assert report.failed == ["a-1.0-py3-none-any.whl: connection reset"]
+    assert sorted(progress) == ["a-1.0-py3-none-any.whl", "a-1.0.tar.gz"]
@@ -0,0 +1,23 @@
+import pytest
+from flask import Flask
+
+from app.routes.file import _is_download
+
+
+@pytest.mark.parametrize(
+    "range_header, is_download",
+    (
+        (None, True),
+        ("bytes=0-", True),
+        ("bytes=0-1023", True),
+        ("bytes=1024-", False),
+        ("bytes=-1024", False),
+    ),
+)
+def test_is_download(app: Flask, range_header: str | None, is_download: bool) -> None:
+    """
+    Test that only requests for a file from its start count as downloads
+    """
+    headers = {} if range_header is None else {"Range": range_header}
+    with app.test_request_context(headers=headers):
+        assert _is_download() == is_download
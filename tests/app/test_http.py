@@ -0,0 +1,86 @@
+import collections
+import threading
+import time
+
+import pytest
+import requests
+
+import app.http
+from app.http import UpstreamHealth
+
+
+class FakeResponse:
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def health(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(app.http, "_health", collections.defaultdict(UpstreamHealth))
+    monkeypatch.setattr(app.http, "HEDGE_DEFAULT_DELAY_SECONDS", 0.05)
+
+
+def test_order_by_health() -> None:
+    """
+    Test that failing upstreams go last, and unknown upstreams don't jump ahead of known ones
+    """
+    app.http._record_success("https://slow", 2.0)
+    app.http._record_success("https://fast", 0.1)
+    app.http._record_failure("https://failing")
+
+    urls = ["https://failing/a", "https://slow/a", "https://unknown/a", "https://fast/a"]
+    assert app.http.order_by_health(urls) == [
+        "https://fast/a",
+        "https://unknown/a",
+        "https://slow/a",
+        "https://failing/a",
+    ]
+
+    # with only one known upstream, the configured order wins
+    assert app.http.order_by_health(["https://fast/a", "https://new/a"]) == ["https://fast/a", "https://new/a"]
+
+
+def test_hedged_fires() -> None:
+    """
+    Test that a slow upstream is hedged, and its late response is closed
+    """
+    release = threading.Event()
+    slow = FakeResponse("https://slow/a")
+
+    def request(url: str) -> FakeResponse:
+        if url == slow.url:
+            release.wait(5)
+            return slow
+        return FakeResponse(url)
+
+    response = app.http.hedged(["https://slow/a", "https://fast/a"], request)  # type: ignore[arg-type]
+    assert response.url == "https://fast/a"
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while not slow.closed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert slow.closed
+
+
+def test_hedged_errors() -> None:
+    """
+    Test that errors move on to the next upstream, and a timeout is preferred when all fail
+    """
+
+    def request(url: str) -> FakeResponse:
+        if url == "https://ok/a":
+            return FakeResponse(url)
+        if url == "https://timeout/a":
+            raise requests.exceptions.Timeout()
+        raise requests.exceptions.ConnectionError()
+
+    assert app.http.hedged(["https://broken/a", "https://ok/a"], request).url == "https://ok/a"  # type: ignore[arg-type,union-attr]
+    assert app.http._health["https://broken"].is_failing
+
+    with pytest.raises(requests.exceptions.Timeout):
+        app.http.hedged(["https://broken/a", "https://timeout/a"], request)  # type: ignore[arg-type]